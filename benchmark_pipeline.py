@@ -0,0 +1,553 @@
+"""
+影片縮圖產生器 - 效能測試
+以 cv2.VideoWriter 產生合成影片與目錄樹，以本機 SFTP 伺服器代替 NAS，
+量測各階段耗時（探測、跳轉、解碼、縮放、編碼、上傳）與每秒處理檔數，結果輸出為 JSON
+"""
+
+import os
+import sys
+import json
+import logging
+import time
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import cv2
+import numpy as np
+
+from thumbnail_engine import (ThumbnailEngine, FolderScanner, ProbeCache, SFTPPool, SFTPUploader,
+                              HAS_PARAMIKO, HAS_AV, FFMPEG_PATH, DEFAULT_WORKERS, DEFAULT_SFTP_SESSIONS,
+                              DEFAULT_CONFIG, open_ssh_session)
+
+if HAS_PARAMIKO:
+    import paramiko
+if HAS_AV:
+    import av
+
+# 合成影片規格：(名稱, fourcc, 副檔名, 寬, 高, GOP, 秒數)
+VIDEO_PROFILES = {
+    'quick': [
+        ('mp4v_360p_gop12', 'mp4v', '.mp4', 640, 360, 12, 10),
+        ('mjpg_720p_intra', 'MJPG', '.avi', 1280, 720, 1, 5),
+        ('xvid_1080p_gop250', 'XVID', '.avi', 1920, 1080, 250, 20),
+    ],
+    'full': [
+        ('mp4v_360p_gop12', 'mp4v', '.mp4', 640, 360, 12, 10),
+        ('mjpg_720p_intra', 'MJPG', '.avi', 1280, 720, 1, 5),
+        ('mp4v_720p_gop50', 'mp4v', '.mp4', 1280, 720, 50, 30),
+        ('xvid_1080p_gop250', 'XVID', '.avi', 1920, 1080, 250, 20),
+        ('mp4v_1080p_gop250_long', 'mp4v', '.mp4', 1920, 1080, 250, 120),
+        ('mp4v_2160p_gop250', 'mp4v', '.mp4', 3840, 2160, 250, 30),
+    ],
+}
+
+# ffmpeg 重新編碼時使用的編碼器（確保 GOP；部分 OpenCV 版本會忽略 VIDEOWRITER_PROP_KEY_INTERVAL）
+FFMPEG_ENCODERS = {
+    'mp4v': ['-c:v', 'mpeg4', '-q:v', '5'],
+    'XVID': ['-c:v', 'mpeg4', '-vtag', 'xvid', '-q:v', '5'],
+}
+
+FPS = 25
+STAGES = ('probe', 'seek', 'decode', 'fast_seek', 'fast_seek_reduced', 'resize_fast', 'resize', 'resize_best',
+          'encode', 'upload')
+
+# 本機 SFTP 伺服器的登入資訊
+SERVER_USER = 'bench'
+SERVER_PASSWORD = 'bench'
+
+# 伺服器端連線記錄（用戶端斷線時的 Connection reset 等）不輸出
+SERVER_LOG_CHANNEL = 'thumbnail_bench.server'
+logging.getLogger(SERVER_LOG_CHANNEL).addHandler(logging.NullHandler())
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+# ---- 合成影片 ----
+
+def synthetic_frame(width, height, index):
+    """漸層背景 + 移動方塊 + 幀號，讓每幀內容不同"""
+    x = np.linspace(0, 255, width, dtype=np.uint8)
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[:] = x[None, :, None]
+    frame[..., 1] = (index * 3) % 256
+    size = max(16, height // 8)
+    left = (index * 7) % max(1, width - size)
+    top = (index * 3) % max(1, height - size)
+    cv2.rectangle(frame, (left, top), (left + size, top + size), (255, 255, 255), -1)
+    cv2.putText(frame, str(index), (size // 2, height - size // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                height / 360, (0, 0, 0), max(1, height // 180))
+    return frame
+
+
+def write_video(path, fourcc, width, height, gop, seconds):
+    """以 cv2.VideoWriter 產生影片；有 ffmpeg 時重新編碼以確保 GOP"""
+    raw_path = path + '.raw' + os.path.splitext(path)[1]
+    writer = cv2.VideoWriter(raw_path, cv2.CAP_FFMPEG, cv2.VideoWriter_fourcc(*fourcc), FPS, (width, height),
+                             [cv2.VIDEOWRITER_PROP_KEY_INTERVAL, gop])
+    if not writer.isOpened():
+        raise Exception(f"無法建立影片（{fourcc}）")
+    for index in range(int(seconds * FPS)):
+        writer.write(synthetic_frame(width, height, index))
+    writer.release()
+    
+    if FFMPEG_PATH and fourcc in FFMPEG_ENCODERS:
+        cmd = [FFMPEG_PATH, '-hide_banner', '-nostdin', '-loglevel', 'error', '-y', '-i', raw_path,
+               *FFMPEG_ENCODERS[fourcc], '-g', str(gop), '-keyint_min', str(gop), '-sc_threshold', '0', path]
+        if subprocess.run(cmd).returncode == 0:
+            os.remove(raw_path)
+            return True
+    os.replace(raw_path, path)
+    return False
+
+
+def generate_videos(template_dir, profiles):
+    """產生各規格的範本影片，回傳影片資訊清單"""
+    os.makedirs(template_dir, exist_ok=True)
+    videos = []
+    for name, fourcc, ext, width, height, gop, seconds in profiles:
+        path = os.path.join(template_dir, name + ext)
+        start = time.perf_counter()
+        gop_enforced = write_video(path, fourcc, width, height, gop, seconds)
+        videos.append({
+            'name': name, 'path': path, 'codec': fourcc, 'width': width, 'height': height,
+            'gop': gop, 'gop_enforced': gop_enforced or gop == 1, 'duration': seconds,
+            'bytes': os.path.getsize(path), 'generate_seconds': round(time.perf_counter() - start, 3),
+        })
+        log(f"  {name}: {videos[-1]['bytes'] / 1e6:.1f} MB")
+    return videos
+
+
+def build_tree(root, videos, file_count, per_dir=20):
+    """以範本影片建立多層目錄樹（優先使用硬連結），回傳影片路徑清單"""
+    paths = []
+    for index in range(file_count):
+        video = videos[index % len(videos)]
+        folder = os.path.join(root, f"dir_{index // (per_dir * 5):03d}", f"sub_{index // per_dir % 5}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"clip_{index:05d}{os.path.splitext(video['path'])[1]}")
+        try:
+            os.link(video['path'], path)
+        except OSError:
+            shutil.copyfile(video['path'], path)
+        paths.append(path)
+    return paths
+
+
+def clean_outputs(root):
+    """清除上一輪產生的縮圖（@eaDir 與同目錄 .jpg）"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        if '@eaDir' in dirnames:
+            shutil.rmtree(os.path.join(dirpath, '@eaDir'))
+            dirnames.remove('@eaDir')
+        for filename in filenames:
+            if filename.endswith('.jpg'):
+                os.remove(os.path.join(dirpath, filename))
+
+
+# ---- 本機 SFTP 伺服器（代替 NAS）----
+
+if HAS_PARAMIKO:
+    class _SFTPHandle(paramiko.SFTPHandle):
+        def stat(self):
+            try:
+                return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+        
+        def chattr(self, attr):
+            return paramiko.SFTP_OK
+    
+
+    class _SFTPInterface(paramiko.SFTPServerInterface):
+        """將 SFTP 路徑對應到本機目錄（如同 Synology SFTP chroot 到 /volumeN）"""
+        
+        def __init__(self, server, root, *args, **kwargs):
+            super().__init__(server, *args, **kwargs)
+            self.root = root
+        
+        def _local(self, path):
+            return os.path.join(self.root, os.path.normpath('/' + path).lstrip('/\\'))
+        
+        def _call(self, fn, *args):
+            try:
+                fn(*args)
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+            return paramiko.SFTP_OK
+        
+        def list_folder(self, path):
+            local = self._local(path)
+            try:
+                entries = []
+                for name in os.listdir(local):
+                    attr = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(local, name)))
+                    attr.filename = name
+                    entries.append(attr)
+                return entries
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+        
+        def stat(self, path):
+            try:
+                return paramiko.SFTPAttributes.from_stat(os.stat(self._local(path)))
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+        
+        lstat = stat
+        
+        def open(self, path, flags, attr):
+            local = self._local(path)
+            try:
+                fd = os.open(local, flags | getattr(os, 'O_BINARY', 0), 0o666)
+                if flags & os.O_WRONLY:
+                    mode = 'ab' if flags & os.O_APPEND else 'wb'
+                elif flags & os.O_RDWR:
+                    mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+                else:
+                    mode = 'rb'
+                f = os.fdopen(fd, mode)
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+            handle = _SFTPHandle(flags)
+            handle.filename = local
+            handle.readfile = f
+            handle.writefile = f
+            return handle
+        
+        def remove(self, path):
+            return self._call(os.remove, self._local(path))
+        
+        def rename(self, oldpath, newpath):
+            return self._call(os.rename, self._local(oldpath), self._local(newpath))
+        
+        def posix_rename(self, oldpath, newpath):
+            return self._call(os.replace, self._local(oldpath), self._local(newpath))
+        
+        def mkdir(self, path, attr):
+            return self._call(os.mkdir, self._local(path))
+        
+        def rmdir(self, path):
+            return self._call(os.rmdir, self._local(path))
+        
+        def chattr(self, path, attr):
+            return paramiko.SFTP_OK
+        
+        def canonicalize(self, path):
+            return os.path.normpath('/' + path).replace('\\', '/')
+    
+
+    class _SSHInterface(paramiko.ServerInterface):
+        def __init__(self, stand_in):
+            self.stand_in = stand_in
+        
+        def check_auth_password(self, username, password):
+            if (username, password) == (SERVER_USER, SERVER_PASSWORD):
+                return paramiko.AUTH_SUCCESSFUL
+            return paramiko.AUTH_FAILED
+        
+        def get_allowed_auths(self, username):
+            return 'password'
+        
+        def check_channel_request(self, kind, chanid):
+            if kind == 'session':
+                return paramiko.OPEN_SUCCEEDED
+            return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+        
+        def check_channel_exec_request(self, channel, command):
+            if not self.stand_in.allow_exec:
+                return False
+            threading.Thread(target=self.stand_in.run_command, args=(channel, command), daemon=True).start()
+            return True
+
+
+class LocalSFTPServer:
+    """本機 SSH/SFTP 伺服器，SFTP 根目錄對應 root（如同 /volume1）；allow_exec 時以本機 shell 執行遠端指令"""
+    
+    def __init__(self, root, allow_exec=False, volume_root='/volume1'):
+        self.root = os.path.abspath(root)
+        self.allow_exec = allow_exec
+        self.volume_root = volume_root
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(32)
+        self.port = self.sock.getsockname()[1]
+        self.transports = []
+        self.closed = False
+        self.thread = threading.Thread(target=self._accept, daemon=True)
+        self.thread.start()
+    
+    def _accept(self):
+        while not self.closed:
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                break
+            transport = paramiko.Transport(client)
+            transport.set_log_channel(SERVER_LOG_CHANNEL)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, _SFTPInterface, self.root)
+            transport.start_server(server=_SSHInterface(self))
+            self.transports.append(transport)
+    
+    def run_command(self, channel, command):
+        """以本機 shell 執行遠端指令，/volumeN 路徑對應到伺服器根目錄"""
+        try:
+            command = command.decode('utf-8').replace(self.volume_root + '/', self.root + '/')
+            result = subprocess.run(command, shell=True, capture_output=True, stdin=subprocess.DEVNULL)
+            channel.sendall(result.stdout.replace(self.root.encode() + b'/', self.volume_root.encode() + b'/'))
+            channel.sendall_stderr(result.stderr)
+            channel.send_exit_status(result.returncode)
+        finally:
+            channel.close()
+    
+    def config(self):
+        """連線到此伺服器的處理設定"""
+        return {'ssh_host': '127.0.0.1', 'ssh_port': str(self.port),
+                'ssh_user': SERVER_USER, 'ssh_password': SERVER_PASSWORD}
+    
+    def close(self):
+        self.closed = True
+        self.sock.close()
+        for transport in self.transports:
+            transport.close()
+
+
+class BenchmarkEngine(ThumbnailEngine):
+    """將測試目錄樹對應到本機 SFTP 伺服器上的共享資料夾（取代磁碟機代號對應）"""
+    
+    def __init__(self, base_dir, tree_root, share, **kwargs):
+        super().__init__(base_dir, **kwargs)
+        self.tree_root = os.path.abspath(tree_root)
+        self.share = share
+    
+    def _local_to_nas_path(self, local_path):
+        relative = os.path.relpath(os.path.abspath(local_path), self.tree_root)
+        if relative == '.':
+            return f"/{self.share}"
+        return f"/{self.share}/{relative}".replace('\\', '/')
+
+
+# ---- 統計 ----
+
+def summarize(samples):
+    """耗時統計（毫秒）"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+    
+    return {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50_ms': round(percentile(50) * 1000, 3),
+        'p95_ms': round(percentile(95) * 1000, 3),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def timed(samples, stage, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    samples[stage].append(time.perf_counter() - start)
+    return result
+
+
+# ---- 量測 ----
+
+def measure_scan(tree_root, state_dir):
+    """冷掃描（無快取）與熱掃描（目錄未變更）"""
+    cache_file = os.path.join(state_dir, 'bench_scan_cache.json')
+    if os.path.exists(cache_file):
+        os.remove(cache_file)
+    result = {}
+    for name in ('cold', 'warm'):
+        scanner = FolderScanner(cache_file)
+        start = time.perf_counter()
+        found = scanner.scan(tree_root)
+        result[f'{name}_seconds'] = round(time.perf_counter() - start, 4)
+        scanner.save()
+    result['videos'] = len(found)
+    return result
+
+
+def fast_seek(engine, path, info, target_time, decode_width=None):
+    """快速跳轉（有 ffmpeg 時取關鍵幀，否則 OpenCV 以時間跳轉）"""
+    frame, actual_time, cap = engine._read_frame(None, path, info, target_time, 'ffmpeg' if FFMPEG_PATH else 'opencv', True,
+                                                 decode_width)
+    if cap is not None:
+        cap.release()
+    return frame, actual_time
+
+
+def measure_stages(engine, videos, repeat, uploader=None):
+    """逐一量測每個範本影片的各階段耗時（單執行緒，不含排程與等待）"""
+    results = {}
+    original_cache = engine.probe_cache
+    for video in videos:
+        samples = {stage: [] for stage in STAGES}
+        path = video['path']
+        for index in range(repeat):
+            engine.probe_cache = ProbeCache(':memory:')  # 每次都重新探測
+            cap, info = timed(samples, 'probe', engine._probe_video, path)
+            engine.probe_cache.close()
+            target_time = info['duration'] / 2
+            timed(samples, 'seek', cap.set, cv2.CAP_PROP_POS_FRAMES, int(target_time * info['fps']))
+            ret, frame = timed(samples, 'decode', cap.read)
+            cap.release()
+            if not ret:
+                raise Exception(f"無法讀取幀: {video['name']}")
+            timed(samples, 'fast_seek', fast_seek, engine, path, info, target_time)
+            timed(samples, 'fast_seek_reduced', fast_seek, engine, path, info, target_time, engine._decode_width('balanced'))
+            timed(samples, 'resize_fast', engine._resize_frame, frame, 'fast')
+            resized = timed(samples, 'resize', engine._resize_frame, frame)
+            timed(samples, 'resize_best', engine._resize_frame, frame, 'best')
+            data = timed(samples, 'encode', engine._encode_image, resized)
+            if uploader is not None:
+                remote_dir = f"/{engine.share}/@bench/{video['name']}"
+                timed(samples, 'upload', lambda: uploader.submit(remote_dir, f"{remote_dir}/{index}.jpg", data).result())
+        results[video['name']] = {stage: summarize(values) for stage, values in samples.items() if values}
+        results[video['name']]['thumbnail_bytes'] = len(data)
+    engine.probe_cache = original_cache
+    return results
+
+
+def measure_run(make_engine, tree_root, video_files, config):
+    """端對端處理（冷：無縮圖；熱：全部已存在，測跳過路徑）"""
+    clean_outputs(tree_root)
+    engine = make_engine()
+    try:
+        result = {'mode': config['output_mode'], 'workers': int(config['worker_count']),
+                  'fast_seek': config['fast_seek'], 'remote_exec': config['remote_exec'],
+                  'files': len(video_files)}
+        for name in ('cold', 'warm'):
+            start = time.perf_counter()
+            counts = engine.process(video_files, [tree_root], config)
+            seconds = time.perf_counter() - start
+            result[name] = {**counts, 'seconds': round(seconds, 3),
+                            'files_per_second': round(len(video_files) / seconds, 2) if seconds else None,
+                            'stages': engine.stats.summary()['stages']}
+        return result
+    finally:
+        engine.close()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="縮圖處理流程效能測試（輸出 JSON）")
+    parser.add_argument('--profile', choices=sorted(VIDEO_PROFILES), default='quick', help="合成影片規格組合")
+    parser.add_argument('--files', type=int, default=60, help="目錄樹中的影片數量")
+    parser.add_argument('--repeat', type=int, default=3, help="各階段量測的重複次數")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="平行處理執行緒數")
+    parser.add_argument('--sftp-sessions', type=int, default=DEFAULT_SFTP_SESSIONS, help="SFTP 上傳連線數")
+    parser.add_argument('--modes', default='same_folder,synology_ssh', help="要量測的輸出模式（逗號分隔）")
+    parser.add_argument('--exec', dest='allow_exec', action='store_true',
+                        help="本機 SFTP 伺服器允許遠端指令（find/stat/NAS 端產生，僅限 POSIX）")
+    parser.add_argument('--work-dir', help="工作目錄（預設為暫存目錄，結束後刪除）")
+    parser.add_argument('--output', help="JSON 輸出檔（預設輸出到 stdout）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    modes = [mode for mode in args.modes.split(',') if mode]
+    if 'synology_ssh' in modes and not HAS_PARAMIKO:
+        log("未安裝 paramiko，略過 synology_ssh 模式")
+        modes.remove('synology_ssh')
+    
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='thumbnail_bench_')
+    volume_dir = os.path.join(work_dir, 'volume1')
+    tree_root = os.path.join(volume_dir, 'share')
+    state_dir = os.path.join(work_dir, 'state')
+    os.makedirs(state_dir, exist_ok=True)
+    
+    server = None
+    uploader = None
+    try:
+        log(f"產生合成影片（{args.profile}）…")
+        videos = generate_videos(os.path.join(work_dir, 'templates'), VIDEO_PROFILES[args.profile])
+        if os.path.isdir(tree_root):
+            shutil.rmtree(tree_root)
+        video_files = build_tree(tree_root, videos, args.files)
+        
+        report = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'paramiko': paramiko.__version__ if HAS_PARAMIKO else None,
+            'ffmpeg': bool(FFMPEG_PATH),
+            'pyav': av.__version__ if HAS_AV else None,
+            'settings': {'profile': args.profile, 'files': args.files, 'repeat': args.repeat,
+                         'workers': args.workers, 'sftp_sessions': args.sftp_sessions,
+                         'exec': args.allow_exec},
+            'videos': [{key: value for key, value in video.items() if key != 'path'} for video in videos],
+        }
+        
+        log("量測掃描…")
+        report['scan'] = measure_scan(tree_root, state_dir)
+        
+        def make_engine():
+            # 每次量測使用新的處理記錄與快取
+            return BenchmarkEngine(tempfile.mkdtemp(dir=state_dir), tree_root, 'share')
+        
+        config = dict(DEFAULT_CONFIG)
+        config.update({'worker_count': str(args.workers), 'sftp_sessions': str(args.sftp_sessions)})
+        
+        engine = make_engine()
+        if 'synology_ssh' in modes:
+            server = LocalSFTPServer(volume_dir, allow_exec=args.allow_exec)
+            config.update(server.config())
+            engine.config = dict(config)
+            engine.ssh_params = {'hostname': '127.0.0.1', 'port': server.port,
+                                 'username': SERVER_USER, 'password': SERVER_PASSWORD}
+            pool = SFTPPool(lambda: open_ssh_session(engine.ssh_params), 1)
+            uploader = SFTPUploader(pool, engine._sftp_makedirs, engine._volume_root() if args.allow_exec else None)
+        
+        log("量測各階段耗時…")
+        try:
+            report['stages'] = measure_stages(engine, videos, args.repeat, uploader)
+            log("量測解碼後端…")
+            report['decoders'] = engine.benchmark_decoders([video['path'] for video in videos], config, save=False)
+        finally:
+            if uploader is not None:
+                uploader.close()
+            engine.close()
+        
+        report['runs'] = []
+        for mode in modes:
+            for fast_seek in (True, False):
+                log(f"端對端處理：{mode}（快速跳轉{'開' if fast_seek else '關'}）…")
+                run_config = dict(config, output_mode=mode, fast_seek=fast_seek)
+                report['runs'].append(measure_run(make_engine, tree_root, video_files, run_config))
+            if mode == 'synology_ssh' and args.allow_exec:
+                log("端對端處理：synology_ssh（NAS 端產生）…")
+                run_config = dict(config, output_mode=mode, remote_exec=True)
+                report['runs'].append(measure_run(make_engine, tree_root, video_files, run_config))
+    finally:
+        if server is not None:
+            server.close()
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        log(f"結果已寫入 {args.output}")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+"""命令列版本的 JSON Lines 輸出：多執行緒同時回報事件時，stdout 的每一行都必須是一個完整的 JSON 事件"""
+
+import os
+import sys
+import json
+import subprocess
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_videos(folder, count, frames=30):
+    """產生數部小型測試影片"""
+    os.makedirs(folder, exist_ok=True)
+    for i in range(count):
+        writer = cv2.VideoWriter(os.path.join(folder, f'v{i:02d}.avi'), cv2.VideoWriter_fourcc(*'MJPG'), 10, (160, 120))
+        for f in range(frames):
+            writer.write(np.full((120, 160, 3), (i * 20 + f * 5) % 255, np.uint8))
+        writer.release()
+
+
+def test_multi_worker_output_is_json_lines(tmp_path):
+    videos = tmp_path / 'videos'
+    make_videos(str(videos), 24)
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'thumbnail_cli.py'), str(videos),
+         '--mode', 'same_folder', '--workers', '4', '--transform-workers', '4', '--no-process-decode',
+         '--state-dir', str(tmp_path / 'state'), '--settings', str(tmp_path / 'settings.json')],
+        capture_output=True, text=True, encoding='utf-8', timeout=300)
+
+    lines = result.stdout.splitlines()
+    assert lines
+    events = [json.loads(line) for line in lines]  # 任何一行混雜或空白都會在這裡失敗
+    assert all('event' in event for event in events)
+    assert result.returncode == 0, result.stderr
+    assert len([name for name in os.listdir(videos) if name.endswith('.jpg')]) == 24
@@ -0,0 +1,354 @@
+"""
+影片縮圖產生器 - 命令列版本
+不需要視窗即可批次產生或清除縮圖（排程、NAS 上執行、效能分析），與 GUI 共用 thumbnail_engine
+進度以 JSON Lines 輸出到 stdout，每行一個事件
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+import multiprocessing
+
+from thumbnail_engine import (
+    ThumbnailEngine, JobCheckpoint, SSHConnectionError, HAS_PARAMIKO, OUTPUT_MODES, RESIZE_QUALITIES, DEFAULT_CONFIG,
+    DECODER_BACKENDS, ANIMATION_FORMATS, MAX_PREVIEW_SECONDS, MAX_PREVIEW_FPS, normalize_renditions, rendition_specs,
+)
+
+# 結束代碼
+EXIT_OK = 0            # 全部成功（含跳過）
+EXIT_FAILED = 1        # 有影片處理失敗
+EXIT_USAGE = 2         # 參數或設定錯誤
+EXIT_SSH = 3           # SSH 連線失敗
+EXIT_INTERRUPTED = 130 # 使用者中斷（Ctrl+C）
+
+# SSH 密碼來源：環境變數，其次為 keyring（選用）
+PASSWORD_ENV = 'VTG_SSH_PASSWORD'
+KEYRING_SERVICE = 'video-thumbnail-generator'
+
+try:
+    import keyring
+    HAS_KEYRING = True
+except ImportError:
+    HAS_KEYRING = False
+
+
+# 管線的多個執行緒同時回報事件，整行（含換行）一次寫出，避免兩個事件混在同一行
+_emit_lock = threading.Lock()
+
+
+def emit(event, **fields):
+    """輸出一行 JSON 事件"""
+    line = json.dumps({'event': event, **fields}, ensure_ascii=False) + '\n'
+    with _emit_lock:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
+def default_base_dir():
+    """與 GUI 相同的資料目錄（處理記錄、快取、settings.json）"""
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def load_settings(path):
+    """讀取 GUI 的 settings.json，不存在時回傳空設定"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def resolve_password(user):
+    password = os.environ.get(PASSWORD_ENV)
+    if password:
+        return password
+    if HAS_KEYRING and user:
+        try:
+            return keyring.get_password(KEYRING_SERVICE, user) or ''
+        except Exception:
+            pass
+    return ''
+
+
+def load_job(base_dir):
+    """讀取上一次處理的檢查點，沒有記錄時回傳 None"""
+    checkpoint = JobCheckpoint(os.path.join(base_dir, 'history.db'))
+    try:
+        return checkpoint.load()
+    finally:
+        checkpoint.close()
+
+
+def parse_rendition(text):
+    """解析 --rendition「名稱[:寬度[:格式[:品質]]]」，省略的欄位沿用同名預設規格或預設值"""
+    spec = {}
+    for key, value in zip(('name', 'width', 'format', 'quality'), text.split(':')):
+        if value:
+            spec[key] = value
+    return spec
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="影片縮圖產生器（命令列）",
+        epilog=f"SSH 密碼請以環境變數 {PASSWORD_ENV} 或 keyring（服務名稱 {KEYRING_SERVICE}）提供。"
+               f"未指定的選項沿用 settings.json。"
+               f"結束代碼：{EXIT_OK}=成功 {EXIT_FAILED}=有失敗 {EXIT_USAGE}=參數錯誤 "
+               f"{EXIT_SSH}=SSH 連線失敗 {EXIT_INTERRUPTED}=中斷")
+    parser.add_argument('folders', nargs='*', help="影片資料夾（未指定時使用 settings.json 的資料夾清單）")
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument('--clear', action='store_true', help="清除縮圖而非產生")
+    action.add_argument('--resume', action='store_true',
+                        help="從上次停止或中斷處繼續（沿用上次的資料夾、影片清單與設定，不重新掃描）")
+    action.add_argument('--retry-failed', action='store_true', help="只重新處理上次失敗的影片")
+    action.add_argument('--sweep-orphans', action='store_true',
+                        help="清除影片已刪除或改名後留下的縮圖，並移除處理記錄中已不存在的影片")
+    action.add_argument('--benchmark-decoders', action='store_true',
+                        help="以各副檔名的數部影片測試各解碼後端，儲存最快且可靠的後端供自動模式使用")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="搭配 --clear 或 --sweep-orphans：只統計會清除的縮圖，不刪除")
+    parser.add_argument('--mode', choices=sorted(OUTPUT_MODES), help="輸出模式")
+    parser.add_argument('--capture-time', help="截取秒數（空字串 = 中間幀）")
+    parser.add_argument('--smart-frame', dest='smart_frame', action='store_true', default=None,
+                        help="智慧選幀：截取畫面過暗或空白時改用其他時間點")
+    parser.add_argument('--no-smart-frame', dest='smart_frame', action='store_false', help="固定使用截取時間的畫面")
+    parser.add_argument('--overwrite', action='store_true', default=None, help="覆蓋已存在的縮圖")
+    parser.add_argument('--workers', type=int, help="擷取畫面執行緒數")
+    parser.add_argument('--transform-workers', type=int, help="縮放與編碼執行緒數")
+    parser.add_argument('--output-workers', type=int, help="本機寫入執行緒數")
+    parser.add_argument('--fast-seek', dest='fast_seek', action='store_true', default=None, help="快速跳轉（最近關鍵幀）")
+    parser.add_argument('--no-fast-seek', dest='fast_seek', action='store_false', help="逐幀精確跳轉")
+    parser.add_argument('--decoder', choices=list(DECODER_BACKENDS),
+                        help="解碼後端（auto = 依副檔名與解碼測試結果選擇；各副檔名可在 settings.json 的 decoder_by_extension 指定）")
+    parser.add_argument('--decoder-threads', type=int, help="PyAV 與 ffmpeg 的解碼執行緒數（0 = 由 ffmpeg 決定）")
+    parser.add_argument('--process-decode', dest='process_decode', action='store_true', default=None,
+                        help="在獨立子程序解碼（影片卡住或讓解碼器當掉時只有該檔失敗）")
+    parser.add_argument('--no-process-decode', dest='process_decode', action='store_false', help="在執行緒內解碼")
+    parser.add_argument('--decode-timeout', help="獨立程序解碼時每部影片的逾時秒數")
+    parser.add_argument('--resize-quality', choices=list(RESIZE_QUALITIES),
+                        help="縮放品質（" + '、'.join(f"{k}={v}" for k, v in RESIZE_QUALITIES.items()) + "）")
+    parser.add_argument('--host', help="NAS IP")
+    parser.add_argument('--port', help="SSH 端口")
+    parser.add_argument('--user', help="SSH 帳號")
+    parser.add_argument('--drive', help="對應 NAS 的磁碟機代號，例如 Y")
+    parser.add_argument('--share', help="共享資料夾名稱")
+    parser.add_argument('--volume', help="儲存空間編號")
+    parser.add_argument('--sftp-sessions', type=int, help="SFTP 上傳連線數")
+    parser.add_argument('--remote-exec', dest='remote_exec', action='store_true', default=None,
+                        help="在 NAS 上以 ffmpeg 產生縮圖（影片不經網路傳輸）")
+    parser.add_argument('--no-remote-exec', dest='remote_exec', action='store_false', help="本機解碼後上傳")
+    parser.add_argument('--remote-ffmpeg', help="NAS 上的 ffmpeg 路徑")
+    parser.add_argument('--rendition', dest='renditions', action='append', type=parse_rendition,
+                        metavar='名稱[:寬度[:格式[:品質]]]',
+                        help="輸出規格（可重複，取代 settings.json 的規格；第一個為主要縮圖，thumbnail 為預設的 800px JPEG）")
+    parser.add_argument('--contact-sheet', metavar='欄x列', help="另外產生縮圖表，例如 4x4（空字串 = 不產生）")
+    parser.add_argument('--preview', choices=['', *ANIMATION_FORMATS], help="另外產生預覽動畫（需要 ffmpeg；空字串 = 不產生）")
+    parser.add_argument('--preview-seconds', help=f"預覽動畫長度（秒，最多 {MAX_PREVIEW_SECONDS}）")
+    parser.add_argument('--preview-fps', help=f"預覽動畫幀率（最多 {MAX_PREVIEW_FPS}）")
+    parser.add_argument('--preview-width', help="預覽動畫寬度（px）")
+    parser.add_argument('--stats', help="匯出階段耗時統計（.csv 為逐檔明細，其他為 JSON）")
+    parser.add_argument('--profile-output', help="以 cProfile 分析一個檔案並存到此路徑（.prof）")
+    parser.add_argument('--settings', help="設定檔路徑（預設為資料目錄下的 settings.json）")
+    parser.add_argument('--state-dir', help="處理記錄與快取的目錄（預設與 GUI 相同）")
+    parser.add_argument('--quiet', action='store_true', help="不輸出 log 事件")
+    return parser.parse_args(argv)
+
+
+def build_config(args, settings):
+    """合併 settings.json 與命令列參數（命令列優先）"""
+    config = dict(DEFAULT_CONFIG)
+    config.update({key: settings[key] for key in DEFAULT_CONFIG if key in settings})
+    
+    overrides = {
+        'output_mode': args.mode,
+        'capture_time': args.capture_time,
+        'smart_frame': args.smart_frame,
+        'overwrite': args.overwrite,
+        'worker_count': args.workers,
+        'transform_workers': args.transform_workers,
+        'output_workers': args.output_workers,
+        'fast_seek': args.fast_seek,
+        'resize_quality': args.resize_quality,
+        'decoder': args.decoder,
+        'decoder_threads': args.decoder_threads,
+        'process_decode': args.process_decode,
+        'decode_timeout': args.decode_timeout,
+        'renditions': args.renditions,
+        'contact_sheet': args.contact_sheet,
+        'preview': args.preview,
+        'preview_seconds': args.preview_seconds,
+        'preview_fps': args.preview_fps,
+        'preview_width': args.preview_width,
+        'ssh_host': args.host,
+        'ssh_port': args.port,
+        'ssh_user': args.user,
+        'drive_letter': args.drive,
+        'share_folder': args.share,
+        'volume_number': args.volume,
+        'sftp_sessions': args.sftp_sessions,
+        'remote_exec': args.remote_exec,
+        'remote_ffmpeg': args.remote_ffmpeg,
+        'profile_output': args.profile_output,
+    }
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    config['ssh_password'] = resolve_password(config['ssh_user'])
+    return config
+
+
+def validate_config(config):
+    """回傳錯誤訊息，設定正確時回傳 None"""
+    try:
+        normalize_renditions(rendition_specs(config))
+    except Exception as e:
+        return str(e)
+    if config['output_mode'] == 'synology_ssh':
+        if not HAS_PARAMIKO:
+            return "未安裝 paramiko 庫，請執行: pip install paramiko"
+        if not all([config['ssh_host'], config['ssh_user'], config['drive_letter'], config['share_folder']]):
+            return "請提供完整的 SSH 連線設定和路徑對應（--host --user --drive --share）"
+        if not config['ssh_password']:
+            return f"請以環境變數 {PASSWORD_ENV} 或 keyring 提供 SSH 密碼"
+    return None
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    base_dir = args.state_dir or default_base_dir()
+    os.makedirs(base_dir, exist_ok=True)  # 探測快取與處理記錄需要目錄已存在
+    settings = load_settings(args.settings or os.path.join(base_dir, 'settings.json'))
+    
+    # 繼續上次的處理：資料夾與影片清單取自檢查點（--resume 連設定也沿用，命令列參數仍可覆蓋）
+    job = load_job(base_dir) if args.resume or args.retry_failed else None
+    video_files = None
+    if job:
+        video_files = job['remaining'] if args.resume and job['state'] != 'finished' else []
+        if args.retry_failed:
+            video_files = job['retry']  # 上次中途停止時一併處理尚未處理的影片
+    config = build_config(args, job['config'] if args.resume and job else settings)
+    
+    folders = job['folders'] if job else args.folders or settings.get('folders', [])
+    folders = [os.path.abspath(folder) if args.folders and not job else folder for folder in folders]
+    missing = [folder for folder in folders if not os.path.isdir(folder)]
+    error = None if args.benchmark_decoders else validate_config(config)  # 解碼測試只讀取本機影片
+    if args.dry_run and not (args.clear or args.sweep_orphans):
+        error = "--dry-run 只能搭配 --clear 或 --sweep-orphans 使用"
+    elif (args.resume or args.retry_failed) and not job:
+        error = "沒有上次的處理記錄"
+    elif args.resume and not video_files:
+        error = "上次的處理已完成，沒有可繼續的影片"
+    elif args.retry_failed and not video_files:
+        error = "上次的處理沒有失敗的影片"
+    elif not folders:
+        error = "請指定影片資料夾"
+    elif missing:
+        error = f"資料夾不存在: {', '.join(missing)}"
+    if error:
+        emit('error', message=error)
+        return EXIT_USAGE
+    
+    done = 0
+    
+    def on_log(message, level):
+        if not args.quiet:
+            emit('log', level=level, message=message)
+    
+    def on_file(video_path, status):
+        nonlocal done
+        done += 1
+        emit('file', path=video_path, status=status, done=done, total=len(video_files))
+    
+    engine = ThumbnailEngine(base_dir, log=on_log, file_done=on_file)
+    try:
+        started = time.monotonic()
+        if args.sweep_orphans:
+            video_files = []  # 孤立縮圖由核心自行列出目錄
+        if video_files is None:
+            found = engine.scan(folders)
+            video_files = list(dict.fromkeys(video for folder in folders for video in found[folder]))
+        action = ('clear' if args.clear else 'sweep' if args.sweep_orphans else 'benchmark' if args.benchmark_decoders
+                  else 'resume' if args.resume else 'retry' if args.retry_failed else 'generate')
+        emit('start', action=action, mode=config['output_mode'],
+             folders=folders, total=len(video_files), scan_seconds=round(time.monotonic() - started, 3))
+        
+        # 在背景執行緒處理，主執行緒負責接收 Ctrl+C 並要求核心停止
+        result = {}
+        
+        def run():
+            try:
+                if args.clear:
+                    result['cleared'] = engine.clear(video_files, config, dry_run=args.dry_run)
+                elif args.sweep_orphans:
+                    result['swept'] = engine.sweep_orphans(folders, config, dry_run=args.dry_run)
+                elif args.benchmark_decoders:
+                    result['decoders'] = engine.benchmark_decoders(video_files, config)
+                else:
+                    result['counts'] = engine.process(video_files, folders, config, resume=args.resume)
+            except SSHConnectionError as e:
+                result['ssh_error'] = str(e)
+            except Exception as e:
+                result['error'] = str(e)
+        
+        # 第一次 Ctrl+C 要求核心停止並等待目前的影片完成（檢查點與統計照常寫入），第二次才強制中斷
+        stop_requested = threading.Event()
+        
+        def on_interrupt(signum, frame):
+            stop_requested.set()
+            engine.stop()
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+        
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        previous_handler = signal.signal(signal.SIGINT, on_interrupt)
+        try:
+            while worker.is_alive():
+                worker.join(0.5)
+        finally:
+            signal.signal(signal.SIGINT, previous_handler)
+        interrupted = stop_requested.is_set()
+        
+        elapsed = round(time.monotonic() - started, 3)
+        if 'ssh_error' in result:
+            emit('error', message=f"SSH 連線失敗: {result['ssh_error']}")
+            return EXIT_SSH
+        if 'error' in result:
+            emit('error', message=result['error'])
+            return EXIT_INTERRUPTED if interrupted else EXIT_FAILED
+        
+        if args.sweep_orphans:
+            emit('summary', **result['swept'], dry_run=args.dry_run, stopped=engine.stop_flag, seconds=elapsed)
+            return EXIT_INTERRUPTED if interrupted else EXIT_OK
+        
+        if args.benchmark_decoders:
+            emit('summary', decoders=result['decoders'], stopped=engine.stop_flag, seconds=elapsed)
+            return EXIT_INTERRUPTED if interrupted else EXIT_OK
+        
+        if args.clear:
+            emit('summary', **result['cleared'], total=len(video_files), dry_run=args.dry_run,
+                 stopped=engine.stop_flag, seconds=elapsed)
+            return EXIT_INTERRUPTED if interrupted else EXIT_OK
+        
+        counts = result['counts']
+        stats = engine.stats.summary()
+        emit('summary', **counts, stopped=engine.stop_flag, seconds=elapsed,
+             files_per_second=round(done / elapsed, 2) if elapsed else None,
+             bytes_read=stats['bytes_read'], bytes_written=stats['bytes_written'],
+             stages={name: {key: stage[key] for key in ('count', 'mean_ms', 'p50_ms', 'p95_ms', 'max_ms')}
+                     for name, stage in stats['stages'].items()})
+        if args.stats:
+            engine.export_stats(args.stats)
+        if interrupted:
+            return EXIT_INTERRUPTED
+        return EXIT_FAILED if counts['fail'] else EXIT_OK
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,3145 @@
+"""
+影片縮圖產生器 - 處理核心
+掃描影片、產生與清除縮圖（本機或 Synology @eaDir 透過 SSH/SFTP），不依賴 GUI
+"""
+
+import os
+import csv
+import json
+import hashlib
+import sqlite3
+import time
+import threading
+import queue
+import re
+import errno
+import shlex
+import shutil
+import subprocess
+import multiprocessing
+import tempfile
+import contextlib
+import itertools
+import cProfile
+from stat import S_ISDIR
+import cv2
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+# SSH/SFTP 支援
+try:
+    import paramiko
+    HAS_PARAMIKO = True
+except ImportError:
+    HAS_PARAMIKO = False
+
+# PyAV 解碼後端（選用）
+try:
+    import av
+    HAS_AV = True
+except ImportError:
+    HAS_AV = False
+
+# 支援的影片格式
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.mpeg', '.mpg', '.3gp'}
+
+# 快速跳轉用的 ffmpeg（選用，找不到時退回 OpenCV 以時間跳轉）
+FFMPEG_PATH = shutil.which('ffmpeg')
+
+# 解碼後端（探測影片資訊與讀取畫面）
+DECODER_BACKENDS = {
+    'auto': '自動',
+    'opencv': 'OpenCV',
+    'pyav': 'PyAV',
+    'ffmpeg': 'ffmpeg',
+}
+
+# OpenCV 回報的總幀數常不正確或跳轉較慢的容器：自動模式沒有解碼測試結果時優先用 PyAV（其次 ffmpeg）
+UNRELIABLE_SEEK_EXTENSIONS = {'.mkv', '.wmv', '.flv'}
+
+# 預設解碼執行緒數（PyAV 與 ffmpeg；0 = 由 ffmpeg 決定）：多個擷取執行緒已同時處理不同影片，每部影片用 1 個即可
+DEFAULT_DECODER_THREADS = 1
+
+# 解碼測試：每種副檔名取樣的影片數，以及探測長度與其他後端中位數的容許誤差（比例，至少 1 秒）
+DECODER_BENCHMARK_SAMPLES = 3
+DECODER_DURATION_TOLERANCE = 0.05
+# 解碼測試：讀到的畫面時間與目標時間的容許誤差（秒，快速跳轉取目標前最近的關鍵幀，以常見的最大關鍵幀間隔為準）
+DECODER_SEEK_TOLERANCE = 10.0
+
+# 預設平行處理的工作執行緒數量
+DEFAULT_WORKERS = min(8, os.cpu_count() or 4)
+
+# 預設縮放與編碼執行緒數量（cv2 運算時會釋放 GIL）
+DEFAULT_TRANSFORM_WORKERS = max(1, min(4, (os.cpu_count() or 4) // 2))
+
+# 預設本機寫入執行緒數量
+DEFAULT_OUTPUT_WORKERS = 2
+
+# 預設 SFTP 上傳連線數
+DEFAULT_SFTP_SESSIONS = 4
+
+# 縮圖寬度（等比縮放）
+THUMBNAIL_WIDTH = 800
+
+# 縮放品質：大幅縮小時先以 INTER_AREA 每次減半到兩倍縮圖寬度以內，最後一步依品質選擇插值方式
+RESIZE_QUALITIES = {
+    'fast': '快速',
+    'balanced': '平衡',
+    'best': '最佳',
+}
+
+# 各縮放品質最後一步的插值方式
+RESIZE_INTERPOLATION = {
+    'fast': cv2.INTER_LINEAR,
+    'balanced': cv2.INTER_AREA,
+    'best': cv2.INTER_LANCZOS4,
+}
+
+# ffmpeg 縮減解析度解碼（-lowres）的最大級數（1/2、1/4、1/8）
+MAX_LOWRES = 3
+
+# 智慧選幀：設定的截取時間之後依序嘗試的位置（影片長度的比例），含第一個最多讀取 SMART_FRAME_CANDIDATES 個畫面
+SMART_FRAME_POSITIONS = (0.5, 0.3, 0.7, 0.15, 0.85)
+SMART_FRAME_CANDIDATES = 4
+
+# 智慧選幀評分：取樣寬度、可接受的平均亮度範圍、合格的最低對比（亮度標準差）與邊緣強度
+FRAME_SAMPLE_WIDTH = 64
+FRAME_LUMA_RANGE = (24, 232)
+FRAME_MIN_CONTRAST = 16
+FRAME_MIN_EDGES = 3
+
+# Video Station 縮圖檔名
+SYNO_THUMBNAIL_NAME = 'SYNOVIDEO_VIDEO_SCREENSHOT.jpg'
+
+# 輸出圖片格式 → cv2 品質參數（PNG 為無損，不使用品質）
+IMAGE_FORMATS = {
+    'jpg': cv2.IMWRITE_JPEG_QUALITY,
+    'webp': cv2.IMWRITE_WEBP_QUALITY,
+    'png': None,
+}
+
+# 預設輸出規格：每個規格由同一張解碼畫面縮放產生，第一個為主要縮圖（NAS 端產生、內容雜湊皆以此為準）
+# filename 為與影片同目錄模式的檔名，eadir_filename 為 @eaDir/影片檔名/ 內的檔名，{name} 代入影片檔名（不含副檔名）
+DEFAULT_RENDITIONS = [
+    {'name': 'thumbnail', 'width': THUMBNAIL_WIDTH, 'format': 'jpg', 'quality': 90,
+     'filename': '{name}.jpg', 'eadir_filename': SYNO_THUMBNAIL_NAME},
+]
+
+# 縮圖表（contact sheet）：設定 grid（欄x列）的輸出規格，畫面平均取自整部影片，以一次順向讀取完成
+DEFAULT_CONTACT_SHEET = {'name': 'sheet', 'width': 1600, 'format': 'jpg', 'quality': 85,
+                         'filename': '{name}.sheet.jpg', 'eadir_filename': 'contact_sheet.jpg'}
+
+# 縮圖表的欄數與列數上限
+MAX_CONTACT_SHEET_GRID = 10
+
+# 縮圖表：與下一個畫面的距離在此秒數內時順向解碼過去，較遠時才跳轉（跳轉需從前一個關鍵幀重新解碼）
+CONTACT_SHEET_GRAB_SECONDS = 2
+
+# 預覽動畫：設定 duration（秒）與 fps 的輸出規格，取截取時間前後的片段，以 ffmpeg 編碼為動態 WebP 或 GIF
+DEFAULT_PREVIEW = {'name': 'preview', 'width': 320, 'format': 'webp', 'quality': 75, 'duration': 3, 'fps': 8}
+
+# 預覽動畫長度與幀率上限
+MAX_PREVIEW_SECONDS = 10
+MAX_PREVIEW_FPS = 15
+
+# 預覽動畫格式 → ffmpeg 編碼參數（輸入為 stdin 的 bgr24 原始畫面，{quality} 代入規格的品質）
+ANIMATION_FORMATS = {
+    'webp': ['-c:v', 'libwebp_anim', '-lossless', '0', '-quality', '{quality}', '-loop', '0', '-f', 'webp'],
+    'gif': ['-vf', 'split[a][b];[a]palettegen=stats_mode=diff[p];[b][p]paletteuse=dither=bayer', '-loop', '0', '-f', 'gif'],
+}
+
+# 輸出模式
+OUTPUT_MODES = {
+    'same_folder': '與影片同目錄（同名.jpg）',
+    'synology_ssh': 'Synology Video Station（SSH）'
+}
+
+# NAS 端產生縮圖：同時執行的遠端指令上限（NAS CPU 較弱，且 sshd 限制同時開啟的通道數）
+REMOTE_EXEC_LIMIT = 4
+
+# NAS 端產生縮圖：單一影片的指令逾時（秒）
+REMOTE_EXEC_TIMEOUT = 300
+
+# 獨立程序解碼：單一影片的逾時（秒），逾時或子程序當掉時重新啟動該子程序
+DEFAULT_DECODE_TIMEOUT = 120
+
+# NAS 端產生縮圖的 shell 腳本（以 sh -c 執行，參數：ffmpeg 影片 @eaDir子資料夾 縮圖檔名 截取秒數 快速跳轉 寬度 qscale）
+# 成功時輸出「OK 目標時間 實際時間 sha1 大小」（實際時間已扣掉容器的起始時間，與本機解碼後端一致），失敗時輸出「ERR 訊息」
+REMOTE_THUMBNAIL_SCRIPT = r'''
+ffmpeg=$1 video=$2 out_dir=$3 out_name=$4 capture=$5 fast=$6 width=$7 qscale=$8
+probe=$("$ffmpeg" -hide_banner -nostdin -i "$video" 2>&1)
+duration=$(echo "$probe" | sed -n 's/.*Duration: *\([0-9:.]*\).*/\1/p' | head -n 1)
+start=$(echo "$probe" | sed -n 's/.*Duration:.*, start: *\([-0-9.]*\).*/\1/p' | head -n 1)
+[ -n "$duration" ] || { echo "ERR 無法讀取影片長度"; exit 1; }
+target=$(echo "$duration" | awk -F: -v c="$capture" '{ d = $1 * 3600 + $2 * 60 + $3; t = (c != "" && c + 0 <= d) ? c + 0 : d / 2; printf "%.3f", t }')
+if [ "$fast" = 1 ]; then seek="-skip_frame nokey -noaccurate_seek"; else seek=""; fi
+mkdir -p "$out_dir" || { echo "ERR 無法建立 $out_dir"; exit 1; }
+tmp="$out_dir/.$out_name.tmp"
+log=$("$ffmpeg" -hide_banner -nostdin $seek -ss "$target" -copyts -i "$video" -map 0:v:0 -frames:v 1 \
+    -vf "showinfo,scale=$width:-2" -q:v "$qscale" -f mjpeg -y "$tmp" 2>&1) || { rm -f "$tmp"; echo "ERR $(echo "$log" | tail -n 1)"; exit 1; }
+[ -s "$tmp" ] || { rm -f "$tmp"; echo "ERR 無法讀取幀"; exit 1; }
+actual=$(echo "$log" | sed -n 's/.*pts_time: *\([-0-9.]*\).*/\1/p' | head -n 1 | awk -v s="${start:-0}" '{ printf "%.3f", $1 - s }')
+mv -f "$tmp" "$out_dir/$out_name" || { echo "ERR 無法寫入縮圖"; exit 1; }
+echo "OK $target ${actual:-$target} $(sha1sum "$out_dir/$out_name" | cut -d ' ' -f 1) $(wc -c < "$out_dir/$out_name")"
+'''
+
+# 清除 @eaDir 的 shell 腳本（以 sh -c 執行，參數：@eaDir 路徑 試算(1/0) ./子資料夾...）
+# 輸出每個縮圖檔的大小（一行一個），試算時不刪除
+REMOTE_CLEAR_SCRIPT = r'''
+cd -- "$1" || exit 1
+dry=$2
+shift 2
+find "$@" -type f -exec stat -c %s {} + 2>/dev/null
+[ "$dry" = 1 ] && exit 0
+rm -rf -- "$@"
+'''
+REMOTE_CLEAR_BATCH = 500  # 每個指令最多刪除的子資料夾數（避免超過指令長度限制）
+
+# 處理階段（記錄與匯出順序）
+STAGE_NAMES = {
+    'exists': '檢查縮圖',
+    'probe': '探測',
+    'open': '開啟影片',
+    'seek': '跳轉',
+    'decode': '解碼',
+    'keyframe': 'ffmpeg 關鍵幀',
+    'select': '選擇畫面',
+    'sheet': '縮圖表',
+    'preview': '預覽動畫',
+    'resize': '縮放',
+    'encode': '編碼',
+    'write': '寫入',
+    'upload': '上傳',
+    'remote': 'NAS 端產生',
+}
+
+# 階段耗時直方圖的區間上限（毫秒）
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# 預設處理設定（鍵名與 settings.json 相同）
+DEFAULT_CONFIG = {
+    'output_mode': 'same_folder',
+    'ssh_host': '',
+    'ssh_port': '22',
+    'ssh_user': '',
+    'ssh_password': '',
+    'drive_letter': '',
+    'share_folder': '',
+    'volume_number': '1',
+    'sftp_sessions': str(DEFAULT_SFTP_SESSIONS),
+    'remote_exec': False,
+    'remote_ffmpeg': 'ffmpeg',
+    'capture_time': '',
+    'overwrite': False,
+    'fast_seek': True,
+    'smart_frame': False,  # 自動避開黑畫面、淡入淡出與空白畫面
+    'resize_quality': 'balanced',
+    'renditions': DEFAULT_RENDITIONS,
+    'contact_sheet': '',  # 縮圖表的欄x列，例如 4x4（空值 = 不產生）
+    'preview': '',  # 預覽動畫格式 webp / gif（空值 = 不產生，需要 ffmpeg）
+    'preview_seconds': str(DEFAULT_PREVIEW['duration']),
+    'preview_fps': str(DEFAULT_PREVIEW['fps']),
+    'preview_width': str(DEFAULT_PREVIEW['width']),
+    'worker_count': str(DEFAULT_WORKERS),
+    'transform_workers': str(DEFAULT_TRANSFORM_WORKERS),
+    'output_workers': str(DEFAULT_OUTPUT_WORKERS),
+    'decoder': 'auto',  # 解碼後端 auto / opencv / pyav / ffmpeg
+    'decoder_by_extension': {},  # 各副檔名指定的解碼後端，例如 {".mkv": "pyav"}（僅能在 settings.json 編輯）
+    'decoder_threads': str(DEFAULT_DECODER_THREADS),
+    'process_decode': False,  # 在子程序中擷取畫面並編碼（避開 GIL，損壞的影片不會拖垮整個程式）
+    'decode_timeout': str(DEFAULT_DECODE_TIMEOUT),
+    'profile_output': '',  # 非空時以 cProfile 分析一個檔案並存到此路徑
+}
+
+
+def parse_grid(text):
+    """解析縮圖表的「欄x列」，回傳 (欄, 列)；格式無效時拋出例外"""
+    match = re.fullmatch(r'\s*(\d+)\s*[xX×*]\s*(\d+)\s*', str(text))
+    if not match:
+        raise Exception(f"縮圖表格式應為 欄x列，例如 4x4: {text}")
+    columns, rows = int(match.group(1)), int(match.group(2))
+    if not (1 <= columns <= MAX_CONTACT_SHEET_GRID and 1 <= rows <= MAX_CONTACT_SHEET_GRID):
+        raise Exception(f"縮圖表的欄數與列數需為 1-{MAX_CONTACT_SHEET_GRID}: {text}")
+    return columns, rows
+
+
+def rendition_specs(config):
+    """設定中的輸出規格，contact_sheet、preview 有設定時加入縮圖表與預覽動畫規格（尚未檢查）"""
+    specs = list(config['renditions'])
+    contact_sheet = str(config['contact_sheet']).strip()
+    if contact_sheet and not any(spec.get('grid') for spec in specs):
+        specs.append(dict(DEFAULT_CONTACT_SHEET, grid=contact_sheet))
+    preview = str(config['preview']).strip().lower()
+    if preview and not any('duration' in spec for spec in specs):
+        specs.append(dict(DEFAULT_PREVIEW, format=preview, duration=config['preview_seconds'],
+                          fps=config['preview_fps'], width=config['preview_width']))
+    return specs
+
+
+def normalize_renditions(specs):
+    """檢查輸出規格並補齊缺少的欄位（與預設規格同名時沿用其設定），規格無效時拋出例外"""
+    if not specs:
+        raise Exception("至少需要一個輸出規格")
+    
+    defaults = {r['name']: r for r in DEFAULT_RENDITIONS + [DEFAULT_CONTACT_SHEET, DEFAULT_PREVIEW]}
+    renditions = []
+    for spec in specs:
+        name = str(spec.get('name', '')).strip()
+        if not name:
+            raise Exception("輸出規格缺少名稱")
+        default = defaults.get(name, {})
+        duration = spec.get('duration', default.get('duration'))
+        formats = ANIMATION_FORMATS if duration is not None else IMAGE_FORMATS
+        # 未指定格式時依檔名的副檔名判斷
+        extension = os.path.splitext(str(spec.get('filename') or spec.get('eadir_filename') or ''))[1].lower().lstrip('.')
+        if extension not in formats and extension != 'jpeg':
+            extension = default.get('format', 'jpg')
+        image_format = str(spec.get('format') or extension).lower().lstrip('.')
+        image_format = 'jpg' if image_format == 'jpeg' else image_format
+        if image_format not in formats:
+            raise Exception(f"輸出規格 {name} 的格式不支援: {image_format}（可用 {'、'.join(formats)}）")
+        try:
+            width = int(spec.get('width', default.get('width', THUMBNAIL_WIDTH)))
+            quality = int(spec.get('quality', default.get('quality', 90)))
+        except (TypeError, ValueError):
+            raise Exception(f"輸出規格 {name} 的寬度或品質無效")
+        if width < 16 or not 1 <= quality <= 100:
+            raise Exception(f"輸出規格 {name} 的寬度需至少 16、品質需為 1-100")
+        
+        rendition = {
+            'name': name,
+            'width': width,
+            'format': image_format,
+            'quality': quality,
+            'filename': str(spec.get('filename') or default.get('filename') or f"{{name}}.{name}.{image_format}"),
+            'eadir_filename': str(spec.get('eadir_filename') or default.get('eadir_filename') or f"{name}.{image_format}"),
+        }
+        for key in ('filename', 'eadir_filename'):
+            try:
+                formatted = rendition[key].format(name='video')
+            except (KeyError, IndexError, ValueError):
+                raise Exception(f"輸出規格 {name} 的檔名格式無效: {rendition[key]}")
+            if not formatted or formatted != os.path.basename(formatted) or '\\' in formatted:
+                raise Exception(f"輸出規格 {name} 的檔名不可包含目錄: {rendition[key]}")
+        if spec.get('grid'):
+            columns, rows = parse_grid(spec['grid'])
+            if rendition['width'] < columns * 16:
+                raise Exception(f"輸出規格 {name} 的寬度不足以排列 {columns} 欄")
+            rendition['grid'] = f"{columns}x{rows}"
+        if duration is not None:
+            try:
+                rendition['duration'] = float(duration)
+                rendition['fps'] = int(spec.get('fps', default.get('fps', DEFAULT_PREVIEW['fps'])))
+            except (TypeError, ValueError):
+                raise Exception(f"輸出規格 {name} 的長度或幀率無效")
+            if not (0 < rendition['duration'] <= MAX_PREVIEW_SECONDS and 1 <= rendition['fps'] <= MAX_PREVIEW_FPS):
+                raise Exception(f"輸出規格 {name} 的長度需為 {MAX_PREVIEW_SECONDS} 秒以內、幀率需為 1-{MAX_PREVIEW_FPS}")
+            if rendition.get('grid'):
+                raise Exception(f"輸出規格 {name} 不能同時是縮圖表與預覽動畫")
+        renditions.append(rendition)
+    
+    for key in ('name', 'filename', 'eadir_filename'):
+        values = [rendition[key] for rendition in renditions]
+        if len(set(values)) != len(values):
+            raise Exception(f"輸出規格的 {key} 重複")
+    if sum(1 for rendition in renditions if rendition.get('grid')) > 1:
+        raise Exception("只能設定一個縮圖表輸出規格")
+    if sum(1 for rendition in renditions if 'duration' in rendition) > 1:
+        raise Exception("只能設定一個預覽動畫輸出規格")
+    if renditions[0].get('grid') or 'duration' in renditions[0]:
+        raise Exception("第一個輸出規格（主要縮圖）必須是單張圖片")
+    return renditions
+
+
+def combine_futures(futures):
+    """回傳在所有 Future 完成後才完成的 Future（有任一失敗時以第一個例外結束）"""
+    combined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+    
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        for future in futures:
+            if future.exception() is not None:
+                combined.set_exception(future.exception())
+                return
+        combined.set_result([future.result() for future in futures])
+    
+    if not futures:
+        combined.set_result([])
+    for future in futures:
+        future.add_done_callback(done)
+    return combined
+
+
+def open_ssh_session(params):
+    """建立一組 SSH/SFTP 工作階段，params 為 paramiko connect 參數（hostname, port, username, password）"""
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    ssh.connect(**params, timeout=10)
+    return ssh, ssh.open_sftp()
+
+
+class ProbeCache:
+    """影片探測結果快取（SQLite），以 (路徑, 大小, 修改時間) 判斷是否仍有效"""
+    
+    def __init__(self, db_path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=HistoryStore.BUSY_TIMEOUT, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS probes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                fps REAL,
+                frame_count INTEGER,
+                duration REAL,
+                width INTEGER,
+                height INTEGER,
+                codec TEXT,
+                thumb_time REAL,
+                thumb_hash TEXT,
+                thumb_settings TEXT,
+                thumb_generated REAL,
+                decoder TEXT,
+                failed_decoder TEXT
+            )
+        """)
+        # 舊版資料表沒有探測用的解碼後端（皆為 OpenCV）與探測失敗的後端
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(probes)")}
+        for column in ('decoder', 'failed_decoder'):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE probes ADD COLUMN {column} TEXT")
+        self.conn.commit()
+    
+    def get(self, path, size, mtime):
+        """取得有效的探測資料，來源檔已變更或無記錄時回傳 None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT fps, frame_count, duration, width, height, codec, decoder, failed_decoder FROM probes "
+                "WHERE path = ? AND size = ? AND mtime = ?", (path, size, mtime)).fetchone()
+        if row is None:
+            return None
+        keys = ('fps', 'frame_count', 'duration', 'width', 'height', 'codec', 'decoder', 'failed_decoder')
+        info = dict(zip(keys, row))
+        info['decoder'] = info['decoder'] or 'opencv'
+        return info
+    
+    def put(self, path, size, mtime, info):
+        """寫入探測資料（來源檔變更時一併清除舊的縮圖記錄；未變更而改用其他解碼後端重新探測時保留）
+        info 的 failed_decoder 為探測失敗而退回 OpenCV 的後端"""
+        with self.lock:
+            self.conn.execute("""
+                INSERT INTO probes (path, size, mtime, fps, frame_count, duration, width, height, codec,
+                                    decoder, failed_decoder)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    size = excluded.size, mtime = excluded.mtime, fps = excluded.fps,
+                    frame_count = excluded.frame_count, duration = excluded.duration,
+                    width = excluded.width, height = excluded.height, codec = excluded.codec,
+                    decoder = excluded.decoder, failed_decoder = excluded.failed_decoder,
+                    thumb_time = CASE WHEN size = excluded.size AND mtime = excluded.mtime THEN thumb_time END,
+                    thumb_hash = CASE WHEN size = excluded.size AND mtime = excluded.mtime THEN thumb_hash END,
+                    thumb_settings = CASE WHEN size = excluded.size AND mtime = excluded.mtime THEN thumb_settings END,
+                    thumb_generated = CASE WHEN size = excluded.size AND mtime = excluded.mtime THEN thumb_generated END
+            """, (path, size, mtime, info['fps'], info['frame_count'], info['duration'],
+                  info['width'], info['height'], info['codec'], info['decoder'], info.get('failed_decoder')))
+            self.conn.commit()
+    
+    def record_thumbnail(self, path, thumb_time, thumb_hash, thumb_settings):
+        """記錄最後一次產生縮圖的截取時間、內容雜湊與設定"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE probes SET thumb_time = ?, thumb_hash = ?, thumb_settings = ?, thumb_generated = ? "
+                "WHERE path = ?", (thumb_time, thumb_hash, thumb_settings, time.time(), path))
+            self.conn.commit()
+    
+    def thumbnail_settings(self, path):
+        """取得產生目前縮圖時的設定，沒有記錄時回傳 None"""
+        with self.lock:
+            row = self.conn.execute("SELECT thumb_settings FROM probes WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else None
+    
+    def forget_thumbnail(self, path):
+        """縮圖被清除時移除縮圖記錄（保留探測資料）"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE probes SET thumb_time = NULL, thumb_hash = NULL, thumb_settings = NULL, "
+                "thumb_generated = NULL WHERE path = ?", (path,))
+            self.conn.commit()
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class HistoryStore:
+    """已處理影片記錄（SQLite WAL），每部影片完成時立即寫入來源檔大小與修改時間，中斷或多個程序同時執行也不會遺失或損毀"""
+    
+    BUSY_TIMEOUT = 30  # 其他程序（GUI 與命令列同時執行）寫入中時等待的秒數
+    
+    def __init__(self, db_path, legacy_file=None):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=self.BUSY_TIMEOUT, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS processed (
+                path TEXT PRIMARY KEY,
+                processed REAL NOT NULL,
+                size INTEGER,
+                mtime REAL
+            )
+        """)
+        # 舊版資料表沒有來源檔大小與修改時間
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(processed)")}
+        for column, kind in (('size', 'INTEGER'), ('mtime', 'REAL')):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE processed ADD COLUMN {column} {kind}")
+        self.conn.commit()
+        if legacy_file:
+            self._import_legacy(legacy_file)
+    
+    def _import_legacy(self, legacy_file):
+        """匯入舊版 processed_videos.json（只執行一次，匯入後改名保留）"""
+        if not os.path.exists(legacy_file):
+            return
+        try:
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                paths = json.load(f)
+            now = time.time()
+            with self.lock:
+                self.conn.executemany("INSERT OR IGNORE INTO processed (path, processed) VALUES (?, ?)",
+                                      [(path, now) for path in paths if isinstance(path, str)])
+                self.conn.commit()
+            os.replace(legacy_file, legacy_file + '.migrated')
+        except (OSError, ValueError, sqlite3.Error):
+            pass
+    
+    def __contains__(self, path):
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM processed WHERE path = ?", (path,)).fetchone() is not None
+    
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM processed").fetchone()[0]
+    
+    def get(self, path):
+        """取得記錄的 (大小, 修改時間)，舊版記錄為 (None, None)，沒有記錄時回傳 None"""
+        with self.lock:
+            row = self.conn.execute("SELECT size, mtime FROM processed WHERE path = ?", (path,)).fetchone()
+        return tuple(row) if row else None
+    
+    def add(self, path, size=None, mtime=None):
+        """記錄完成的影片與產生縮圖時的來源檔大小、修改時間（立即寫入）"""
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO processed (path, processed, size, mtime) VALUES (?, ?, ?, ?)",
+                              (path, time.time(), size, mtime))
+            self.conn.commit()
+    
+    def paths(self):
+        """所有記錄的影片路徑"""
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT path FROM processed")]
+    
+    def discard(self, path):
+        """移除記錄（縮圖已不存在或被清除）"""
+        with self.lock:
+            self.conn.execute("DELETE FROM processed WHERE path = ?", (path,))
+            self.conn.commit()
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class JobCheckpoint:
+    """最近一次處理的檢查點（SQLite WAL）：工作清單、各檔結果與設定，停止、關閉視窗或當機後可從中斷處繼續"""
+    
+    def __init__(self, db_path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=HistoryStore.BUSY_TIMEOUT, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS job (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                folders TEXT NOT NULL,
+                config TEXT NOT NULL,
+                started REAL NOT NULL,
+                state TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_items (
+                path TEXT PRIMARY KEY,
+                idx INTEGER NOT NULL,
+                status TEXT
+            )
+        """)
+        self.conn.commit()
+    
+    def start(self, video_files, folders, config):
+        """建立新的檢查點（取代上一次的記錄；密碼不寫入）"""
+        config = {key: value for key, value in config.items() if key != 'ssh_password'}
+        with self.lock:
+            self.conn.execute("DELETE FROM job")
+            self.conn.execute("DELETE FROM job_items")
+            self.conn.execute("INSERT INTO job (id, folders, config, started, state) VALUES (1, ?, ?, ?, 'running')",
+                              (json.dumps(list(folders), ensure_ascii=False), json.dumps(config, ensure_ascii=False),
+                               time.time()))
+            self.conn.executemany("INSERT OR IGNORE INTO job_items (path, idx) VALUES (?, ?)",
+                                  [(path, idx) for idx, path in enumerate(video_files)])
+            self.conn.commit()
+    
+    def mark(self, path, status):
+        """記錄單一影片的結果（success / skip / fail）"""
+        with self.lock:
+            self.conn.execute("UPDATE job_items SET status = ? WHERE path = ?", (status, path))
+            self.conn.commit()
+    
+    def finish(self, stopped=False):
+        """處理結束（中途停止時保留為可繼續）"""
+        with self.lock:
+            self.conn.execute("UPDATE job SET state = ?", ('stopped' if stopped else 'finished',))
+            self.conn.commit()
+    
+    def load(self):
+        """讀取檢查點：{'state', 'folders', 'config', 'started', 'total', 'remaining', 'failed', 'retry'}，沒有記錄時回傳 None
+        retry 為重試失敗時要處理的影片：失敗的影片，未完成的工作另加上尚未處理的影片（重試會建立新的檢查點，不能遺失）"""
+        with self.lock:
+            row = self.conn.execute("SELECT folders, config, started, state FROM job").fetchone()
+            if row is None:
+                return None
+            items = self.conn.execute("SELECT path, status FROM job_items ORDER BY idx").fetchall()
+        remaining = [path for path, status in items if status is None]
+        failed = [path for path, status in items if status == 'fail']
+        return {
+            'state': row[3],  # running（執行中或當機）/ stopped / finished
+            'folders': json.loads(row[0]),
+            'config': json.loads(row[1]),
+            'started': row[2],
+            'total': len(items),
+            'remaining': remaining,
+            'failed': failed,
+            'retry': failed + (remaining if row[3] != 'finished' else []),
+        }
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class FolderScanner:
+    """增量資料夾掃描：快取各目錄的檔案清單與修改時間，只重新列出有變更的目錄"""
+    
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.lock = threading.Lock()
+        self.dirs = self._load()
+    
+    def _load(self):
+        try:
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except:
+            pass
+        return {}
+    
+    def save(self):
+        """寫入快取檔（先寫暫存檔再取代，避免中斷時損毀）"""
+        with self.lock:
+            data = json.dumps(self.dirs, ensure_ascii=False)
+        tmp_file = self.cache_file + '.tmp'
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_file, self.cache_file)
+        except OSError:
+            pass
+    
+    def forget(self, folder):
+        """移除資料夾（含子目錄）的快取"""
+        prefix = os.path.join(folder, '')
+        with self.lock:
+            for path in [p for p in self.dirs if p == folder or p.startswith(prefix)]:
+                del self.dirs[path]
+    
+    def _list_dir(self, path, mtime):
+        """列出目錄中的影片與子目錄，目錄未變更時直接使用快取"""
+        with self.lock:
+            cached = self.dirs.get(path)
+        if cached and cached['mtime'] == mtime:
+            return cached['files'], cached['dirs']
+        
+        files, subdirs = [], []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        # 與 os.walk 相同：不進入符號連結目錄，並略過 @eaDir
+                        if entry.name != '@eaDir' and not entry.is_symlink():
+                            subdirs.append(entry.name)
+                    elif os.path.splitext(entry.name)[1].lower() in VIDEO_EXTENSIONS:
+                        files.append(entry.name)
+                except OSError:
+                    pass
+        
+        # 已不存在的子目錄一併清除快取
+        if cached:
+            for name in set(cached['dirs']) - set(subdirs):
+                self.forget(os.path.join(path, name))
+        with self.lock:
+            self.dirs[path] = {'mtime': mtime, 'files': files, 'dirs': subdirs}
+        return files, subdirs
+    
+    def scan(self, folder, on_progress=None):
+        """遞迴掃描資料夾，回傳影片路徑清單；on_progress(已找到數量) 於每個目錄後呼叫"""
+        videos = []
+        stack = [folder]
+        while stack:
+            path = stack.pop()
+            try:
+                files, subdirs = self._list_dir(path, os.stat(path).st_mtime)
+            except OSError:
+                continue
+            videos.extend(os.path.join(path, name) for name in files)
+            # 反向推入以維持 os.walk 的由上而下順序
+            stack.extend(os.path.join(path, name) for name in reversed(subdirs))
+            if on_progress:
+                on_progress(len(videos))
+        return videos
+
+
+class SFTPPool:
+    """SFTP 連線池：維持多個 SSH/SFTP 工作階段，斷線的工作階段會被丟棄並於下次取用時重新連線"""
+    
+    def __init__(self, connect, size, on_broken=None):
+        self.connect = connect      # () -> (ssh_client, sftp_client)
+        self.on_broken = on_broken  # 偵測到連線中斷時呼叫
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+        self.closed = False
+    
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self.lock:
+            can_create = self.created < self.size
+            if can_create:
+                self.created += 1
+        if not can_create:
+            return self.idle.get()
+        
+        try:
+            return self.connect()
+        except Exception:
+            with self.lock:
+                self.created -= 1
+            raise
+    
+    def release(self, session):
+        ssh, sftp = session
+        transport = ssh.get_transport()
+        if transport is None or not transport.is_active():
+            self.discard(session, broken=True)
+        elif self.closed:
+            self.discard(session)
+        else:
+            self.idle.put(session)
+    
+    def discard(self, session, broken=False):
+        """關閉並移除工作階段"""
+        if broken and self.on_broken:
+            self.on_broken()
+        ssh, sftp = session
+        for client in (sftp, ssh):
+            try:
+                client.close()
+            except Exception:
+                pass
+        with self.lock:
+            self.created -= 1
+    
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                self.discard(self.idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+class SFTPUploader:
+    """縮圖上傳佇列：每個連線一個上傳執行緒，以 pipelined 寫入並批次驗證檔案大小"""
+    
+    BATCH_SIZE = 16
+    
+    def __init__(self, pool, makedirs, shell_root=None):
+        self.pool = pool
+        self.makedirs = makedirs      # (sftp, remote_dir) -> None
+        self.shell_root = shell_root  # SSH shell 看到的 SFTP 根目錄，例如 /volume1；None 表示不使用遠端指令
+        self.queue = queue.Queue(maxsize=pool.size * self.BATCH_SIZE)
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(pool.size)]
+        for thread in self.threads:
+            thread.start()
+    
+    def submit(self, remote_dir, remote_path, data, replace=True):
+        """排入上傳工作，回傳 Future；佇列已滿時會等待（背壓）"""
+        future = Future()
+        self.queue.put((remote_dir, remote_path, data, replace, future))
+        return future
+    
+    def close(self):
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.pool.close()
+    
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            batch = [job]
+            stop = False
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    job = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+            self._upload_batch(batch)
+            if stop:
+                break
+    
+    def _upload_batch(self, batch):
+        # 連線中斷時重新連線並重試一次
+        error = None
+        for attempt in range(2):
+            try:
+                session = self.pool.acquire()
+            except Exception as e:
+                error = e
+                continue
+            try:
+                written = self._write_batch(session, batch)
+                self._verify_batch(session, written)
+                self.pool.release(session)
+                return
+            except Exception as e:
+                error = e
+                transport = session[0].get_transport()
+                if transport is not None and transport.is_active():
+                    self.pool.release(session)
+                    break  # 非連線問題，不重試
+                self.pool.discard(session, broken=True)
+        
+        for job in batch:
+            if not job[-1].done():
+                job[-1].set_exception(Exception(f"SFTP 寫入失敗 [{job[1]}]: {error}"))
+    
+    def _write_batch(self, session, batch):
+        """寫入整批檔案，回傳寫入成功、等待驗證的工作"""
+        ssh, sftp = session
+        written = []
+        for job in batch:
+            remote_dir, remote_path, data, replace, future = job
+            if future.done():
+                continue
+            try:
+                self.makedirs(sftp, remote_dir)
+                if replace:
+                    # 嘗試先刪除避免權限衝突
+                    try:
+                        sftp.remove(remote_path)
+                    except IOError:
+                        pass
+                with sftp.open(remote_path, 'wb') as f:
+                    f.set_pipelined(True)  # 不逐塊等待回應，close 時一併確認
+                    f.write(data)
+                written.append(job)
+            except IOError as e:
+                transport = ssh.get_transport()
+                if transport is None or not transport.is_active():
+                    raise
+                future.set_exception(Exception(f"SFTP 寫入失敗 [{remote_path}]: {e}"))
+        return written
+    
+    def _verify_batch(self, session, batch):
+        """批次確認檔案大小：可執行遠端指令時整批一次 stat，否則逐一 stat"""
+        if not batch:
+            return
+        sizes = self._remote_sizes(session[0], [job[1] for job in batch]) if self.shell_root else None
+        for remote_dir, remote_path, data, replace, future in batch:
+            if sizes is not None:
+                size = sizes.get(remote_path)
+            else:
+                try:
+                    size = session[1].stat(remote_path).st_size
+                except IOError:
+                    size = None
+            if size != len(data):
+                future.set_exception(Exception(f"SFTP 寫入失敗 [{remote_path}]: 檔案大小為 {size}"))
+            else:
+                future.set_result(remote_path)
+    
+    def _remote_sizes(self, ssh, paths):
+        """以一次遠端 stat 取得多個檔案大小，無法執行時回傳 None 並改為逐一 stat"""
+        shell_root = self.shell_root
+        args = ' '.join(shlex.quote(shell_root + path) for path in paths)
+        try:
+            stdin, stdout, stderr = ssh.exec_command(f"stat -c '%s %n' -- {args} 2>/dev/null")
+            output = stdout.read().decode('utf-8', 'replace')
+            stdout.channel.recv_exit_status()
+        except Exception:
+            output = ''
+        if not output:
+            self.shell_root = None
+            return None
+        
+        sizes = {}
+        for line in output.splitlines():
+            size, _, name = line.partition(' ')
+            if size.isdigit() and name.startswith(shell_root):
+                sizes[name[len(shell_root):]] = int(size)
+        return sizes
+
+
+class RunStats:
+    """單次處理的逐檔階段耗時與讀寫量，彙總為百分位數與直方圖"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()  # 工作執行緒目前處理中的檔案記錄
+        self.records = []
+        self.started = time.time()
+        self.seconds = None
+        self.profile_claimed = False
+    
+    def begin(self, video_path):
+        """開始記錄一個檔案（並設為目前執行緒處理中的檔案），回傳記錄"""
+        record = {'path': video_path, 'status': None, 'stages': {},
+                  'bytes_read': None, 'bytes_written': 0, 'started': time.perf_counter()}
+        self.local.record = record
+        return record
+    
+    @contextlib.contextmanager
+    def track(self, record):
+        """在目前執行緒繼續記錄另一個執行緒開始的檔案（管線的下一段）"""
+        self.local.record = record
+        try:
+            yield
+        finally:
+            self.local.record = None
+    
+    def add_stage(self, record, name, seconds):
+        """直接累計某個階段的耗時（非同步完成的階段，例如上傳）"""
+        with self.lock:
+            record['stages'][name] = record['stages'].get(name, 0) + seconds
+    
+    def end(self, record, status):
+        """結束檔案的記錄"""
+        record['status'] = status
+        record['seconds'] = time.perf_counter() - record.pop('started')
+        with self.lock:
+            self.records.append(record)
+    
+    @contextlib.contextmanager
+    def stage(self, name):
+        """累計目前檔案在某個階段的耗時（不在處理中時不記錄）"""
+        record = getattr(self.local, 'record', None)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if record is not None:
+                record['stages'][name] = record['stages'].get(name, 0) + time.perf_counter() - start
+    
+    def add_bytes(self, read=None, written=None):
+        record = getattr(self.local, 'record', None)
+        if record is None:
+            return
+        if read is not None:
+            record['bytes_read'] = (record['bytes_read'] or 0) + read
+        if written is not None:
+            record['bytes_written'] += written
+    
+    def claim_profile(self):
+        """只有第一個呼叫者取得 cProfile 取樣資格"""
+        with self.lock:
+            if self.profile_claimed:
+                return False
+            self.profile_claimed = True
+            return True
+    
+    def finish(self):
+        self.seconds = time.time() - self.started
+    
+    def summary(self):
+        """各階段的次數、合計、平均、百分位數（毫秒）與直方圖"""
+        with self.lock:
+            records = list(self.records)
+        
+        stages = {}
+        for name in STAGE_NAMES:
+            values = sorted(r['stages'][name] * 1000 for r in records if name in r['stages'])
+            if not values:
+                continue
+            
+            def percentile(p):
+                return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+            
+            # 各區間的次數（區間上限含本身）
+            counts = [sum(1 for v in values if v <= bound) for bound in HISTOGRAM_BOUNDS_MS]
+            histogram = {f"<={bound}ms": count - previous
+                         for bound, count, previous in zip(HISTOGRAM_BOUNDS_MS, counts, [0] + counts[:-1])}
+            histogram[f">{HISTOGRAM_BOUNDS_MS[-1]}ms"] = len(values) - counts[-1]
+            
+            stages[name] = {
+                'count': len(values),
+                'total_ms': round(sum(values), 3),
+                'mean_ms': round(sum(values) / len(values), 3),
+                'p50_ms': round(percentile(50), 3),
+                'p90_ms': round(percentile(90), 3),
+                'p95_ms': round(percentile(95), 3),
+                'p99_ms': round(percentile(99), 3),
+                'max_ms': round(values[-1], 3),
+                'histogram': histogram,
+            }
+        
+        status = {}
+        for r in records:
+            status[r['status']] = status.get(r['status'], 0) + 1
+        bytes_read = [r['bytes_read'] for r in records if r['bytes_read'] is not None]
+        return {
+            'files': len(records),
+            'status': status,
+            'seconds': round(self.seconds, 3) if self.seconds is not None else None,
+            'bytes_read': sum(bytes_read) if bytes_read else None,
+            'bytes_read_files': len(bytes_read),
+            'bytes_written': sum(r['bytes_written'] for r in records),
+            'stages': stages,
+        }
+    
+    def export(self, path):
+        """匯出統計：.csv 為逐檔明細，其他副檔名為 JSON（彙總 + 逐檔明細）"""
+        with self.lock:
+            records = list(self.records)
+        if path.lower().endswith('.csv'):
+            with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['path', 'status', 'seconds', *(f"{name}_ms" for name in STAGE_NAMES),
+                                 'bytes_read', 'bytes_written'])
+                for r in records:
+                    writer.writerow([r['path'], r['status'], f"{r['seconds']:.6f}",
+                                     *(f"{r['stages'][name] * 1000:.3f}" if name in r['stages'] else ''
+                                       for name in STAGE_NAMES),
+                                     '' if r['bytes_read'] is None else r['bytes_read'], r['bytes_written']])
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                    'summary': self.summary(),
+                    'files': [dict(r, seconds=round(r['seconds'], 6),
+                                   stages={k: round(v, 6) for k, v in r['stages'].items()}) for r in records],
+                }, f, ensure_ascii=False, indent=2)
+
+
+class OpenCVDecoder:
+    """OpenCV（cv2.VideoCapture）解碼後端：探測時開啟的 cap 可交給讀取畫面重複使用"""
+    
+    name = 'opencv'
+    
+    def __init__(self, stats, threads=0):
+        self.stats = stats
+        self.threads = threads  # OpenCV 不支援設定解碼執行緒數
+    
+    @staticmethod
+    def available():
+        return True
+    
+    @staticmethod
+    def open(video_path):
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise Exception("無法開啟影片")
+        return cap
+    
+    def probe(self, video_path):
+        """回傳 (已開啟的 cap, info)"""
+        cap = self.open(video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+        info = {
+            'fps': fps,
+            'frame_count': total_frames,
+            'duration': total_frames / fps if fps > 0 else 0,
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            'codec': ''.join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)).strip('\x00 '),
+            'decoder': self.name,
+        }
+        return cap, info
+    
+    def read_frame(self, video_path, info, target_time, keyframe, decode_width=None, cap=None):
+        """讀取指定時間的畫面，回傳 (frame 或 None, 實際時間, cap)；開啟的 cap 交回呼叫端重複使用與釋放
+        keyframe 時以時間跳轉（由 CAP_PROP_POS_MSEC 取得實際畫面時間），否則逐幀跳轉到目標幀；不支援縮減解析度解碼"""
+        if cap is None:
+            with self.stats.stage('open'):
+                cap = self.open(video_path)
+        if keyframe:
+            with self.stats.stage('seek'):
+                cap.set(cv2.CAP_PROP_POS_MSEC, target_time * 1000)
+            with self.stats.stage('decode'):
+                ret, frame = cap.read()
+            return (frame, cap.get(cv2.CAP_PROP_POS_MSEC) / 1000, cap) if ret else (None, target_time, cap)
+        
+        with self.stats.stage('seek'):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(target_time * info['fps']))
+        with self.stats.stage('decode'):
+            ret, frame = cap.read()
+        return (frame if ret else None), target_time, cap
+
+
+class PyAVDecoder:
+    """PyAV 解碼後端：長度與幀率取自容器與串流資訊（不依賴總幀數），可設定解碼執行緒數；
+    keyframe 時以 skip_frame 只解碼關鍵幀，指定 decode_width 時由 swscale 直接縮小輸出"""
+    
+    name = 'pyav'
+    
+    def __init__(self, stats, threads=0):
+        self.stats = stats
+        self.threads = threads
+    
+    @staticmethod
+    def available():
+        return HAS_AV
+    
+    def _open(self, video_path):
+        """回傳 (container, 第一個視訊串流)"""
+        try:
+            container = av.open(video_path)
+        except Exception:
+            raise Exception("無法開啟影片")
+        if not container.streams.video:
+            container.close()
+            raise Exception("找不到視訊串流")
+        return container, container.streams.video[0]
+    
+    def probe(self, video_path):
+        """回傳 (None, info)"""
+        container, stream = self._open(video_path)
+        try:
+            fps = float(stream.average_rate or stream.guessed_rate or 0)
+            if stream.duration and stream.time_base:
+                duration = float(stream.duration * stream.time_base)
+            elif container.duration:
+                duration = container.duration / av.time_base
+            else:
+                duration = stream.frames / fps if fps > 0 else 0
+            context = stream.codec_context
+            info = {
+                'fps': fps,
+                'frame_count': stream.frames or int(round(duration * fps)),
+                'duration': duration,
+                'width': context.width,
+                'height': context.height,
+                'codec': context.name,
+                'decoder': self.name,
+            }
+        finally:
+            container.close()
+        return None, info
+    
+    def read_frame(self, video_path, info, target_time, keyframe, decode_width=None, cap=None):
+        """讀取指定時間的畫面，回傳 (frame 或 None, 實際時間, None)
+        跳轉到目標時間前的關鍵幀，keyframe 時直接取該關鍵幀，否則順向解碼到目標時間
+        目標與實際時間皆相對於串流的起始時間（MPEG-PS/TS、剪輯過的 MKV 常不從 0 開始）"""
+        with self.stats.stage('open'):
+            container, stream = self._open(video_path)
+        try:
+            context = stream.codec_context
+            context.thread_count = self.threads
+            if self.threads != 1:
+                context.thread_type = 'AUTO'
+            if keyframe:
+                context.skip_frame = 'NONKEY'
+            start = stream.start_time or 0
+            start_time = float(start * stream.time_base)
+            tolerance = 0.5 / (info['fps'] or 25)
+            with self.stats.stage('seek'):
+                # 沒有索引的容器（MPEG-PS 等）可能跳到目標時間之後，逐次加倍往前退，直到第一幀不晚於目標
+                # （跳到起始時間也可能落在其後，因此允許退到起始時間之前，此時會從第一幀開始）
+                seek_time, step = target_time, 1.0
+                while True:
+                    container.seek(start + int(seek_time / stream.time_base), stream=stream)
+                    frames = container.decode(stream)
+                    first = next(frames, None)
+                    if (first is None or first.time is None or seek_time < 0
+                            or first.time - start_time <= target_time + tolerance):
+                        break
+                    seek_time, step = seek_time - step, step * 2
+            with self.stats.stage('decode'):
+                for frame in itertools.chain([first] if first is not None else [], frames):
+                    if keyframe or frame.time is None or frame.time - start_time >= target_time - tolerance:
+                        break
+                else:
+                    return None, target_time, None
+                
+                width = height = None
+                if decode_width and frame.width > decode_width:
+                    width = decode_width
+                    height = max(2, round(frame.height * decode_width / frame.width / 2) * 2)
+                image = frame.to_ndarray(format='bgr24', width=width, height=height, interpolation='AREA')
+            return image, (frame.time - start_time if frame.time is not None else target_time), None
+        finally:
+            container.close()
+
+
+class FFmpegDecoder:
+    """ffmpeg 子程序解碼後端：以 -ss 輸入端跳轉後只輸出一個畫面（-frames:v 1）
+    keyframe 時加上 -skip_frame nokey -noaccurate_seek 只解碼一個關鍵幀；指定 decode_width 時在 ffmpeg 內縮小，
+    支援的解碼器（MPEG-2/4、MJPEG 等）另以 -lowres 直接低解析度解碼"""
+    
+    name = 'ffmpeg'
+    
+    def __init__(self, stats, threads=0):
+        self.stats = stats
+        self.threads = threads
+    
+    @staticmethod
+    def available():
+        return bool(FFMPEG_PATH)
+    
+    def _run(self, cmd):
+        return subprocess.run(cmd, capture_output=True, timeout=60,
+                              creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+    
+    def probe(self, video_path):
+        """以 ffmpeg -i 的輸出解析影片資訊（不需要 ffprobe），回傳 (None, info)"""
+        result = self._run([FFMPEG_PATH, '-hide_banner', '-nostdin', '-i', video_path])
+        log = result.stderr.decode('utf-8', 'replace')
+        stream = re.search(r'Stream #\S+.*?: Video: (\w+).*', log)
+        size = stream and re.search(r', (\d+)x(\d+)', stream.group(0))
+        if not size:
+            raise Exception("無法開啟影片")
+        rate = re.search(r'([\d.]+)k? fps', stream.group(0)) or re.search(r'([\d.]+)k? tbr', stream.group(0))
+        fps = float(rate.group(1)) if rate else 0.0
+        match = re.search(r'Duration: (\d+):(\d+):([\d.]+)', log)
+        duration = int(match.group(1)) * 3600 + int(match.group(2)) * 60 + float(match.group(3)) if match else 0.0
+        info = {
+            'fps': fps,
+            'frame_count': int(round(duration * fps)),
+            'duration': duration,
+            'width': int(size.group(1)),
+            'height': int(size.group(2)),
+            'codec': stream.group(1),
+            'decoder': self.name,
+        }
+        return None, info
+    
+    def read_frame(self, video_path, info, target_time, keyframe, decode_width=None, cap=None):
+        """讀取指定時間的畫面，回傳 (frame, 實際時間, None)；ffmpeg 失敗時拋出例外"""
+        lowres = 0
+        if decode_width:
+            while lowres < MAX_LOWRES and info['width'] >> (lowres + 1) >= decode_width:
+                lowres += 1
+        
+        cmd = [FFMPEG_PATH, '-hide_banner', '-nostdin', '-loglevel', 'verbose']
+        if self.threads:
+            cmd += ['-threads', str(self.threads)]
+        if lowres:
+            cmd += ['-lowres', str(lowres)]
+        filters = 'showinfo'
+        if decode_width:
+            filters += rf",scale=w=min(iw\,{decode_width}):h=-2:flags=area"
+        if keyframe:
+            cmd += ['-skip_frame', 'nokey', '-noaccurate_seek']
+        cmd += [
+            '-ss', f"{target_time:.3f}", '-copyts',
+            '-i', video_path,
+            '-map', '0:v:0', '-frames:v', '1', '-vf', filters,
+            '-f', 'image2pipe', '-c:v', 'bmp', 'pipe:1',
+        ]
+        with self.stats.stage('keyframe' if keyframe else 'decode'):
+            result = self._run(cmd)
+        if result.returncode != 0 or not result.stdout:
+            raise Exception("ffmpeg 擷取失敗")
+        
+        frame = cv2.imdecode(np.frombuffer(result.stdout, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise Exception("ffmpeg 輸出無法解碼")
+        
+        # showinfo 會在 stderr 列出實際畫面的時間戳（-copyts 保留原始時間戳，須扣掉容器的起始時間）；
+        # verbose 等級另外列出輸入端實際讀取的位元組數
+        log = result.stderr.decode('utf-8', 'replace')
+        match = re.search(r'\bn:\s*0\s+pts:\s*-?\d+\s+pts_time:\s*(-?[\d.]+)', log)
+        start = re.search(r'Duration: .*?, start: (-?[\d.]+)', log)
+        actual_time = float(match.group(1)) - (float(start.group(1)) if start else 0) if match else target_time
+        match = re.search(r'Statistics: (\d+) bytes read', log)
+        if match:
+            self.stats.add_bytes(read=int(match.group(1)))
+        return frame, actual_time, None
+
+
+# 解碼後端名稱 → 類別（自動模式依副檔名與解碼測試結果選擇）
+DECODER_CLASSES = {decoder.name: decoder for decoder in (OpenCVDecoder, PyAVDecoder, FFmpegDecoder)}
+
+
+def _decode_worker_main(conn, base_dir):
+    """解碼子程序主迴圈：接收 (影片路徑, 選項)，回傳編碼後的縮圖、截取時間、日誌與階段耗時"""
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C 由主程序處理
+    logs = []
+    engine = ThumbnailEngine.decoder(base_dir, log=lambda message, level='info': logs.append((message, level)))
+    try:
+        while True:
+            try:
+                task = conn.recv()
+            except EOFError:
+                break
+            if task is None:
+                break
+            video_path, options = task
+            del logs[:]
+            record = engine.stats.begin(video_path)
+            try:
+                frame, actual_time, seek_offset = engine._extract_frame(video_path, options)
+                sheet = engine._extract_contact_sheet(video_path, options)
+                preview = engine._extract_preview(video_path, actual_time, options)
+                outputs = engine._render_thumbnail(frame, options['resize_quality'], options['renditions'], sheet, preview)
+                result = {'outputs': outputs, 'actual_time': actual_time, 'seek_offset': seek_offset}
+            except Exception as e:
+                result = {'error': str(e)}
+            result.update(logs=list(logs), stages=record['stages'], bytes_read=record['bytes_read'])
+            conn.send(result)
+    finally:
+        engine.close()
+
+
+class DecodeWorker:
+    """解碼子程序：擷取畫面並編碼，回傳縮圖位元組；逾時或子程序異常結束時只讓該影片失敗，下次使用時重新啟動"""
+    
+    def __init__(self, base_dir, timeout):
+        self.base_dir = base_dir
+        self.timeout = timeout
+        self.process = None
+        self.conn = None
+    
+    def _start(self):
+        # spawn：與 Windows 相同的啟動方式，子程序不繼承主程序的執行緒與連線
+        context = multiprocessing.get_context('spawn')
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_decode_worker_main, args=(child_conn, self.base_dir), daemon=True)
+        self.process.start()
+        child_conn.close()
+    
+    def run(self, video_path, options):
+        """在子程序處理一部影片，回傳結果 dict；失敗、逾時或子程序當掉時拋出例外"""
+        if self.process is None or not self.process.is_alive():
+            self._start()
+        try:
+            self.conn.send((video_path, options))
+            ready = self.conn.poll(self.timeout)
+        except OSError:
+            ready = False
+        if not ready:
+            self.kill()
+            raise Exception(f"解碼逾時（{self.timeout:g} 秒），已重新啟動解碼程序")
+        try:
+            result = self.conn.recv()
+        except (EOFError, OSError):
+            self.process.join(1)
+            exitcode = self.process.exitcode
+            self.kill()
+            raise Exception(f"解碼程序異常結束（代碼 {exitcode}），已重新啟動解碼程序")
+        return result
+    
+    def kill(self):
+        """強制結束子程序（卡住或當掉）"""
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+            self.process = None
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+    
+    def close(self):
+        if self.process is not None and self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.process.join(5)
+        self.kill()
+
+
+class ThumbnailPipeline:
+    """分段處理管線：擷取畫面 → 縮放與編碼 → 寫入或上傳
+    
+    各段有獨立的執行緒數，以有界佇列相連：下游較慢時上游會等待（背壓），記憶體中的完整畫面數量有上限。
+    SSH 模式的輸出段即為 SFTPUploader 的上傳佇列。
+    """
+    
+    def __init__(self, engine, output_mode, options, extract_workers, transform_workers, output_workers):
+        self.engine = engine
+        self.output_mode = output_mode
+        self.options = options
+        self.extract_queue = queue.Queue(maxsize=extract_workers)
+        self.transform_queue = queue.Queue(maxsize=transform_workers)  # 每個項目都是一張原始解析度的畫面
+        self.output_queue = queue.Queue(maxsize=output_workers * 4)
+        
+        # 獨立程序解碼：每個擷取執行緒使用自己的解碼子程序（擷取與縮放編碼都在子程序完成）
+        self.decoders = [] if options['process_decode'] else None
+        self.decoder_local = threading.local()
+        self.decoder_lock = threading.Lock()
+        
+        self.stages = [(self.extract_queue, self._extract, extract_workers),
+                       (self.transform_queue, self._transform, transform_workers)]
+        if output_mode != 'synology_ssh':
+            self.stages.append((self.output_queue, self._output, output_workers))
+        self.threads = []
+        for stage_queue, handler, count in self.stages:
+            threads = [threading.Thread(target=self._run, args=(stage_queue, handler), daemon=True)
+                       for _ in range(count)]
+            for thread in threads:
+                thread.start()
+            self.threads.append(threads)
+    
+    def submit(self, video_path, block=True):
+        """排入一部影片，回傳 Future（結果為 'success' / 'skip' / 'fail'，已停止則為 None）
+        佇列已滿時等待；block=False 時不等待，回傳 None"""
+        job = {'video_path': video_path, 'future': Future(), 'record': None}
+        try:
+            self.extract_queue.put(job, block=block)
+        except queue.Full:
+            return None
+        return job['future']
+    
+    def close(self):
+        """由上游往下游依序關閉，確保已排入的工作都交給下一段"""
+        for (stage_queue, handler, count), threads in zip(self.stages, self.threads):
+            for _ in threads:
+                stage_queue.put(None)
+            for thread in threads:
+                thread.join()
+        for decoder in self.decoders or []:
+            decoder.close()
+    
+    def _run(self, stage_queue, handler):
+        while True:
+            job = stage_queue.get()
+            if job is None:
+                break
+            try:
+                with self.engine.stats.track(job['record']):
+                    handler(job)
+            except Exception as e:
+                if not job['future'].done():
+                    self._finish(job, 'fail', error=e)
+    
+    def _extract(self, job):
+        """第一段：確認是否需要產生，並讀取畫面（NAS 端產生與 cProfile 取樣在此段完成整個流程）"""
+        engine = self.engine
+        engine.pause_event.wait()
+        if engine.stop_flag:
+            job['future'].set_result(None)  # 已停止，未處理
+            return
+        
+        video_path = job['video_path']
+        job['record'] = engine.stats.begin(video_path)
+        if engine._should_skip(video_path, self.output_mode, self.options):
+            self._finish(job, 'skip')
+        elif self.options['remote_exec']:
+            self._finish(job, 'success', seek_offset=engine._generate_remote(video_path, self.options))
+        elif self.options['profile_output'] and engine.stats.claim_profile():
+            self._finish(job, 'success', seek_offset=engine._generate_profiled(video_path, self.output_mode, self.options))
+        elif self.decoders is not None:
+            self._decode_in_process(job)
+        else:
+            job['frame'], job['actual_time'], job['seek_offset'] = engine._extract_frame(video_path, self.options)
+            job['sheet'] = engine._extract_contact_sheet(video_path, self.options)
+            job['preview'] = engine._extract_preview(video_path, job['actual_time'], self.options)
+            self.transform_queue.put(job)
+    
+    def _decode_in_process(self, job):
+        """在此執行緒的解碼子程序擷取並編碼，完成後直接交給輸出段"""
+        decoder = getattr(self.decoder_local, 'decoder', None)
+        if decoder is None:
+            decoder = DecodeWorker(self.engine.base_dir, self.options['decode_timeout'])
+            self.decoder_local.decoder = decoder
+            with self.decoder_lock:
+                self.decoders.append(decoder)
+        
+        result = decoder.run(job['video_path'], self.options)
+        for message, level in result['logs']:
+            self.engine._log(message, level)
+        for name, seconds in result['stages'].items():
+            self.engine.stats.add_stage(job['record'], name, seconds)
+        self.engine.stats.add_bytes(read=result['bytes_read'])
+        if 'error' in result:
+            raise Exception(result['error'])
+        
+        self.engine.stats.add_bytes(written=sum(len(data) for rendition, data in result['outputs']))
+        job['outputs'], job['actual_time'], job['seek_offset'] = result['outputs'], result['actual_time'], result['seek_offset']
+        self._dispatch(job)
+    
+    def _transform(self, job):
+        """第二段：縮放與編碼；SSH 模式直接排入上傳佇列"""
+        job['outputs'] = self.engine._render_thumbnail(job.pop('frame'), self.options['resize_quality'],
+                                                       self.options['renditions'], job.pop('sheet'), job.pop('preview'))
+        self._dispatch(job)
+    
+    def _dispatch(self, job):
+        """將已編碼的縮圖交給輸出段：本機模式排入寫入佇列，SSH 模式排入上傳佇列"""
+        if self.output_mode != 'synology_ssh':
+            self.output_queue.put(job)
+            return
+        
+        started = time.perf_counter()
+        future = self.engine._store_thumbnail(job['video_path'], self.output_mode, job['outputs'])
+        future.add_done_callback(lambda f: self._uploaded(job, f, started))
+    
+    def _uploaded(self, job, future, started):
+        """上傳完成（於上傳執行緒中呼叫）"""
+        self.engine.stats.add_stage(job['record'], 'upload', time.perf_counter() - started)
+        try:
+            future.result()
+            self._complete(job)
+        except Exception as e:
+            self._finish(job, 'fail', error=e)
+    
+    def _output(self, job):
+        """第三段：寫入本機檔案"""
+        with self.engine.stats.stage('write'):
+            self.engine._store_thumbnail(job['video_path'], self.output_mode, job['outputs'])
+        self._complete(job)
+    
+    def _complete(self, job):
+        self.engine._record_thumbnail(job['video_path'], job['actual_time'], job['outputs'], self.options)
+        self._finish(job, 'success', seek_offset=job['seek_offset'])
+    
+    def _finish(self, job, status, seek_offset=None, error=None):
+        self.engine._report_video(job['video_path'], status, seek_offset, error)
+        if job['record'] is not None:
+            self.engine.stats.end(job['record'], status)
+        job['future'].set_result(status)
+
+
+class SSHConnectionError(Exception):
+    """SSH 連線失敗"""
+
+
+class ThumbnailEngine:
+    """縮圖處理核心：掃描、產生與清除縮圖（不依賴 GUI，供 GUI 與命令列共用）"""
+    
+    def __init__(self, base_dir, log=None, progress=None, file_done=None):
+        self.base_dir = base_dir
+        self.log_callback = log              # (message, level)
+        self.progress_callback = progress    # (done, total)
+        self.file_done_callback = file_done  # (video_path, status)
+        self.config = dict(DEFAULT_CONFIG)
+        self.renditions = DEFAULT_RENDITIONS  # 目前的輸出規格（處理與清除時由設定載入）
+        
+        # 處理記錄（避免重複跳過檢查；每部影片完成時立即寫入，舊版 JSON 記錄自動匯入）
+        self.processed_videos = HistoryStore(os.path.join(self.base_dir, 'history.db'),
+                                             legacy_file=os.path.join(self.base_dir, 'processed_videos.json'))
+        
+        # 處理檢查點（中斷後從停止處繼續、只重試失敗的影片）
+        self.checkpoint = JobCheckpoint(os.path.join(self.base_dir, 'history.db'))
+        
+        # 影片探測快取（fps、長度、解析度等，避免重複開檔探測）
+        self.probe_cache = ProbeCache(os.path.join(self.base_dir, 'probe_cache.db'))
+        
+        # 目錄清單快取（增量掃描）
+        self.scanner = FolderScanner(os.path.join(self.base_dir, 'scan_cache.json'))
+        
+        # 控制狀態
+        self.is_paused = False
+        self.pause_event = threading.Event()
+        self.pause_event.set()
+        self.stop_flag = False
+        
+        self.sftp_client = None
+        self.ssh_client = None
+        self.ssh_params = None
+        self.uploader = None
+        self.sftp_lock = threading.Lock()  # 多執行緒共用同一個 SFTP 通道
+        
+        # 遠端已存在縮圖的索引（每次處理前批次建立，取代逐一 stat）
+        self.remote_thumbnails = set()
+        self.remote_indexed_dirs = set()
+        self.remote_dirs = set()  # 已確認存在的遠端目錄（連線中斷時清除）
+        self.remote_clear_shell = True  # 清除時可在 NAS 上執行刪除指令（失敗後改用 SFTP）
+        
+        # 逐檔階段耗時（每次處理重新建立）
+        self.stats = RunStats()
+    
+    @classmethod
+    def decoder(cls, base_dir, log=None):
+        """只含擷取與編碼所需狀態的核心（解碼子程序用，不開啟處理記錄、檢查點與掃描快取）"""
+        engine = cls.__new__(cls)
+        engine.base_dir = base_dir
+        engine.log_callback = log
+        engine.probe_cache = ProbeCache(os.path.join(base_dir, 'probe_cache.db'))
+        engine.stats = RunStats()
+        return engine
+    
+    def _log(self, message, level='info'):
+        if self.log_callback:
+            self.log_callback(message, level)
+    
+    def close(self):
+        if hasattr(self, 'checkpoint'):
+            self.checkpoint.close()
+            self.processed_videos.close()
+        self.probe_cache.close()
+    
+    # ---- 控制 ----
+    
+    def pause(self):
+        self.is_paused = True
+        self.pause_event.clear()
+    
+    def resume(self):
+        self.is_paused = False
+        self.pause_event.set()
+    
+    def stop(self):
+        self.stop_flag = True
+        self.pause_event.set()
+    
+    def _reset_control(self):
+        self.is_paused = False
+        self.stop_flag = False
+        self.pause_event.set()
+    
+    # ---- 掃描 ----
+    
+    def scan(self, folders, on_progress=None):
+        """增量掃描多個資料夾，回傳 {資料夾: 影片清單}；on_progress(已找到數量)"""
+        found = {}
+        for folder in folders:
+            done_count = sum(len(videos) for videos in found.values())
+            progress = (lambda count, base=done_count: on_progress(base + count)) if on_progress else None
+            found[folder] = self.scanner.scan(folder, progress)
+        self.scanner.save()
+        return found
+    
+    # ---- SSH ----
+    
+    def connect_ssh(self):
+        if not HAS_PARAMIKO:
+            raise Exception("未安裝 paramiko 庫")
+        
+        host = self.config['ssh_host'].strip()
+        port = int(str(self.config['ssh_port']).strip() or '22')
+        user = self.config['ssh_user'].strip()
+        password = self.config['ssh_password']
+        
+        if not all([host, user, password]):
+            raise Exception("請填寫完整的 SSH 連線資訊")
+        
+        self._log(f"正在連接 SSH: {user}@{host}:{port}", 'info')
+        
+        # 保留連線參數供連線池（背景執行緒）重新連線使用
+        self.ssh_params = {'hostname': host, 'port': port, 'username': user, 'password': password}
+        self.remote_dirs.clear()
+        self.ssh_client, self.sftp_client = open_ssh_session(self.ssh_params)
+        self._log("SSH 連線成功！", 'success')
+    
+    def _open_ssh_session(self):
+        """以目前的連線參數建立一組 SSH/SFTP 工作階段"""
+        return open_ssh_session(self.ssh_params)
+    
+    def _start_uploader(self):
+        """建立 SFTP 連線池與上傳佇列"""
+        try:
+            size = max(1, int(str(self.config['sftp_sessions']).strip()))
+        except ValueError:
+            size = DEFAULT_SFTP_SESSIONS
+        pool = SFTPPool(self._open_ssh_session, size, on_broken=self.remote_dirs.clear)
+        self.uploader = SFTPUploader(pool, self._sftp_makedirs, self._volume_root())
+        self._log(f"📤 SFTP 上傳連線數：{size}", 'info')
+    
+    def disconnect_ssh(self):
+        if self.uploader:
+            self.uploader.close()
+            self.uploader = None
+        self.remote_thumbnails = set()
+        self.remote_indexed_dirs = set()
+        self.remote_dirs.clear()
+        if self.sftp_client:
+            self.sftp_client.close()
+            self.sftp_client = None
+        if self.ssh_client:
+            self.ssh_client.close()
+            self.ssh_client = None
+    
+    def _volume_root(self):
+        """SSH shell 看到的 SFTP 根目錄（Synology SFTP 會 chroot 到 /volumeN）"""
+        return f"/volume{str(self.config['volume_number']).strip() or '1'}"
+    
+    def _local_to_nas_path(self, local_path):
+        """將本機路徑轉換為 NAS SFTP 路徑"""
+        drive = self.config['drive_letter'].strip().upper().rstrip(':')
+        share = self.config['share_folder'].strip()
+        
+        if not drive or not share:
+            raise Exception("請設定磁碟機代號和共享資料夾名稱")
+        
+        # 標準化路徑
+        local_path = os.path.normpath(local_path)
+        
+        # 本機掛載根目錄
+        local_mount = f"{drive}:"
+        
+        # 檢查路徑是否在掛載範圍內
+        if not local_path.upper().startswith(local_mount.upper()):
+            raise Exception(f"路徑不在 {local_mount} 範圍內")
+        
+        # 取得相對路徑（相對於掛載點）
+        relative = local_path[len(local_mount):].lstrip('\\/')
+        
+        # SFTP 路徑格式：直接使用共享資料夾名稱（Synology SFTP 會 chroot 到 /volume1）
+        # 所以路徑是 /ShareName/relative 而不是 /volume1/ShareName/relative
+        if relative:
+            nas_path = f"/{share}/{relative}".replace('\\', '/')
+        else:
+            nas_path = f"/{share}"
+        
+        return nas_path
+    
+    def _sftp_makedirs(self, sftp, remote_path):
+        """遞迴建立遠端目錄（已確認存在的目錄記錄於 remote_dirs，不再重複 stat）"""
+        dirs = []
+        while remote_path and remote_path != '/' and remote_path not in self.remote_dirs:
+            parent = os.path.dirname(remote_path).replace('\\', '/')
+            if parent in self.remote_dirs:
+                dirs.append(remote_path)  # 上層已存在，直接建立
+                break
+            try:
+                sftp.stat(remote_path)
+                self.remote_dirs.add(remote_path)
+                break  # 目錄存在
+            except IOError:
+                dirs.append(remote_path)
+                remote_path = parent
+        
+        for d in reversed(dirs):
+            try:
+                sftp.mkdir(d)
+            except IOError:
+                pass  # 目錄可能已存在或無權限（無權限時後續寫入會回報錯誤）
+            self.remote_dirs.add(d)
+    
+    # ---- 清除縮圖 ----
+    
+    def clear(self, video_files, config, dry_run=False):
+        """清除影片對應的縮圖，回傳 {'cleared', 'files', 'bytes'}（dry_run 時只統計不刪除）；SSH 連線失敗時拋出 SSHConnectionError"""
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self._reset_control()
+        output_mode = self.config['output_mode']
+        self.renditions = self._load_renditions()
+        
+        if output_mode == 'synology_ssh':
+            try:
+                self.connect_ssh()
+            except Exception as e:
+                raise SSHConnectionError(str(e))
+        
+        if dry_run:
+            self._log("🔍 試算模式：只統計縮圖，不刪除", 'info')
+        start = time.monotonic()
+        try:
+            if output_mode == 'synology_ssh':
+                result = self._clear_remote(video_files, dry_run)
+            else:
+                result = self._clear_local(video_files, dry_run)
+        finally:
+            if output_mode == 'synology_ssh':
+                self.disconnect_ssh()
+        
+        action = "可清除" if dry_run else "已清除"
+        self._log(f"🧹 {action} {result['cleared']} 個影片的縮圖（{result['files']} 個檔案，"
+                  f"{result['bytes'] / 1e6:.1f} MB，{time.monotonic() - start:.1f}s）", 'info')
+        return result
+    
+    def _clear_local(self, video_files, dry_run):
+        """本機模式：以執行緒池平行刪除各輸出規格的縮圖檔"""
+        result = {'cleared': 0, 'files': 0, 'bytes': 0}
+        total = len(video_files)
+        
+        def remove(video_path):
+            if self.stop_flag:
+                return None
+            files = size = 0
+            for rendition, thumbnail_path in self._thumbnail_paths(video_path, 'same_folder'):
+                try:
+                    size += os.stat(thumbnail_path).st_size
+                    if not dry_run:
+                        os.remove(thumbnail_path)
+                    files += 1
+                except FileNotFoundError:
+                    pass
+            return files, size
+        
+        workers = self._get_worker_count('output_workers', DEFAULT_OUTPUT_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(remove, video_path): video_path for video_path in video_files}
+            for done, future in enumerate(as_completed(futures), 1):
+                video_path = futures[future]
+                filename = os.path.basename(video_path)
+                try:
+                    removed = future.result()
+                except Exception as e:
+                    self._log(f"✗ 清除失敗 {filename}: {str(e)}", 'error')
+                    removed = None
+                if removed is not None:
+                    files, size = removed
+                    if files:
+                        result['cleared'] += 1
+                        result['files'] += files
+                        result['bytes'] += size
+                        if not dry_run:
+                            self._log(f"🗑️ 已清除: {filename}", 'info')
+                    if not dry_run:
+                        self._forget_video(video_path)
+                
+                if self.progress_callback:
+                    self.progress_callback(done, total)
+        return result
+    
+    def _clear_remote(self, video_files, dry_run):
+        """SSH 模式：每個目錄的 @eaDir 只列出一次，存在的縮圖子資料夾以一個 NAS 指令刪除；各目錄平行使用 SFTP 連線池"""
+        result = {'cleared': 0, 'files': 0, 'bytes': 0}
+        total = len(video_files)
+        video_dirs = {}  # 本機目錄 → 影片路徑
+        for video_path in video_files:
+            video_dirs.setdefault(os.path.dirname(video_path), []).append(video_path)
+        
+        try:
+            size = max(1, int(str(self.config['sftp_sessions']).strip()))
+        except ValueError:
+            size = DEFAULT_SFTP_SESSIONS
+        self.remote_clear_shell = True
+        pool = SFTPPool(self._open_ssh_session, size)
+        done = 0
+        try:
+            with ThreadPoolExecutor(max_workers=size) as executor:
+                futures = {executor.submit(self._clear_eadir, pool, video_dir, videos, dry_run): video_dir
+                           for video_dir, videos in video_dirs.items()}
+                for future in as_completed(futures):
+                    video_dir = futures[future]
+                    videos = video_dirs[video_dir]
+                    try:
+                        cleared = future.result()
+                    except Exception as e:
+                        self._log(f"✗ 清除失敗 {video_dir}: {str(e)}", 'error')
+                        cleared = None
+                    if cleared is not None:
+                        count, files, size = cleared
+                        result['cleared'] += count
+                        result['files'] += files
+                        result['bytes'] += size
+                        if not dry_run:
+                            if count:
+                                self._log(f"🗑️ 已清除: {video_dir}（{count} 個影片）", 'info')
+                            for video_path in videos:
+                                self._forget_video(video_path)
+                    
+                    done += len(videos)
+                    if self.progress_callback:
+                        self.progress_callback(done, total)
+        finally:
+            pool.close()
+        return result
+    
+    def _clear_eadir(self, pool, video_dir, videos, dry_run):
+        """清除一個目錄中影片的 @eaDir 子資料夾，回傳 (影片數, 檔案數, 位元組)；已停止時回傳 None"""
+        if self.stop_flag:
+            return None
+        eadir_path = f"{self._local_to_nas_path(video_dir)}/@eaDir"
+        session = pool.acquire()
+        try:
+            ssh, sftp = session
+            try:
+                subdirs = set(sftp.listdir(eadir_path))
+            except IOError as e:
+                if e.errno == errno.ENOENT:
+                    return 0, 0, 0
+                raise
+            targets = [os.path.basename(video) for video in videos if os.path.basename(video) in subdirs]
+            count = len(targets)
+            files = size = 0
+            
+            # 優先在 NAS 上以指令刪除（每批一次往返）
+            while targets and self.remote_clear_shell:
+                sizes = self._remote_clear_batch(ssh, eadir_path, targets[:REMOTE_CLEAR_BATCH], dry_run)
+                if sizes is None:
+                    if self.remote_clear_shell:
+                        self.remote_clear_shell = False
+                        self._log("NAS 上無法執行刪除指令，改用 SFTP 逐檔刪除", 'warning')
+                    break
+                files += len(sizes)
+                size += sum(sizes)
+                targets = targets[REMOTE_CLEAR_BATCH:]
+            
+            # 無法執行指令時改用 SFTP：列出子資料夾後逐檔刪除
+            for name in targets:
+                folder = f"{eadir_path}/{name}"
+                for attr in sftp.listdir_attr(folder):
+                    files += 1
+                    size += attr.st_size or 0
+                    if not dry_run:
+                        sftp.remove(f"{folder}/{attr.filename}")
+                if not dry_run:
+                    sftp.rmdir(folder)
+            return count, files, size
+        finally:
+            pool.release(session)
+    
+    def _remote_clear_batch(self, ssh, eadir_path, names, dry_run):
+        """在 NAS 上刪除（或試算）一批 @eaDir 子資料夾，回傳各檔案大小；無法執行指令時回傳 None"""
+        args = [self._volume_root() + eadir_path, '1' if dry_run else '0'] + [f"./{name}" for name in names]
+        cmd = f"sh -c {shlex.quote(REMOTE_CLEAR_SCRIPT)} clear " + ' '.join(shlex.quote(arg) for arg in args)
+        try:
+            stdin, stdout, stderr = ssh.exec_command(cmd, timeout=REMOTE_EXEC_TIMEOUT)
+            output = stdout.read().decode('utf-8', 'replace')
+            status = stdout.channel.recv_exit_status()
+        except Exception:
+            return None
+        if status != 0:
+            return None
+        return [int(line) for line in output.split() if line.isdigit()]
+    
+    def _forget_video(self, video_path):
+        """縮圖已清除：從歷史記錄與探測快取的縮圖記錄移除"""
+        self.processed_videos.discard(video_path)
+        self.probe_cache.forget_thumbnail(video_path)
+    
+    # ---- 清理孤立縮圖 ----
+    
+    def sweep_orphans(self, folders, config, dry_run=False):
+        """清除影片刪除或改名後留下的縮圖，並移除處理記錄中已不存在的影片，回傳 {'orphans', 'files', 'pruned'}（dry_run 時只統計）"""
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self._reset_control()
+        output_mode = self.config['output_mode']
+        self.renditions = self._load_renditions()
+        
+        if output_mode == 'synology_ssh':
+            try:
+                self.connect_ssh()
+            except Exception as e:
+                raise SSHConnectionError(str(e))
+        
+        if dry_run:
+            self._log("🔍 試算模式：只列出孤立縮圖，不刪除", 'info')
+        start = time.monotonic()
+        try:
+            # 一次列出所有目錄，以集合差找出影片已不存在的縮圖
+            if output_mode == 'synology_ssh':
+                exists, orphans = self._remote_orphans(folders)
+                stale = [path for path in self._history_under(folders) if self._nas_path_or_none(path) not in exists]
+            else:
+                exists, orphans = self._local_orphans(folders)
+                stale = [path for path in self._history_under(folders) if path not in exists]
+            
+            files = [path for paths in orphans.values() for path in paths]
+            separator = '/' if output_mode == 'synology_ssh' else os.sep
+            for (video_dir, video_name), paths in sorted(orphans.items()):
+                self._log(f"{'🔍' if dry_run else '🗑️'} 孤立縮圖: {video_dir}{separator}{video_name}（{len(paths)} 個檔案）", 'info')
+            if not dry_run and not self.stop_flag:
+                if output_mode == 'synology_ssh':
+                    self._remote_remove(files)
+                else:
+                    self._local_remove(files)
+                for path in stale:
+                    self._forget_video(path)
+        finally:
+            if output_mode == 'synology_ssh':
+                self.disconnect_ssh()
+        
+        action = "找到" if dry_run else "已清除"
+        self._log(f"🧽 {action} {len(orphans)} 個孤立縮圖（{len(files)} 個檔案），"
+                  f"處理記錄{'可' if dry_run else '已'}移除 {len(stale)} 筆（{time.monotonic() - start:.1f}s）", 'info')
+        return {'orphans': len(orphans), 'files': len(files), 'pruned': len(stale)}
+    
+    def _history_under(self, folders):
+        """處理記錄中位於選取資料夾內的影片"""
+        prefixes = tuple(os.path.join(os.path.normpath(folder), '') for folder in folders)
+        return [path for path in self.processed_videos.paths() if os.path.normpath(path).startswith(prefixes)]
+    
+    def _nas_path_or_none(self, local_path):
+        try:
+            return self._local_to_nas_path(local_path)
+        except Exception:
+            return None
+    
+    def _name_patterns(self, key):
+        """各輸出規格檔名樣式的 (前綴, 後綴)，用於由縮圖檔名反推影片名稱"""
+        patterns = []
+        for rendition in self.renditions:
+            if '{name}' in rendition[key]:
+                prefix, suffix = rendition[key].split('{name}', 1)
+                patterns.append((prefix, suffix))
+        return patterns
+    
+    def _local_orphans(self, folders):
+        """本機模式：每個目錄列出一次，回傳 (目前的影片路徑集合, {(目錄, 影片名稱): [孤立縮圖]})"""
+        listing = {}  # 目錄 → 檔名
+        stack = list(folders)
+        while stack and not self.stop_flag:
+            path = stack.pop()
+            names = []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir():
+                                if entry.name != '@eaDir' and not entry.is_symlink():
+                                    stack.append(os.path.join(path, entry.name))
+                            else:
+                                names.append(entry.name)
+                        except OSError:
+                            pass
+            except OSError:
+                continue
+            listing[path] = names
+        
+        videos = {os.path.join(path, name) for path, names in listing.items()
+                  for name in names if os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS}
+        # 處理記錄中已不存在的影片：檔名只是「名稱.副檔名」的縮圖，只有在記錄中產生過才視為孤立（避免誤刪一般圖片）
+        missing = {(os.path.dirname(path), os.path.splitext(os.path.basename(path))[0])
+                   for path in self._history_under(folders) if path not in videos}
+        patterns = self._name_patterns('filename')
+        
+        orphans = {}
+        for path, names in listing.items():
+            stems = {os.path.splitext(name)[0] for name in names if os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS}
+            expected = {rendition['filename'].format(name=stem) for stem in stems for rendition in self.renditions}
+            for name in names:
+                if name in expected:
+                    continue
+                for prefix, suffix in patterns:
+                    if len(name) <= len(prefix) + len(suffix) or not (name.startswith(prefix) and name.endswith(suffix)):
+                        continue
+                    stem = name[len(prefix):len(name) - len(suffix)]
+                    generic = not prefix and suffix.startswith('.') and suffix.count('.') == 1
+                    if stem not in stems and (not generic or (path, stem) in missing):
+                        orphans.setdefault((path, stem), []).append(os.path.join(path, name))
+                        break
+        return videos, orphans
+    
+    def _local_remove(self, paths):
+        """本機模式：以執行緒池平行刪除檔案"""
+        def remove(path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        
+        workers = self._get_worker_count('output_workers', DEFAULT_OUTPUT_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for path, future in zip(paths, [executor.submit(remove, path) for path in paths]):
+                try:
+                    future.result()
+                except OSError as e:
+                    self._log(f"✗ 刪除失敗 {path}: {str(e)}", 'error')
+    
+    def _remote_orphans(self, folders):
+        """SSH 模式：每個資料夾一次遠端 find（無法執行時每個目錄列出一次），回傳 (目前的檔案集合, {(目錄, 影片檔名): [孤立縮圖]})"""
+        files, candidates = set(), []
+        for folder in folders:
+            if self.stop_flag:
+                break
+            nas_root = self._local_to_nas_path(folder)
+            listed = self._remote_find_tree(nas_root)
+            if listed is None:
+                listed = self._sftp_list_tree(nas_root)
+            files.update(listed[0])
+            candidates.extend(listed[1])
+        
+        orphans = {}
+        for path in candidates:
+            video_eadir, thumbnail_name = path.rsplit('/', 1)
+            eadir_path, video_filename = video_eadir.rsplit('/', 1)
+            if not eadir_path.endswith('/@eaDir'):
+                continue
+            video_dir = eadir_path[:-len('/@eaDir')]
+            if f"{video_dir}/{video_filename}" in files:
+                continue
+            video_name = os.path.splitext(video_filename)[0]
+            if thumbnail_name in {rendition['eadir_filename'].format(name=video_name) for rendition in self.renditions}:
+                orphans.setdefault((video_dir, video_filename), []).append(path)
+        return files, orphans
+    
+    def _remote_find_tree(self, nas_root):
+        """透過 SSH exec 列出資料夾內所有檔案（不含 @eaDir）與 @eaDir 內的縮圖，回傳 (檔案集合, 縮圖清單)；無法執行時回傳 None"""
+        volume_root = self._volume_root()
+        names = ' -o '.join(f"-name {shlex.quote(r['eadir_filename'].format(name='*'))}" for r in self.renditions)
+        cmd = (f"find {shlex.quote(volume_root + nas_root)} -type f "
+               f"\\( -path '*/@eaDir/*/*' \\( {names} \\) -o ! -path '*/@eaDir/*' \\) 2>/dev/null")
+        try:
+            stdin, stdout, stderr = self.ssh_client.exec_command(cmd)
+            output = stdout.read().decode('utf-8', 'replace')
+            status = stdout.channel.recv_exit_status()
+        except Exception:
+            return None
+        if status != 0 and not output:
+            return None
+        
+        files, thumbnails = set(), []
+        for line in output.splitlines():
+            if not line.startswith(volume_root + '/'):
+                continue
+            path = line[len(volume_root):]
+            if '/@eaDir/' in path:
+                thumbnails.append(path)
+            else:
+                files.add(path)
+        return files, thumbnails
+    
+    def _sftp_list_tree(self, nas_root):
+        """以 SFTP 每個目錄列出一次；只有影片已不存在的 @eaDir 子資料夾才確認縮圖檔，回傳 (檔案集合, 縮圖清單)"""
+        files, thumbnails = set(), []
+        stack = [nas_root]
+        while stack and not self.stop_flag:
+            path = stack.pop()
+            try:
+                entries = self.sftp_client.listdir_attr(path)
+            except IOError:
+                continue
+            present = {entry.filename for entry in entries}
+            for entry in entries:
+                if S_ISDIR(entry.st_mode or 0):
+                    if entry.filename != '@eaDir':
+                        stack.append(f"{path}/{entry.filename}")
+                else:
+                    files.add(f"{path}/{entry.filename}")
+            if '@eaDir' not in present:
+                continue
+            try:
+                subdirs = self.sftp_client.listdir(f"{path}/@eaDir")
+            except IOError:
+                continue
+            for video_filename in subdirs:
+                if video_filename in present:
+                    continue
+                video_name = os.path.splitext(video_filename)[0]
+                for rendition in self.renditions:
+                    thumbnail_path = f"{path}/@eaDir/{video_filename}/{rendition['eadir_filename'].format(name=video_name)}"
+                    try:
+                        self.sftp_client.stat(thumbnail_path)
+                        thumbnails.append(thumbnail_path)
+                    except IOError:
+                        pass
+        return files, thumbnails
+    
+    def _remote_remove(self, paths):
+        """SSH 模式：批次以 NAS 指令刪除縮圖並移除空的 @eaDir 子資料夾（無法執行指令時改用 SFTP）"""
+        volume_root = self._volume_root()
+        for index in range(0, len(paths), REMOTE_CLEAR_BATCH):
+            batch = paths[index:index + REMOTE_CLEAR_BATCH]
+            dirs = sorted({os.path.dirname(path) for path in batch})
+            cmd = (f"rm -f -- {' '.join(shlex.quote(volume_root + path) for path in batch)}; s=$?; "
+                   f"rmdir -- {' '.join(shlex.quote(volume_root + path) for path in dirs)} 2>/dev/null; exit $s")
+            try:
+                stdin, stdout, stderr = self.ssh_client.exec_command(cmd, timeout=REMOTE_EXEC_TIMEOUT)
+                stdout.read()
+                if stdout.channel.recv_exit_status() == 0:
+                    continue
+            except Exception:
+                pass
+            for path in batch:
+                try:
+                    self.sftp_client.remove(path)
+                except IOError as e:
+                    if e.errno != errno.ENOENT:
+                        self._log(f"✗ 刪除失敗 {path}: {str(e)}", 'error')
+            for path in dirs:
+                try:
+                    self.sftp_client.rmdir(path)
+                except IOError:
+                    pass  # 還有其他檔案（例如 Synology 自己的縮圖）
+    
+    # ---- 產生縮圖 ----
+    
+    def benchmark_decoders(self, video_files, config, samples=DECODER_BENCHMARK_SAMPLES, save=True):
+        """解碼測試：每種副檔名取數部影片，以各個可用的解碼後端探測並讀取中間畫面（快速跳轉與逐幀各一次），
+        選出每種跳轉方式最快且可靠的後端，儲存到 decoder_benchmark.json 供自動模式使用；回傳 {副檔名: 結果}
+        
+        可靠：取樣的影片都能探測與讀取畫面，探測到的長度與其他後端的中位數相差不超過 DECODER_DURATION_TOLERANCE
+        （OpenCV 讀到錯誤的總幀數時長度會明顯不同），且讀到的畫面時間與目標相差不超過 DECODER_SEEK_TOLERANCE
+        """
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self._reset_control()
+        self.stats = RunStats()
+        threads = self._get_decoder_threads()
+        decode_width = self._decode_width('balanced')
+        backends = [name for name, decoder in DECODER_CLASSES.items() if decoder.available()]
+        self._log(f"🧪 解碼測試：{'、'.join(DECODER_BACKENDS[name] for name in backends)}", 'info')
+        
+        by_extension = {}
+        for video_path in sorted(video_files):
+            by_extension.setdefault(os.path.splitext(video_path)[1].lower(), []).append(video_path)
+        
+        results = {}
+        for extension, paths in sorted(by_extension.items()):
+            if self.stop_flag:
+                break
+            picked = paths[::max(1, len(paths) // samples)][:samples]  # 平均分散取樣
+            timings = {name: {'keyframe': [], 'accurate': [], 'failures': 0} for name in backends}
+            for video_path in picked:
+                durations = {}
+                for name in backends:
+                    decoder = self._decoder_backend(name, threads)
+                    # 每種跳轉方式各自探測並開啟影片，計時互不影響（不沿用前一種方式已跳轉過的 cap）
+                    for mode, keyframe in (('keyframe', True), ('accurate', False)):
+                        cap = None
+                        try:
+                            start = time.perf_counter()
+                            cap, info = decoder.probe(video_path)
+                            durations[name] = info['duration']
+                            target_time = info['duration'] / 2
+                            frame, actual_time, cap = decoder.read_frame(video_path, info, target_time, keyframe, decode_width, cap)
+                            if frame is None:
+                                raise Exception("無法讀取幀")
+                            if abs(actual_time - target_time) > DECODER_SEEK_TOLERANCE:
+                                raise Exception("讀到的畫面時間與目標不符")
+                            timings[name][mode].append(time.perf_counter() - start)
+                        except Exception:
+                            timings[name]['failures'] += 1
+                            break
+                        finally:
+                            if cap is not None:
+                                cap.release()
+                if len(durations) > 1:
+                    median = sorted(durations.values())[len(durations) // 2]
+                    for name, duration in durations.items():
+                        if abs(duration - median) > max(1.0, median * DECODER_DURATION_TOLERANCE):
+                            timings[name]['failures'] += 1
+            
+            result = {'files': len(picked), 'backends': {}}
+            for name, timing in timings.items():
+                result['backends'][name] = {
+                    'failures': timing['failures'],
+                    **{f"{mode}_ms": round(sum(timing[mode]) / len(timing[mode]) * 1000, 1)
+                       for mode in ('keyframe', 'accurate') if timing[mode]},
+                }
+            for mode in ('keyframe', 'accurate'):
+                reliable = [name for name, timing in timings.items() if not timing['failures'] and timing[mode]]
+                result[mode] = min(reliable, key=lambda name: result['backends'][name][f"{mode}_ms"]) if reliable else None
+            results[extension] = result
+            
+            unreliable = [DECODER_BACKENDS[name] for name, timing in timings.items() if timing['failures']]
+            summary = '｜'.join(
+                f"{label} → {DECODER_BACKENDS[result[mode]]} {result['backends'][result[mode]][f'{mode}_ms']:.0f}ms"
+                if result[mode] else f"{label} → 無可靠的後端"
+                for mode, label in (('keyframe', '快速跳轉'), ('accurate', '逐幀')))
+            self._log(f"   {extension}（{len(picked)} 部）：{summary}"
+                      + (f"（不可靠：{'、'.join(unreliable)}）" if unreliable else ''), 'info')
+        
+        if save and results:
+            benchmark = self._load_decoder_benchmark()
+            benchmark.update(results)
+            self._save_decoder_benchmark(benchmark)
+            self._log("已儲存解碼測試結果，自動模式將依副檔名使用最快的解碼後端", 'success')
+        return results
+    
+    def _load_decoder_benchmark(self):
+        """讀取解碼測試結果 {副檔名: 結果}，沒有時回傳空 dict"""
+        try:
+            with open(os.path.join(self.base_dir, 'decoder_benchmark.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_decoder_benchmark(self, benchmark):
+        """寫入解碼測試結果（先寫暫存檔再取代，避免中斷時損毀）"""
+        path = os.path.join(self.base_dir, 'decoder_benchmark.json')
+        try:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(benchmark, f, ensure_ascii=False, indent=2)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            self._log(f"無法儲存解碼測試結果: {e}", 'warning')
+    
+    def process(self, video_files, folders, config, resume=False):
+        """產生縮圖，回傳 {'success', 'fail', 'skip', 'total'}；SSH 連線失敗時拋出 SSHConnectionError（resume=True 時沿用上次的檢查點）"""
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self._reset_control()
+        self.stats = RunStats()
+        output_mode = self.config['output_mode']
+        
+        if output_mode == 'synology_ssh':
+            try:
+                self.connect_ssh()
+            except Exception as e:
+                self._log(f"SSH 連線失敗: {str(e)}", 'error')
+                raise SSHConnectionError(str(e))
+        
+        try:
+            return self._process_connected(video_files, folders, resume)
+        finally:
+            if output_mode == 'synology_ssh':
+                self.disconnect_ssh()
+                self._log("SSH 連線已關閉", 'info')
+    
+    def _process_connected(self, video_files, folders, resume):
+        """process() 連線後的部分：建立檢查點並以管線處理所有影片（連線失敗時不留下檢查點）"""
+        output_mode = self.config['output_mode']
+        total = len(video_files)
+        counts = {'success': 0, 'fail': 0, 'skip': 0, 'total': total}
+        
+        if resume:
+            self._log(f"▶️ 從上次中斷處繼續（剩餘 {total} 個）", 'info')
+        else:
+            self.checkpoint.start(video_files, folders, self.config)
+        
+        self.renditions = self._load_renditions()
+        if not FFMPEG_PATH and any('duration' in rendition for rendition in self.renditions):
+            self._log("找不到 ffmpeg，不產生預覽動畫", 'warning')
+            self.renditions = [rendition for rendition in self.renditions if 'duration' not in rendition]
+        
+        # 影響每個檔案處理方式的設定
+        options = {
+            'overwrite': bool(self.config['overwrite']),
+            'capture_time': str(self.config['capture_time']).strip(),
+            'fast_seek': bool(self.config['fast_seek']),
+            'smart_frame': bool(self.config['smart_frame']),
+            'resize_quality': self.config['resize_quality'] if self.config['resize_quality'] in RESIZE_QUALITIES else 'balanced',
+            'renditions': self.renditions,
+            'remote_exec': False,
+            'remote_ffmpeg': str(self.config['remote_ffmpeg']).strip() or 'ffmpeg',
+            'decoder': self._get_decoder(),
+            'decoder_threads': self._get_decoder_threads(),
+            'process_decode': bool(self.config['process_decode']),
+            'decode_timeout': self._get_decode_timeout(),
+            'profile_output': str(self.config['profile_output']).strip(),
+        }
+        options['decoder_map'] = self._decoder_map(options['decoder'], options['fast_seek'])
+        options['signature'] = self._thumbnail_signature(options)
+        workers = self._get_worker_count('worker_count', DEFAULT_WORKERS)
+        transform_workers = self._get_worker_count('transform_workers', DEFAULT_TRANSFORM_WORKERS)
+        output_workers = self._get_worker_count('output_workers', DEFAULT_OUTPUT_WORKERS)
+        
+        if output_mode == 'synology_ssh' and self.config['remote_exec']:
+            version = None
+            if len(self.renditions) > 1 or self.renditions[0]['format'] != 'jpg':
+                self._log("NAS 端產生只支援單一 JPEG 輸出規格，改為本機解碼後上傳", 'warning')
+            elif options['smart_frame']:
+                self._log("NAS 端產生不支援智慧選幀，改為本機解碼後上傳", 'warning')
+            else:
+                version = self._check_remote_ffmpeg(options['remote_ffmpeg'])
+                if not version:
+                    self._log(f"NAS 上無法執行 {options['remote_ffmpeg']}，改為本機解碼後上傳", 'warning')
+            if version:
+                options['remote_exec'] = True
+                workers = min(workers, REMOTE_EXEC_LIMIT)
+                self._log(f"🖥️ NAS 端產生縮圖：{version}", 'info')
+        
+        if output_mode == 'synology_ssh':
+            self._log(f"📍 路徑對應: {self.config['drive_letter']}: → /{self.config['share_folder']}/", 'info')
+        if options['overwrite']:
+            self._log("🔄 覆蓋模式：開啟", 'warning')
+        if options['fast_seek']:
+            engine = "ffmpeg 關鍵幀" if FFMPEG_PATH or options['remote_exec'] else "OpenCV 時間跳轉"
+            self._log(f"⚡ 快速跳轉：開啟（{engine}）", 'info')
+        if not options['remote_exec'] and (options['decoder'] != 'auto' or options['decoder_map']):
+            mapping = '｜'.join(f"{extension} → {DECODER_BACKENDS[name]}" for extension, name in sorted(options['decoder_map'].items()))
+            self._log(f"🎞️ 解碼後端：{DECODER_BACKENDS[options['decoder']]}" + (f"（{mapping}）" if mapping else ''), 'info')
+        if options['smart_frame']:
+            self._log(f"🎯 智慧選幀：開啟（最多 {SMART_FRAME_CANDIDATES} 個候選畫面）", 'info')
+        if not options['remote_exec']:
+            self._log(f"🖼️ 縮放品質：{RESIZE_QUALITIES[options['resize_quality']]}", 'info')
+        if options['process_decode'] and not options['remote_exec']:
+            self._log(f"🛡️ 獨立程序解碼：{workers} 個子程序（每部影片逾時 {options['decode_timeout']:g} 秒）", 'info')
+        if self.renditions != DEFAULT_RENDITIONS:
+            specs = '｜'.join(f"{r['name']} {r['width']}px {r['format']}" + (f" {r['grid']}" if r.get('grid') else '')
+                             + (f" {r['duration']:g}s@{r['fps']}fps" if 'duration' in r else '') for r in self.renditions)
+            self._log(f"🖼️ 輸出規格：{specs}", 'info')
+        if options['remote_exec']:
+            self._log(f"🧵 平行處理：{workers} 個執行緒", 'info')
+        else:
+            output = "SFTP 上傳佇列" if output_mode == 'synology_ssh' else f"寫入 {output_workers}"
+            self._log(f"🧵 平行處理：擷取 {workers}｜縮放編碼 {transform_workers}｜{output}", 'info')
+        
+        if output_mode == 'synology_ssh':
+            if not options['overwrite']:
+                self._build_remote_index(video_files, folders)
+            if not options['remote_exec']:
+                self._start_uploader()
+        
+        # 只保留有限數量的處理中影片（足以填滿各段的執行緒與佇列），避免一次送出數萬個任務
+        videos = iter(video_files)
+        max_pending = (workers + transform_workers + output_workers) * 4
+        done = 0
+        
+        pipeline = ThumbnailPipeline(self, output_mode, options, workers, transform_workers, output_workers)
+        try:
+            pending = {}
+            waiting = None  # 擷取佇列已滿、尚未送出的影片
+            while True:
+                # 不阻塞地送入新影片：本執行緒同時負責記錄檢查點與回報進度，送入時等待會讓回報落後
+                while not self.stop_flag and len(pending) < max_pending:
+                    video_path = waiting or next(videos, None)
+                    waiting = None
+                    if video_path is None:
+                        break
+                    future = pipeline.submit(video_path, block=False)
+                    if future is None:
+                        waiting = video_path
+                        break
+                    pending[future] = video_path
+                
+                if not pending:
+                    break
+                
+                # 有影片等待送入時定期醒來補充擷取佇列
+                finished, _ = wait(pending, timeout=0.05 if waiting else None, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    video_path = pending.pop(future)
+                    result = future.result()
+                    if result is None:
+                        continue  # 已停止，未處理
+                    counts[result] += 1
+                    done += 1
+                    self.checkpoint.mark(video_path, result)
+                    
+                    if self.file_done_callback:
+                        self.file_done_callback(video_path, result)
+                    if self.progress_callback:
+                        self.progress_callback(done, total)
+        finally:
+            pipeline.close()
+        
+        self.checkpoint.finish(stopped=self.stop_flag)
+        if self.stop_flag:
+            self._log(f"已停止，處理了 {done}/{total} 個（下次可從中斷處繼續）", 'warning')
+        
+        self.stats.finish()
+        self._log_stats_summary()
+        
+        self._log(f"處理記錄共 {len(self.processed_videos)} 筆", 'info')
+        
+        return counts
+    
+    def _get_worker_count(self, key, default):
+        """取得各段的執行緒數（未設定或無效值時使用預設值）"""
+        try:
+            return max(1, int(str(self.config.get(key, default)).strip()))
+        except ValueError:
+            return default
+    
+    def _get_decoder(self):
+        """設定的解碼後端（未知或未安裝時改用自動）"""
+        name = str(self.config['decoder']).strip().lower()
+        if name not in DECODER_BACKENDS:
+            self._log(f"未知的解碼後端 {name}，改用自動選擇", 'warning')
+            return 'auto'
+        if name != 'auto' and not DECODER_CLASSES[name].available():
+            self._log(f"無法使用 {DECODER_BACKENDS[name]} 解碼（未安裝），改用自動選擇", 'warning')
+            return 'auto'
+        return name
+    
+    def _get_decoder_threads(self):
+        """PyAV 與 ffmpeg 的解碼執行緒數（0 = 由 ffmpeg 決定；無效值時使用預設值）"""
+        try:
+            return max(0, int(str(self.config['decoder_threads']).strip()))
+        except ValueError:
+            return DEFAULT_DECODER_THREADS
+    
+    def _decoder_map(self, decoder, fast_seek):
+        """各副檔名使用的解碼後端：settings.json 的 decoder_by_extension 優先，
+        自動模式另採用解碼測試（decoder_benchmark.json）中該跳轉方式最快且可靠的後端"""
+        mapping = {}
+        if decoder == 'auto':
+            for extension, result in self._load_decoder_benchmark().items():
+                name = result.get('keyframe' if fast_seek else 'accurate')
+                if name in DECODER_CLASSES and DECODER_CLASSES[name].available():
+                    mapping[extension] = name
+        for extension, name in (self.config.get('decoder_by_extension') or {}).items():
+            extension = '.' + str(extension).lower().lstrip('.')
+            name = str(name).strip().lower()
+            if name == 'auto':
+                mapping.pop(extension, None)
+            elif name in DECODER_CLASSES and DECODER_CLASSES[name].available():
+                mapping[extension] = name
+            else:
+                self._log(f"無法使用 {name} 解碼 {extension}，改用預設解碼後端", 'warning')
+        return mapping
+    
+    def _get_decode_timeout(self):
+        """獨立程序解碼的逾時秒數（無效值時使用預設值）"""
+        try:
+            return max(1.0, float(str(self.config['decode_timeout']).strip()))
+        except ValueError:
+            return float(DEFAULT_DECODE_TIMEOUT)
+    
+    def _load_renditions(self):
+        """由設定讀取輸出規格，無效時使用預設規格"""
+        try:
+            return normalize_renditions(rendition_specs(self.config))
+        except Exception as e:
+            self._log(f"輸出規格無效，使用預設規格: {e}", 'warning')
+            return DEFAULT_RENDITIONS
+    
+    def _thumbnail_signature(self, options):
+        """影響縮圖內容的設定摘要，用於判斷設定變更後是否需要重新產生"""
+        signature = {
+            'capture_time': options['capture_time'],
+            'fast_seek': options['fast_seek'],
+        }
+        # 預設值不寫入摘要，舊版產生的縮圖不會因此全部重新產生
+        if options['smart_frame']:
+            signature['smart_frame'] = True
+        if options['renditions'] != DEFAULT_RENDITIONS:
+            signature['renditions'] = options['renditions']
+        return json.dumps(signature, sort_keys=True)
+    
+    def _should_skip(self, video_path, output_mode, options):
+        """縮圖已存在、截取設定與影片都未變更時回傳 True（非覆蓋模式）"""
+        filename = os.path.basename(video_path)
+        
+        # 截取設定與上次產生時不同，直接重新產生
+        recorded = self.probe_cache.thumbnail_settings(video_path)
+        settings_changed = recorded is not None and recorded != options['signature']
+        if settings_changed and not options['overwrite']:
+            self._log(f"🔁 {filename} (縮圖設定已變更)", 'info')
+        
+        if options['overwrite'] or settings_changed:
+            return False
+        
+        with self.stats.stage('exists'):
+            exists = self._thumbnail_exists(video_path, output_mode)
+        record = self.processed_videos.get(video_path)
+        if record is not None:
+            if exists:
+                if self._source_changed(video_path, output_mode, record):
+                    self._log(f"🔁 {filename} (影片已變更)", 'info')
+                    return False
+                self._log(f"⏭️ {filename} (已處理)", 'info')
+                return True
+            # 縮圖不存在了，從歷史記錄移除
+            self.processed_videos.discard(video_path)
+        elif exists:
+            # 沒有歷史記錄的縮圖（手動放入或舊版產生），比對修改時間後才加入記錄
+            if self._source_changed(video_path, output_mode, None):
+                self._log(f"🔁 {filename} (影片比縮圖新)", 'info')
+                return False
+            self._log(f"⏭️ {filename} (已存在)", 'info')
+            return True
+        return False
+    
+    def _source_changed(self, video_path, output_mode, record):
+        """影片在產生縮圖後被修改或取代時回傳 True：比對記錄的大小與修改時間，本機模式另比對縮圖的修改時間
+        沒有記錄（record 為 None）或舊版記錄沒有來源檔資訊時，未變更才記下目前的大小與修改時間供下次比對"""
+        try:
+            with self.stats.stage('exists'):
+                stat = os.stat(video_path)
+        except OSError:
+            return False
+        size, mtime = record or (None, None)
+        if size is not None and (size != stat.st_size or mtime != stat.st_mtime):
+            return True
+        if output_mode != 'synology_ssh':
+            thumbnail_path = self._thumbnail_paths(video_path, output_mode)[0][1]
+            try:
+                if stat.st_mtime > os.stat(thumbnail_path).st_mtime:
+                    return True
+            except OSError:
+                pass
+        if size is None:
+            self.processed_videos.add(video_path, stat.st_size, stat.st_mtime)
+        return False
+    
+    def _record_source(self, video_path):
+        """加入歷史記錄並記下來源檔目前的大小與修改時間"""
+        try:
+            stat = os.stat(video_path)
+        except OSError:
+            self.processed_videos.add(video_path)
+            return
+        self.processed_videos.add(video_path, stat.st_size, stat.st_mtime)
+    
+    def _report_video(self, video_path, status, seek_offset=None, error=None):
+        """記錄單一影片的處理結果（成功時加入歷史記錄）"""
+        filename = os.path.basename(video_path)
+        if status == 'fail':
+            self._log(f"✗ {filename}: {str(error)}", 'error')
+        elif status == 'success':
+            if seek_offset is None:
+                self._log(f"✓ {filename}", 'success')
+            else:
+                self._log(f"✓ {filename} (跳轉偏差 {seek_offset:+.2f}s)", 'success')
+            # 加入歷史記錄（立即寫入，中斷後不需重新檢查）
+            self._record_source(video_path)
+    
+    def _generate_profiled(self, video_path, output_mode, options):
+        """以 cProfile 分析單一檔案的產生過程，結果存到 profile_output（可用 python -m pstats 檢視）"""
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return self._generate_thumbnail(video_path, output_mode, options)
+        finally:
+            profiler.disable()
+            try:
+                profiler.dump_stats(options['profile_output'])
+                self._log(f"🔬 已儲存 cProfile（{os.path.basename(video_path)}）：{options['profile_output']}", 'info')
+            except OSError as e:
+                self._log(f"儲存 cProfile 失敗: {e}", 'warning')
+    
+    def _log_stats_summary(self):
+        """在日誌輸出各階段耗時摘要"""
+        summary = self.stats.summary()
+        stages = summary['stages']
+        if not stages:
+            return
+        
+        total_ms = sum(stage['total_ms'] for stage in stages.values()) or 1
+        self._log(f"📊 階段耗時（{summary['files']} 個檔案）", 'info')
+        for name, stage in stages.items():
+            self._log(f"   {STAGE_NAMES[name]}：平均 {stage['mean_ms']:.1f}ms｜p50 {stage['p50_ms']:.1f}｜"
+                      f"p95 {stage['p95_ms']:.1f}｜最大 {stage['max_ms']:.1f}（佔 {stage['total_ms'] / total_ms:.0%}）", 'info')
+        
+        io_parts = [f"寫入 {summary['bytes_written'] / 1e6:.1f} MB"]
+        if summary['bytes_read'] is not None:
+            io_parts.insert(0, f"讀取 {summary['bytes_read'] / 1e6:.1f} MB（{summary['bytes_read_files']} 個檔案，ffmpeg 統計）")
+        self._log(f"   {'，'.join(io_parts)}", 'info')
+    
+    def export_stats(self, path):
+        """匯出最近一次處理的統計（.csv 為逐檔明細，其他為 JSON）"""
+        self.stats.export(path)
+    
+    def _build_remote_index(self, video_files, folders):
+        """批次建立遠端縮圖索引：每個選取的資料夾執行一次遠端 find，無法執行指令時改為每個 @eaDir 列出一次"""
+        self.remote_thumbnails = set()
+        self.remote_indexed_dirs = set()
+        
+        video_dirs = {}  # 本機目錄 → 影片檔名
+        for video_path in video_files:
+            video_dirs.setdefault(os.path.dirname(video_path), []).append(os.path.basename(video_path))
+        
+        try:
+            nas_dirs = {video_dir: self._local_to_nas_path(video_dir) for video_dir in video_dirs}
+        except Exception as e:
+            self._log(f"無法建立遠端縮圖索引: {e}", 'warning')
+            return
+        
+        # 影片所在目錄必定存在，上傳時不需再確認
+        self.remote_dirs.update(nas_dirs.values())
+        
+        start = time.monotonic()
+        remaining = dict(video_dirs)
+        for folder in folders:
+            try:
+                found = self._remote_find_thumbnails(self._local_to_nas_path(folder))
+            except Exception:
+                found = None
+            if found is None:
+                break  # 無法執行遠端指令，其餘改用 SFTP 列表
+            self.remote_thumbnails.update(found)
+            
+            folder = os.path.normpath(folder)
+            prefix = os.path.join(folder, '')
+            for video_dir in list(remaining):
+                normalized = os.path.normpath(video_dir)
+                if normalized == folder or normalized.startswith(prefix):
+                    self.remote_indexed_dirs.add(nas_dirs[video_dir])
+                    del remaining[video_dir]
+        
+        for video_dir, filenames in remaining.items():
+            self._index_eadir(nas_dirs[video_dir], filenames)
+        
+        # 已有縮圖的 @eaDir/<影片> 目錄也已存在
+        for thumbnail_path in self.remote_thumbnails:
+            video_eadir = os.path.dirname(thumbnail_path)
+            self.remote_dirs.update((video_eadir, os.path.dirname(video_eadir)))
+        
+        self._log(f"🔎 已建立遠端縮圖索引：{len(self.remote_thumbnails)} 個縮圖 "
+                  f"（{len(self.remote_indexed_dirs)} 個目錄，{time.monotonic() - start:.1f}s）", 'info')
+    
+    def _remote_find_thumbnails(self, nas_root):
+        """透過 SSH exec 在 NAS 上執行 find，回傳 SFTP 路徑集合；無法執行時回傳 None"""
+        # SSH shell 看到的是 /volumeN/共享資料夾，SFTP 則被 chroot 到 /volumeN
+        volume_root = self._volume_root()
+        names = ' -o '.join(f"-name {shlex.quote(r['eadir_filename'].format(name='*'))}" for r in self.renditions)
+        cmd = (f"find {shlex.quote(volume_root + nas_root)} -path '*/@eaDir/*' "
+               f"\\( {names} \\) -type f 2>/dev/null")
+        stdin, stdout, stderr = self.ssh_client.exec_command(cmd)
+        output = stdout.read().decode('utf-8', 'replace')
+        status = stdout.channel.recv_exit_status()
+        if status != 0 and not output:
+            return None
+        
+        found = set()
+        for line in output.splitlines():
+            if line.startswith(volume_root + '/'):
+                found.add(line[len(volume_root):])
+        return found
+    
+    def _index_eadir(self, nas_video_dir, filenames):
+        """列出目錄的 @eaDir 一次；只有存在對應子資料夾的影片才需要確認縮圖檔"""
+        eadir_path = f"{nas_video_dir}/@eaDir"
+        try:
+            subdirs = set(self.sftp_client.listdir(eadir_path))
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                return  # 無法列出（權限等），保留逐一檢查
+            subdirs = set()
+        else:
+            self.remote_dirs.add(eadir_path)
+        
+        for filename in filenames:
+            if filename not in subdirs:
+                continue
+            video_name = os.path.splitext(filename)[0]
+            for rendition in self.renditions:
+                thumbnail_path = f"{eadir_path}/{filename}/{rendition['eadir_filename'].format(name=video_name)}"
+                try:
+                    self.sftp_client.stat(thumbnail_path)
+                    self.remote_thumbnails.add(thumbnail_path)
+                except IOError:
+                    pass
+        self.remote_indexed_dirs.add(nas_video_dir)
+    
+    def _thumbnail_paths(self, video_path, output_mode):
+        """各輸出規格的縮圖路徑，回傳 [(規格, 路徑)]：SSH 模式為 NAS SFTP 路徑，本機模式為影片同目錄"""
+        video_dir = os.path.dirname(video_path)
+        video_filename = os.path.basename(video_path)
+        video_name = os.path.splitext(video_filename)[0]
+        
+        if output_mode == 'synology_ssh':
+            eadir_path = f"{self._local_to_nas_path(video_dir)}/@eaDir/{video_filename}"
+            return [(rendition, f"{eadir_path}/{rendition['eadir_filename'].format(name=video_name)}")
+                    for rendition in self.renditions]
+        return [(rendition, os.path.normpath(os.path.join(video_dir, rendition['filename'].format(name=video_name))))
+                for rendition in self.renditions]
+    
+    def _thumbnail_exists(self, video_path, output_mode):
+        """所有輸出規格的縮圖都存在時回傳 True"""
+        if output_mode == 'synology_ssh':
+            if not self.sftp_client:
+                return False
+            try:
+                nas_video_dir = self._local_to_nas_path(os.path.dirname(video_path))
+                paths = [path for rendition, path in self._thumbnail_paths(video_path, output_mode)]
+                if nas_video_dir in self.remote_indexed_dirs:
+                    return all(path in self.remote_thumbnails for path in paths)
+                with self.sftp_lock:
+                    for path in paths:
+                        self.sftp_client.stat(path)
+                return True
+            except:
+                return False
+        else:
+            return all(os.path.exists(path) for rendition, path in self._thumbnail_paths(video_path, output_mode))
+    
+    def _generate_thumbnail(self, video_path, output_mode, options):
+        """依序執行各階段產生縮圖，快速跳轉模式下回傳實際取得畫面與目標時間的偏差（秒）"""
+        if options['remote_exec']:
+            return self._generate_remote(video_path, options)
+        
+        frame, actual_time, seek_offset = self._extract_frame(video_path, options)
+        sheet = self._extract_contact_sheet(video_path, options)
+        preview = self._extract_preview(video_path, actual_time, options)
+        outputs = self._render_thumbnail(frame, options['resize_quality'], options['renditions'], sheet, preview)
+        stage = 'upload' if output_mode == 'synology_ssh' else 'write'
+        with self.stats.stage(stage):
+            self._store_thumbnail(video_path, output_mode, outputs).result()
+        self._record_thumbnail(video_path, actual_time, outputs, options)
+        return seek_offset
+    
+    def _extract_frame(self, video_path, options):
+        """讀取截取時間的畫面，回傳 (frame, 實際時間, 跳轉偏差或 None)
+        智慧選幀時依序嘗試數個候選時間，以第一個合格的畫面為準（都不合格時取分數最高者）"""
+        probe_decoder, decoder = self._select_decoders(video_path, options)
+        cap, info = self._probe_video(video_path, probe_decoder)
+        duration = info['duration']
+        
+        # 使用設定的截取秒數（空值 = 中間幀）
+        time_str = options['capture_time']
+        if time_str:
+            try:
+                target_sec = float(time_str)
+                target_time = target_sec if duration >= target_sec else duration / 2
+            except ValueError:
+                target_time = duration / 2  # 無效值時用中間幀
+        else:
+            target_time = duration / 2  # 空值時用中間幀
+        
+        candidates = self._frame_candidates(target_time, duration) if options['smart_frame'] else [target_time]
+        best = None  # (分數, frame, 實際時間, 候選時間)
+        try:
+            for candidate in candidates:
+                frame, actual_time, cap = self._read_frame(cap, video_path, info, candidate, decoder, options['fast_seek'],
+                                                           self._decode_width(options['resize_quality'], options['renditions']),
+                                                           options['decoder_threads'])
+                if frame is None:
+                    continue
+                if len(candidates) == 1:
+                    best = (0, frame, actual_time, candidate)
+                    break
+                with self.stats.stage('select'):
+                    score, good = self._score_frame(frame)
+                if best is None or score > best[0]:
+                    best = (score, frame, actual_time, candidate)
+                if good:
+                    break
+        finally:
+            if cap is not None:
+                cap.release()
+        
+        if best is None:
+            raise Exception("無法讀取幀")
+        score, frame, actual_time, candidate = best
+        if candidate != target_time:
+            self._log(f"🎯 {os.path.basename(video_path)}：{target_time:.1f}s 的畫面過暗或空白，改用 {actual_time:.1f}s", 'info')
+        seek_offset = actual_time - candidate if options['fast_seek'] else None
+        return frame, actual_time, seek_offset
+    
+    def _frame_candidates(self, target_time, duration):
+        """智慧選幀的候選時間：先取設定的截取時間，再依 SMART_FRAME_POSITIONS 補足（略過太接近的位置）"""
+        candidates = [target_time]
+        spacing = duration * 0.05
+        for position in SMART_FRAME_POSITIONS:
+            if len(candidates) >= SMART_FRAME_CANDIDATES:
+                break
+            candidate = duration * position
+            if all(abs(candidate - other) > spacing for other in candidates):
+                candidates.append(candidate)
+        return candidates
+    
+    def _score_frame(self, frame):
+        """以間隔取樣的亮度統計評分畫面，回傳 (分數, 是否合格)：黑畫面、過曝、淡入淡出與單色字卡分數低"""
+        step = max(1, frame.shape[1] // FRAME_SAMPLE_WIDTH)
+        luma = frame[::step, ::step].astype(np.float32) @ np.float32([0.114, 0.587, 0.299])  # BGR → 亮度
+        mean = float(luma.mean())
+        contrast = float(luma.std())
+        edges = float(np.abs(np.diff(luma, axis=1)).mean() + np.abs(np.diff(luma, axis=0)).mean())
+        
+        exposed = FRAME_LUMA_RANGE[0] <= mean <= FRAME_LUMA_RANGE[1]
+        score = (contrast + edges) * (1 if exposed else 0.1)
+        return score, exposed and contrast >= FRAME_MIN_CONTRAST and edges >= FRAME_MIN_EDGES
+    
+    def _extract_contact_sheet(self, video_path, options):
+        """產生縮圖表畫布（沒有縮圖表規格時回傳 None）
+        
+        先排定所有截取時間，以同一個 VideoCapture 由前往後讀取：距離近的畫面直接順向解碼，較遠時才往後跳轉，
+        每個畫面讀取後立即縮小寫入預先配置的畫布，記憶體用量固定為一張畫布加一個畫面，與影片長度無關。
+        """
+        rendition = next((r for r in options['renditions'] if r.get('grid')), None)
+        if rendition is None:
+            return None
+        columns, rows = parse_grid(rendition['grid'])
+        
+        with self.stats.stage('sheet'):
+            cap, info = self._probe_video(video_path, self._select_decoders(video_path, options)[0])
+            if cap is None:
+                cap = self._open_capture(video_path)
+            try:
+                fps = info['fps'] or 25
+                count = columns * rows
+                cell_width = rendition['width'] // columns
+                cell_height = max(1, round(cell_width * info['height'] / info['width'])) if info['width'] else cell_width * 9 // 16
+                canvas = np.zeros((cell_height * rows, cell_width * columns, 3), np.uint8)
+                
+                grab_limit = int(fps * CONTACT_SHEET_GRAB_SECONDS)
+                next_frame = 0  # 下一次 read() 會取得的畫面編號
+                filled = 0
+                for index in range(count):
+                    target_frame = int(info['duration'] * (index + 0.5) / count * fps)
+                    gap = target_frame - next_frame
+                    if 0 <= gap <= grab_limit:
+                        for _ in range(gap):
+                            cap.grab()
+                    elif gap > 0:
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, target_frame)
+                    ret, frame = cap.read()
+                    next_frame = max(target_frame, next_frame) + 1
+                    if not ret:
+                        continue  # 留白
+                    
+                    row, column = divmod(index, columns)
+                    canvas[row * cell_height:(row + 1) * cell_height, column * cell_width:(column + 1) * cell_width] = \
+                        cv2.resize(self._halve_frame(frame, cell_width), (cell_width, cell_height), interpolation=cv2.INTER_AREA)
+                    filled += 1
+            finally:
+                cap.release()
+        
+        if not filled:
+            raise Exception("無法讀取縮圖表畫面")
+        return canvas
+    
+    def _extract_preview(self, video_path, capture_time, options):
+        """產生預覽動畫（沒有預覽動畫規格時回傳 None）：取截取時間前後 duration 秒，依 fps 抽幀並縮小後逐幀送入 ffmpeg 編碼"""
+        rendition = next((r for r in options['renditions'] if 'duration' in r), None)
+        if rendition is None:
+            return None
+        
+        with self.stats.stage('preview'):
+            cap, info = self._probe_video(video_path, self._select_decoders(video_path, options)[0])
+            if cap is None:
+                cap = self._open_capture(video_path)
+            try:
+                clip = min(rendition['duration'], info['duration']) or rendition['duration']
+                start = max(0.0, min(capture_time - clip / 2, info['duration'] - clip))
+                width = rendition['width'] - rendition['width'] % 2
+                height = max(2, round(width * info['height'] / info['width'] / 2) * 2) if info['width'] else width * 9 // 16
+                
+                cap.set(cv2.CAP_PROP_POS_MSEC, start * 1000)
+                frames = self._preview_frames(cap, start, start + clip, rendition['fps'], width, height,
+                                              max_grabs=int((info['fps'] or 30) * clip * 2) + 10)
+                return self._encode_animation(frames, rendition, width, height)
+            finally:
+                cap.release()
+    
+    def _preview_frames(self, cap, start, end, fps, width, height, max_grabs):
+        """依 fps 抽取 [start, end) 的畫面並縮小；略過的畫面只 grab 不轉換，一次只保留一個畫面"""
+        interval = 1 / fps
+        next_time = start
+        for _ in range(max_grabs):
+            if not cap.grab():
+                break
+            position = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            if position >= end:
+                break
+            if position + 0.001 < next_time:
+                continue
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            yield cv2.resize(self._halve_frame(frame, width), (width, height), interpolation=cv2.INTER_AREA)
+            while next_time <= position:
+                next_time += interval
+    
+    def _encode_animation(self, frames, rendition, width, height):
+        """將畫面逐幀寫入 ffmpeg 的 stdin 編碼為動畫，回傳位元組（輸出寫到暫存檔，避免 stdin/stdout 互相阻塞）"""
+        args = [arg.format(quality=rendition['quality']) for arg in ANIMATION_FORMATS[rendition['format']]]
+        cmd = [
+            FFMPEG_PATH, '-hide_banner', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f"{width}x{height}", '-r', str(rendition['fps']), '-i', 'pipe:0',
+            *args, 'pipe:1',
+        ]
+        with tempfile.TemporaryFile() as output:
+            process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=output, stderr=subprocess.PIPE,
+                                       creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+            count = 0
+            try:
+                for frame in frames:
+                    process.stdin.write(frame.tobytes())
+                    count += 1
+            except BrokenPipeError:
+                pass  # ffmpeg 已結束，錯誤訊息由下方回報
+            except BaseException:
+                process.kill()
+                process.wait()
+                raise
+            finally:
+                with contextlib.suppress(OSError):
+                    process.stdin.close()
+            error = process.stderr.read().decode('utf-8', 'replace').strip()
+            if process.wait() != 0 or not count:
+                raise Exception(f"預覽動畫編碼失敗: {error.splitlines()[-1] if error else '沒有可用的畫面'}")
+            output.seek(0)
+            return output.read()
+    
+    def _render_thumbnail(self, frame, quality='balanced', renditions=DEFAULT_RENDITIONS, sheet=None, preview=None):
+        """由同一張畫面縮放並編碼所有輸出規格，回傳 [(規格, 位元組)]（順序與規格相同）
+        縮圖表規格直接編碼 sheet，預覽動畫規格使用已編碼的 preview"""
+        resized = {rendition['name']: sheet for rendition in renditions if rendition.get('grid')}
+        with self.stats.stage('resize'):
+            # 由大到小縮放，較小的規格沿用前一個規格已減半的畫面
+            for rendition in sorted(renditions, key=lambda r: r['width'], reverse=True):
+                if rendition.get('grid') or 'duration' in rendition:
+                    continue
+                frame = self._halve_frame(frame, rendition['width'])
+                resized[rendition['name']] = self._resize_frame(frame, quality, rendition['width'])
+        with self.stats.stage('encode'):
+            outputs = [(rendition, preview if 'duration' in rendition else
+                        self._encode_image(resized[rendition['name']], rendition['format'], rendition['quality']))
+                       for rendition in renditions]
+        self.stats.add_bytes(written=sum(len(data) for rendition, data in outputs))
+        return outputs
+    
+    def _store_thumbnail(self, video_path, output_mode, outputs):
+        """寫入所有輸出規格並回傳 Future：本機模式直接寫入（回傳已完成的 Future），SSH 模式交由上傳佇列"""
+        data_by_name = {rendition['name']: data for rendition, data in outputs}
+        paths = [(path, data_by_name[rendition['name']]) for rendition, path in self._thumbnail_paths(video_path, output_mode)]
+        
+        if output_mode == 'synology_ssh':
+            nas_video_dir = self._local_to_nas_path(os.path.dirname(video_path))
+            futures = []
+            for thumbnail_path, data in paths:
+                # 已知不存在的縮圖不需先刪除
+                replace = nas_video_dir not in self.remote_indexed_dirs or thumbnail_path in self.remote_thumbnails
+                future = self.uploader.submit(os.path.dirname(thumbnail_path), thumbnail_path, data, replace)
+                
+                def uploaded(f, thumbnail_path=thumbnail_path):
+                    if f.exception() is None:
+                        self.remote_thumbnails.add(thumbnail_path)
+                
+                future.add_done_callback(uploaded)
+                futures.append(future)
+            return combine_futures(futures)
+        
+        for thumbnail_path, data in paths:
+            with open(thumbnail_path, 'wb') as f:
+                f.write(data)
+        future = Future()
+        future.set_result([thumbnail_path for thumbnail_path, data in paths])
+        return future
+    
+    def _record_thumbnail(self, video_path, actual_time, outputs, options):
+        """記錄主要縮圖的截取時間、內容雜湊與設定"""
+        self.probe_cache.record_thumbnail(video_path, actual_time, hashlib.sha1(outputs[0][1]).hexdigest(),
+                                          options['signature'])
+    
+    def _check_remote_ffmpeg(self, ffmpeg):
+        """確認 NAS 上可執行 ffmpeg，回傳版本資訊；無法執行時回傳 None"""
+        try:
+            stdin, stdout, stderr = self.ssh_client.exec_command(
+                f"{shlex.quote(ffmpeg)} -hide_banner -version 2>/dev/null | head -n 1", timeout=30)
+            output = stdout.read().decode('utf-8', 'replace').strip()
+            stdout.channel.recv_exit_status()
+        except Exception:
+            return None
+        if not output.startswith('ffmpeg'):
+            return None
+        return ' '.join(output.split()[:3])  # ffmpeg version x.y.z
+    
+    def _generate_remote(self, video_path, options):
+        """透過 SSH exec 在 NAS 上以 ffmpeg 產生縮圖並直接寫入 @eaDir，影片不經網路傳輸"""
+        rendition, thumbnail_path = self._thumbnail_paths(video_path, 'synology_ssh')[0]
+        eadir_path = os.path.dirname(thumbnail_path)
+        
+        # 無效的截取秒數與本機模式相同，使用中間幀
+        capture_time = options['capture_time']
+        try:
+            float(capture_time)
+        except ValueError:
+            capture_time = ''
+        
+        volume_root = self._volume_root()
+        nas_video_path = f"{self._local_to_nas_path(os.path.dirname(video_path))}/{os.path.basename(video_path)}"
+        qscale = max(2, min(31, round((100 - rendition['quality']) / 5)))  # JPEG 品質 → ffmpeg -q:v（2 最佳）
+        args = [options['remote_ffmpeg'], volume_root + nas_video_path,
+                volume_root + eadir_path, os.path.basename(thumbnail_path), capture_time,
+                '1' if options['fast_seek'] else '0', str(rendition['width']), str(qscale)]
+        cmd = f"sh -c {shlex.quote(REMOTE_THUMBNAIL_SCRIPT)} thumbnail " + ' '.join(shlex.quote(a) for a in args)
+        
+        with self.stats.stage('remote'):
+            stdin, stdout, stderr = self.ssh_client.exec_command(cmd, timeout=REMOTE_EXEC_TIMEOUT)
+            output = stdout.read().decode('utf-8', 'replace').strip()
+            stdout.channel.recv_exit_status()
+        
+        result = output.splitlines()[-1] if output else ''
+        if not result.startswith('OK '):
+            raise Exception(f"NAS 產生失敗: {result[4:] or '沒有回應'}")
+        _, target_time, actual_time, thumb_hash, size = result.split()
+        target_time, actual_time = float(target_time), float(actual_time)
+        self.stats.add_bytes(written=int(size))
+        
+        self.remote_thumbnails.add(thumbnail_path)
+        self.remote_dirs.update((eadir_path, os.path.dirname(eadir_path)))
+        self.probe_cache.record_thumbnail(video_path, actual_time, thumb_hash, options['signature'])
+        return actual_time - target_time if options['fast_seek'] else None
+    
+    def _halve_frame(self, frame, width):
+        """以 INTER_AREA 每次減半直到寬度小於目標的兩倍（整數倍率有快速路徑且不會產生鋸齒）"""
+        height, frame_width = frame.shape[:2]
+        while frame_width >= width * 2:
+            frame_width, height = frame_width // 2, height // 2
+            frame = cv2.resize(frame, (frame_width, height), interpolation=cv2.INTER_AREA)
+        return frame
+    
+    def _resize_frame(self, frame, quality='balanced', width=THUMBNAIL_WIDTH):
+        """縮放為指定寬度（等比）：先減半到兩倍寬度以內，再依品質縮到最終寬度"""
+        frame = self._halve_frame(frame, width)
+        height, frame_width = frame.shape[:2]
+        new_height = max(1, int(height * (width / frame_width)))
+        return cv2.resize(frame, (width, new_height), interpolation=RESIZE_INTERPOLATION[quality])
+    
+    def _decode_width(self, quality, renditions=DEFAULT_RENDITIONS):
+        """縮減解析度解碼的寬度下限：快速只需最大規格的寬度，其他保留兩倍寬度給最後的縮放"""
+        width = max((rendition['width'] for rendition in renditions if not rendition.get('grid') and 'duration' not in rendition),
+                    default=THUMBNAIL_WIDTH)
+        return width if quality == 'fast' else width * 2
+    
+    def _encode_image(self, image, image_format='jpg', quality=90):
+        """依格式編碼圖片，回傳位元組"""
+        quality_flag = IMAGE_FORMATS[image_format]
+        params = [quality_flag, quality] if quality_flag is not None else []
+        success, encoded = cv2.imencode(f'.{image_format}', image, params)
+        if not success:
+            raise Exception("圖片編碼失敗")
+        return encoded.tobytes()
+    
+    def _open_capture(self, video_path):
+        return OpenCVDecoder.open(video_path)
+    
+    def _decoder_backend(self, name, threads=0):
+        return DECODER_CLASSES[name](self.stats, threads)
+    
+    def _select_decoders(self, video_path, options):
+        """選擇探測與讀取畫面的解碼後端，回傳 (探測用, 讀取用)
+        自動模式沒有解碼測試結果時：UNRELIABLE_SEEK_EXTENSIONS 優先用 PyAV（其次 ffmpeg），
+        其他格式以 OpenCV 探測，快速跳轉時由 ffmpeg 取關鍵幀"""
+        extension = os.path.splitext(video_path)[1].lower()
+        name = options['decoder_map'].get(extension, options['decoder'])
+        if name == 'auto':
+            if extension not in UNRELIABLE_SEEK_EXTENSIONS:
+                return 'opencv', ('ffmpeg' if options['fast_seek'] and FFMPEG_PATH else 'opencv')
+            name = next((name for name in ('pyav', 'ffmpeg') if DECODER_CLASSES[name].available()), 'opencv')
+        return name, name
+    
+    def _probe_video(self, video_path, decoder='opencv'):
+        """取得影片資訊，快取命中（且為同一解碼後端的探測結果）時不開啟影片；回傳 (已開啟的 cap 或 None, info)
+        其他後端無法探測時退回 OpenCV，並記錄失敗的後端，之後不再以它重新探測"""
+        with self.stats.stage('probe'):
+            stat = os.stat(video_path)
+            info = self.probe_cache.get(video_path, stat.st_size, stat.st_mtime)
+            if info is not None and decoder in (info['decoder'], info['failed_decoder']):
+                return None, info
+            
+            try:
+                cap, info = self._decoder_backend(decoder).probe(video_path)
+            except Exception:
+                if decoder == 'opencv':
+                    raise
+                cap, info = self._decoder_backend('opencv').probe(video_path)
+                info['failed_decoder'] = decoder
+        self.probe_cache.put(video_path, stat.st_size, stat.st_mtime, info)
+        return cap, info
+    
+    def _read_frame(self, cap, video_path, info, target_time, decoder, keyframe, decode_width=None, threads=0):
+        """以指定的解碼後端讀取畫面，回傳 (frame 或 None, 實際時間, cap)；其他後端失敗時退回 OpenCV
+        keyframe 時取目標時間前最近的關鍵幀，否則取目標時間的畫面"""
+        if decoder != 'opencv':
+            try:
+                frame, actual_time, _ = self._decoder_backend(decoder, threads).read_frame(
+                    video_path, info, target_time, keyframe, decode_width)
+                if frame is not None:
+                    return frame, actual_time, cap
+            except Exception:
+                pass  # 退回 OpenCV
+        return self._decoder_backend('opencv').read_frame(video_path, info, target_time, keyframe, cap=cap)
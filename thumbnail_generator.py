@@ -1,32 +1,36 @@
 """
 影片縮圖產生器 - Video Thumbnail Generator
-使用 tkinter GUI 和 cv2 處理影片截圖
+使用 tkinter GUI 和 cv2 處理影片截圖（處理核心見 thumbnail_engine.py）
 支援 Synology Video Station @eaDir 縮圖格式（透過 SSH/SFTP）
 """
 
 import os
+import sys
 import json
+import time
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import cv2
 import threading
+import multiprocessing
+import logging
+from collections import deque
 from datetime import datetime
+from logging.handlers import RotatingFileHandler
 
-# SSH/SFTP 支援
-try:
-    import paramiko
-    HAS_PARAMIKO = True
-except ImportError:
-    HAS_PARAMIKO = False
+from thumbnail_engine import (
+    ThumbnailEngine, SSHConnectionError, open_ssh_session,
+    HAS_PARAMIKO, OUTPUT_MODES, RESIZE_QUALITIES, DEFAULT_RENDITIONS, DEFAULT_PREVIEW, DEFAULT_WORKERS, DEFAULT_TRANSFORM_WORKERS, DEFAULT_OUTPUT_WORKERS, DEFAULT_SFTP_SESSIONS,
+    DEFAULT_DECODE_TIMEOUT, DEFAULT_DECODER_THREADS, DECODER_BACKENDS, DECODER_CLASSES,
+)
 
-# 支援的影片格式
-VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.mpeg', '.mpg', '.3gp'}
+# 介面更新：背景執行緒只把事件放進佇列，由主執行緒以固定頻率批次取出
+UI_REFRESH_MS = 100          # 更新間隔（10 Hz）
+LOG_MAX_LINES = 2000         # 日誌區最多保留的行數（完整記錄寫入 log 檔）
+LOG_FILE = 'thumbnail_generator.log'
+LOG_FILE_BYTES = 5 * 1024 * 1024  # log 檔輪替大小
+LOG_FILE_BACKUPS = 3
 
-# 輸出模式
-OUTPUT_MODES = {
-    'same_folder': '與影片同目錄（同名.jpg）',
-    'synology_ssh': 'Synology Video Station（SSH）'
-}
+LOG_LEVELS = {'info': logging.INFO, 'success': logging.INFO, 'warning': logging.WARNING, 'error': logging.ERROR}
 
 # 顏色主題
 COLORS = {
@@ -72,6 +76,8 @@ class ThumbnailGenerator:
                 
         self.selected_folders = []
         self.video_files = []
+        self.folder_videos = {}  # 資料夾 → 掃描到的影片清單
+        self.scan_jobs = 0       # 進行中的背景掃描數
         self.output_mode = tk.StringVar(value='same_folder')
         
         # SSH 設定（簡化版）
@@ -82,49 +88,66 @@ class ThumbnailGenerator:
         self.share_folder_name = tk.StringVar()  # 共享資料夾名稱，例如 "video" 或 "God"
         self.drive_letter = tk.StringVar()        # 磁碟機代號，例如 "Y"
         self.volume_number = tk.StringVar(value='1')  # 儲存空間編號
+        self.sftp_sessions = tk.StringVar(value=str(DEFAULT_SFTP_SESSIONS))  # 上傳連線數
+        self.remote_exec = tk.BooleanVar(value=False)  # 在 NAS 上產生縮圖（影片不經網路傳輸）
+        self.remote_ffmpeg = tk.StringVar(value='ffmpeg')  # NAS 上的 ffmpeg 路徑
         
         # 縮圖設定
         self.capture_time = tk.StringVar(value='')  # 空值 = 使用中間幀
         self.overwrite_mode = tk.BooleanVar(value=False)  # 覆蓋模式
-        
-        # 處理記錄（避免重複跳過檢查）
-        self.history_file = os.path.join(self.base_dir, 'processed_videos.json')
-        self.processed_videos = self._load_history()
+        self.smart_frame = tk.BooleanVar(value=False)  # 智慧選幀（避開黑畫面與空白畫面）
+        self.contact_sheet = tk.StringVar(value='')  # 縮圖表的欄x列（空值 = 不產生）
+        self.preview = tk.StringVar(value='')  # 預覽動畫格式 webp / gif（空值 = 不產生）
+        self.preview_seconds = tk.StringVar(value=str(DEFAULT_PREVIEW['duration']))  # 預覽動畫長度（秒）
+        self.preview_fps = tk.StringVar(value=str(DEFAULT_PREVIEW['fps']))  # 預覽動畫幀率
+        self.preview_width = tk.StringVar(value=str(DEFAULT_PREVIEW['width']))  # 預覽動畫寬度
+        self.worker_count = tk.StringVar(value=str(DEFAULT_WORKERS))  # 平行處理執行緒數（擷取畫面）
+        self.transform_workers = tk.StringVar(value=str(DEFAULT_TRANSFORM_WORKERS))  # 縮放與編碼執行緒數
+        self.output_workers = tk.StringVar(value=str(DEFAULT_OUTPUT_WORKERS))  # 本機寫入與清除執行緒數
+        self.fast_seek = tk.BooleanVar(value=True)  # 快速跳轉（取最近關鍵幀，不逐幀解碼）
+        self.resize_quality = tk.StringVar(value='balanced')  # 縮放品質（fast/balanced/best）
+        self.process_decode = tk.BooleanVar(value=False)  # 獨立程序解碼（影片卡住或當掉不影響主程式）
+        self.decode_timeout = tk.StringVar(value=str(DEFAULT_DECODE_TIMEOUT))  # 每部影片解碼逾時（秒）
+        self.renditions = DEFAULT_RENDITIONS  # 輸出規格（僅能在 settings.json 編輯）
+        self.decoder = tk.StringVar(value='auto')  # 解碼後端（auto/opencv/pyav/ffmpeg）
+        self.decoder_threads = tk.StringVar(value=str(DEFAULT_DECODER_THREADS))  # PyAV 與 ffmpeg 的解碼執行緒數
+        self.decoder_by_extension = {}  # 各副檔名的解碼後端（僅能在 settings.json 編輯）
         
         # 設定檔
         self.settings_file = os.path.join(self.base_dir, 'settings.json')
         
+        # 日誌與進度事件（背景執行緒寫入，主執行緒定時取出；超過上限時捨棄最舊的行）
+        self.log_buffer = deque(maxlen=LOG_MAX_LINES)
+        self.pending_progress = None  # 最新一筆進度 (done, total)，只顯示最後一筆
+        self.file_log = self._open_log_file()
+        
+        # 處理核心（處理記錄、探測快取、掃描快取都由核心管理）
+        self.engine = ThumbnailEngine(self.base_dir, log=self._log, progress=self._on_engine_progress)
+        
         # 控制狀態
         self.is_processing = False
-        self.is_paused = False
-        self.pause_event = threading.Event()
-        self.pause_event.set()
-        self.stop_flag = False
-        
-        self.sftp_client = None
-        self.ssh_client = None
+        self.worker_threads = []  # 背景工作（關閉視窗時等它們結束才關閉資料庫）
+        self.closing = False
         
         self._setup_styles()
         self._setup_ui()
         self._load_settings()  # 載入上次的設定
+        self._refresh_resume_buttons()  # 上次的處理中斷或有失敗時顯示繼續／重試
+        self.root.after(UI_REFRESH_MS, self._drain_events)
     
-    def _load_history(self):
-        """載入已處理影片記錄"""
+    def _open_log_file(self):
+        """完整日誌寫入輪替的 log 檔（無法寫入時只顯示在視窗）"""
+        logger = logging.getLogger('thumbnail_generator')
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
         try:
-            if os.path.exists(self.history_file):
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    return set(json.load(f))
-        except:
+            handler = RotatingFileHandler(os.path.join(self.base_dir, LOG_FILE), maxBytes=LOG_FILE_BYTES,
+                                          backupCount=LOG_FILE_BACKUPS, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+            logger.addHandler(handler)
+        except OSError:
             pass
-        return set()
-    
-    def _save_history(self):
-        """儲存已處理影片記錄"""
-        try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(list(self.processed_videos), f, ensure_ascii=False)
-        except Exception as e:
-            self._log(f"儲存記錄失敗: {e}", 'warning')
+        return logger
     
     def _load_settings(self):
         """載入上次的設定"""
@@ -138,7 +161,27 @@ class ThumbnailGenerator:
                     self.drive_letter.set(settings.get('drive_letter', ''))
                     self.share_folder_name.set(settings.get('share_folder', ''))
                     self.volume_number.set(settings.get('volume_number', '1'))
+                    self.sftp_sessions.set(settings.get('sftp_sessions', str(DEFAULT_SFTP_SESSIONS)))
+                    self.remote_exec.set(settings.get('remote_exec', False))
+                    self.remote_ffmpeg.set(settings.get('remote_ffmpeg', 'ffmpeg'))
                     self.capture_time.set(settings.get('capture_time', ''))
+                    self.smart_frame.set(settings.get('smart_frame', False))
+                    self.contact_sheet.set(settings.get('contact_sheet', ''))
+                    self.preview.set(settings.get('preview', ''))
+                    self.preview_seconds.set(settings.get('preview_seconds', str(DEFAULT_PREVIEW['duration'])))
+                    self.preview_fps.set(settings.get('preview_fps', str(DEFAULT_PREVIEW['fps'])))
+                    self.preview_width.set(settings.get('preview_width', str(DEFAULT_PREVIEW['width'])))
+                    self.worker_count.set(settings.get('worker_count', str(DEFAULT_WORKERS)))
+                    self.transform_workers.set(settings.get('transform_workers', str(DEFAULT_TRANSFORM_WORKERS)))
+                    self.output_workers.set(settings.get('output_workers', str(DEFAULT_OUTPUT_WORKERS)))
+                    self.fast_seek.set(settings.get('fast_seek', True))
+                    self.resize_quality.set(settings.get('resize_quality', 'balanced'))
+                    self.process_decode.set(settings.get('process_decode', False))
+                    self.decode_timeout.set(settings.get('decode_timeout', str(DEFAULT_DECODE_TIMEOUT)))
+                    self.renditions = settings.get('renditions', DEFAULT_RENDITIONS)
+                    self.decoder.set(settings.get('decoder', 'auto'))
+                    self.decoder_threads.set(settings.get('decoder_threads', str(DEFAULT_DECODER_THREADS)))
+                    self.decoder_by_extension = settings.get('decoder_by_extension', {})
                     # 載入選擇的資料夾
                     folders = settings.get('folders', [])
                     for folder in folders:
@@ -161,7 +204,27 @@ class ThumbnailGenerator:
                 'drive_letter': self.drive_letter.get(),
                 'share_folder': self.share_folder_name.get(),
                 'volume_number': self.volume_number.get(),
+                'sftp_sessions': self.sftp_sessions.get(),
+                'remote_exec': self.remote_exec.get(),
+                'remote_ffmpeg': self.remote_ffmpeg.get(),
                 'capture_time': self.capture_time.get(),
+                'smart_frame': self.smart_frame.get(),
+                'contact_sheet': self.contact_sheet.get(),
+                'preview': self.preview.get(),
+                'preview_seconds': self.preview_seconds.get(),
+                'preview_fps': self.preview_fps.get(),
+                'preview_width': self.preview_width.get(),
+                'worker_count': self.worker_count.get(),
+                'transform_workers': self.transform_workers.get(),
+                'output_workers': self.output_workers.get(),
+                'fast_seek': self.fast_seek.get(),
+                'resize_quality': self.resize_quality.get(),
+                'process_decode': self.process_decode.get(),
+                'decode_timeout': self.decode_timeout.get(),
+                'renditions': self.renditions,
+                'decoder': self.decoder.get(),
+                'decoder_threads': self.decoder_threads.get(),
+                'decoder_by_extension': self.decoder_by_extension,
                 'folders': self.selected_folders
             }
             with open(self.settings_file, 'w', encoding='utf-8') as f:
@@ -175,10 +238,32 @@ class ThumbnailGenerator:
         messagebox.showinfo("成功", "設定已儲存！")
         
     def _on_closing(self):
-        """當視窗關閉時自動儲存"""
+        """當視窗關閉時自動儲存；背景工作仍在執行時先要求停止，等它結束後才關閉"""
+        if self.closing:
+            return
+        self.closing = True
         self._save_settings()
+        self.engine.stop()
+        if any(thread.is_alive() for thread in self.worker_threads):
+            self._log("正在停止，目前的工作結束後自動關閉視窗...", 'warning')
+        self._close_when_idle()
+    
+    def _close_when_idle(self):
+        """背景工作結束後才關閉處理核心的資料庫並關閉視窗（主執行緒不能 join：工作結束時要以 root.after 回報）"""
+        if any(thread.is_alive() for thread in self.worker_threads):
+            self.root.after(UI_REFRESH_MS, self._close_when_idle)
+            return
+        self.engine.close()
+        for handler in list(self.file_log.handlers):
+            handler.close()
+            self.file_log.removeHandler(handler)
         self.root.destroy()
     
+    def _start_worker(self, thread):
+        """啟動背景工作並記錄下來（關閉視窗時等待）"""
+        self.worker_threads = [worker for worker in self.worker_threads if worker.is_alive()] + [thread]
+        thread.start()
+    
     def _setup_styles(self):
         style = ttk.Style()
         style.theme_use('clam')
@@ -299,6 +384,103 @@ class ThumbnailGenerator:
                        activebackground=COLORS['bg'], activeforeground=COLORS['text'],
                        font=('Segoe UI', 9)).pack(side=tk.LEFT)
         
+        # 智慧選幀
+        tk.Checkbutton(settings_frame, text="🎯 智慧選幀（避開黑畫面）", variable=self.smart_frame,
+                       bg=COLORS['bg'], fg=COLORS['text'], selectcolor=COLORS['listbox_bg'],
+                       activebackground=COLORS['bg'], activeforeground=COLORS['text'],
+                       font=('Segoe UI', 9)).pack(side=tk.LEFT, padx=(10,0))
+        
+        # 縮圖表
+        tk.Label(settings_frame, text="🎞️ 縮圖表：", bg=COLORS['bg'], fg=COLORS['text_dim'], font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=(10,0))
+        tk.Entry(settings_frame, textvariable=self.contact_sheet, width=5, bg=COLORS['listbox_bg'], fg=COLORS['text'], 
+                 insertbackground=COLORS['text'], font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=(5,0))
+        tk.Label(settings_frame, text="（例 4x4）", bg=COLORS['bg'], fg=COLORS['text_dim'], font=('Segoe UI', 9)).pack(side=tk.LEFT, padx=(5,0))
+        
+        # 效能設定區
+        perf_frame = ttk.Frame(main_frame, style='Main.TFrame')
+        perf_frame.pack(fill=tk.X, pady=(0, 8))
+        
+        # 平行處理執行緒數
+        tk.Label(perf_frame, text="🧵 執行緒：", bg=COLORS['bg'], fg=COLORS['text_dim'], font=('Segoe UI', 10)).pack(side=tk.LEFT)
+        tk.Entry(perf_frame, textvariable=self.worker_count, width=3, bg=COLORS['listbox_bg'], fg=COLORS['text'], 
+                 insertbackground=COLORS['text'], font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=(5,0))
+        
+        # 縮放與編碼執行緒數
+        tk.Label(perf_frame, text="🎨 縮放編碼：", bg=COLORS['bg'], fg=COLORS['text_dim'], font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=(15,0))
+        tk.Entry(perf_frame, textvariable=self.transform_workers, width=3, bg=COLORS['listbox_bg'], fg=COLORS['text'], 
+                 insertbackground=COLORS['text'], font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=(5,0))
+        
+        # 本機寫入執行緒數
+        tk.Label(perf_frame, text="💾 寫入：", bg=COLORS['bg'], fg=COLORS['text_dim'], font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=(15,0))
+        tk.Entry(perf_frame, textvariable=self.output_workers, width=3, bg=COLORS['listbox_bg'], fg=COLORS['text'], 
+                 insertbackground=COLORS['text'], font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=(5,0))
+        
+        # 分隔
+        tk.Label(perf_frame, text=" │ ", bg=COLORS['bg'], fg=COLORS['text_dim']).pack(side=tk.LEFT, padx=(10,10))
+        
+        # 快速跳轉
+        tk.Checkbutton(perf_frame, text="⚡ 快速跳轉（最近關鍵幀）", variable=self.fast_seek,
+                       bg=COLORS['bg'], fg=COLORS['text'], selectcolor=COLORS['listbox_bg'],
+                       activebackground=COLORS['bg'], activeforeground=COLORS['text'],
+                       font=('Segoe UI', 9)).pack(side=tk.LEFT)
+        
+        # 縮放品質
+        tk.Label(perf_frame, text="🖼️ 縮放：", bg=COLORS['bg'], fg=COLORS['text_dim'], font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=(15,0))
+        for quality, label in RESIZE_QUALITIES.items():
+            tk.Radiobutton(perf_frame, text=label, variable=self.resize_quality, value=quality,
+                           bg=COLORS['bg'], fg=COLORS['text'], selectcolor=COLORS['listbox_bg'],
+                           activebackground=COLORS['bg'], activeforeground=COLORS['text'],
+                           font=('Segoe UI', 9)).pack(side=tk.LEFT)
+        
+        # 分隔
+        tk.Label(perf_frame, text=" │ ", bg=COLORS['bg'], fg=COLORS['text_dim']).pack(side=tk.LEFT, padx=(10,10))
+        
+        # 獨立程序解碼與逾時
+        tk.Checkbutton(perf_frame, text="🛡️ 獨立程序解碼", variable=self.process_decode,
+                       bg=COLORS['bg'], fg=COLORS['text'], selectcolor=COLORS['listbox_bg'],
+                       activebackground=COLORS['bg'], activeforeground=COLORS['text'],
+                       font=('Segoe UI', 9)).pack(side=tk.LEFT)
+        tk.Label(perf_frame, text="逾時：", bg=COLORS['bg'], fg=COLORS['text_dim'], font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=(5,0))
+        tk.Entry(perf_frame, textvariable=self.decode_timeout, width=4, bg=COLORS['listbox_bg'], fg=COLORS['text'], 
+                 insertbackground=COLORS['text'], font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=(5,0))
+        tk.Label(perf_frame, text="秒", bg=COLORS['bg'], fg=COLORS['text_dim'], font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=(5,0))
+        
+        # 解碼後端設定區
+        decoder_frame = ttk.Frame(main_frame, style='Main.TFrame')
+        decoder_frame.pack(fill=tk.X, pady=(0, 8))
+        
+        tk.Label(decoder_frame, text="🎞️ 解碼：", bg=COLORS['bg'], fg=COLORS['text_dim'], font=('Segoe UI', 10)).pack(side=tk.LEFT)
+        for name, label in DECODER_BACKENDS.items():
+            available = name == 'auto' or DECODER_CLASSES[name].available()
+            tk.Radiobutton(decoder_frame, text=label, variable=self.decoder, value=name,
+                           state=tk.NORMAL if available else tk.DISABLED,
+                           bg=COLORS['bg'], fg=COLORS['text'], selectcolor=COLORS['listbox_bg'],
+                           activebackground=COLORS['bg'], activeforeground=COLORS['text'],
+                           font=('Segoe UI', 9)).pack(side=tk.LEFT)
+        
+        # 解碼執行緒數
+        tk.Label(decoder_frame, text="🧵 解碼執行緒：", bg=COLORS['bg'], fg=COLORS['text_dim'], font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=(15,0))
+        tk.Entry(decoder_frame, textvariable=self.decoder_threads, width=3, bg=COLORS['listbox_bg'], fg=COLORS['text'], 
+                 insertbackground=COLORS['text'], font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=(5,0))
+        tk.Label(decoder_frame, text="（0 = 自動）", bg=COLORS['bg'], fg=COLORS['text_dim'], font=('Segoe UI', 9)).pack(side=tk.LEFT, padx=(5,0))
+        
+        # 預覽動畫設定區
+        preview_frame = ttk.Frame(main_frame, style='Main.TFrame')
+        preview_frame.pack(fill=tk.X, pady=(0, 8))
+        
+        tk.Label(preview_frame, text="🎬 預覽動畫：", bg=COLORS['bg'], fg=COLORS['text_dim'], font=('Segoe UI', 10)).pack(side=tk.LEFT)
+        for value, label in (('', '不產生'), ('webp', 'WebP'), ('gif', 'GIF')):
+            tk.Radiobutton(preview_frame, text=label, variable=self.preview, value=value,
+                           bg=COLORS['bg'], fg=COLORS['text'], selectcolor=COLORS['listbox_bg'],
+                           activebackground=COLORS['bg'], activeforeground=COLORS['text'],
+                           font=('Segoe UI', 9)).pack(side=tk.LEFT)
+        
+        # 預覽動畫長度、幀率、寬度
+        for text, variable in (("秒數：", self.preview_seconds), ("幀率：", self.preview_fps), ("寬度：", self.preview_width)):
+            tk.Label(preview_frame, text=text, bg=COLORS['bg'], fg=COLORS['text_dim'], font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=(15,0))
+            tk.Entry(preview_frame, textvariable=variable, width=4, bg=COLORS['listbox_bg'], fg=COLORS['text'], 
+                     insertbackground=COLORS['text'], font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=(5,0))
+        
         # SSH 設定區（簡化版 - 初始隱藏）
         self.ssh_frame = tk.Frame(main_frame, bg=COLORS['card'], padx=15, pady=12)
         
@@ -340,15 +522,26 @@ class ThumbnailGenerator:
         tk.Label(vol_frame, text="volume", bg=COLORS['card'], fg=COLORS['text']).pack(side=tk.LEFT)
         tk.Entry(vol_frame, textvariable=self.volume_number, width=2, bg=COLORS['listbox_bg'], fg=COLORS['text'], insertbackground=COLORS['text']).pack(side=tk.LEFT)
         
+        # 上傳連線數
+        tk.Label(self.ssh_frame, text="上傳連線數:", bg=COLORS['card'], fg=COLORS['text_dim']).grid(row=6, column=2, sticky='e', padx=(20,5), pady=(8,0))
+        tk.Entry(self.ssh_frame, textvariable=self.sftp_sessions, width=4, bg=COLORS['listbox_bg'], fg=COLORS['text'], insertbackground=COLORS['text']).grid(row=6, column=3, sticky='w', pady=(8,0))
+        
+        # NAS 端產生縮圖
+        tk.Checkbutton(self.ssh_frame, text="🖥️ 在 NAS 上產生縮圖", variable=self.remote_exec,
+                       bg=COLORS['card'], fg=COLORS['text'], selectcolor=COLORS['listbox_bg'],
+                       activebackground=COLORS['card'], activeforeground=COLORS['text']).grid(row=7, column=0, columnspan=2, sticky='w', pady=(8,0))
+        tk.Label(self.ssh_frame, text="NAS ffmpeg:", bg=COLORS['card'], fg=COLORS['text_dim']).grid(row=7, column=2, sticky='e', padx=(20,5), pady=(8,0))
+        tk.Entry(self.ssh_frame, textvariable=self.remote_ffmpeg, width=12, bg=COLORS['listbox_bg'], fg=COLORS['text'], insertbackground=COLORS['text']).grid(row=7, column=3, sticky='w', pady=(8,0))
+        
         # 說明文字
         hint_frame = tk.Frame(self.ssh_frame, bg=COLORS['card'])
-        hint_frame.grid(row=7, column=0, columnspan=4, sticky='w', pady=(12,0))
+        hint_frame.grid(row=8, column=0, columnspan=4, sticky='w', pady=(12,0))
         tk.Label(hint_frame, text="💡 範例: 若 Y: 槽對應 NAS 的「God」資料夾", bg=COLORS['card'], fg=COLORS['text_dim'], font=('Segoe UI', 9)).pack(anchor='w')
         tk.Label(hint_frame, text="     → 磁碟機填 Y，共享資料夾填 God", bg=COLORS['card'], fg=COLORS['success'], font=('Segoe UI', 9)).pack(anchor='w')
         
         # 測試連線與儲存按鈕區
         ssh_btn_frame = tk.Frame(self.ssh_frame, bg=COLORS['card'])
-        ssh_btn_frame.grid(row=8, column=0, columnspan=4, pady=(15,0))
+        ssh_btn_frame.grid(row=9, column=0, columnspan=4, pady=(15,0))
         
         test_btn = tk.Button(ssh_btn_frame, text="🔍 測試連線 (列出共享資料夾)", 
                              bg=COLORS['accent'], fg='white', font=('Segoe UI', 9),
@@ -418,12 +611,31 @@ class ThumbnailGenerator:
         self.clear_thumbnails_btn = ttk.Button(self.control_frame, text="🧹 清除縮圖", 
                                               style='Secondary.TButton', command=self._clear_thumbnails_clicked)
         
+        self.clear_dry_run_btn = ttk.Button(self.control_frame, text="🔍 清除試算", 
+                                             style='Secondary.TButton',
+                                             command=lambda: self._clear_thumbnails_clicked(dry_run=True))
+        
+        self.sweep_orphans_btn = ttk.Button(self.control_frame, text="🧽 孤立縮圖", 
+                                             style='Secondary.TButton', command=self._sweep_orphans_clicked)
+        
+        self.benchmark_btn = ttk.Button(self.control_frame, text="🧪 解碼測試", 
+                                         style='Secondary.TButton', command=self._benchmark_decoders_clicked)
+        
         self.pause_btn = ttk.Button(self.control_frame, text="⏸️ 暫停", 
                                      style='Pause.TButton', command=self._toggle_pause)
         
         self.stop_btn = ttk.Button(self.control_frame, text="⏹️ 停止", 
                                     style='Stop.TButton', command=self._stop_processing)
         
+        # 上次處理的檢查點（中斷後繼續、只重試失敗）
+        self.resume_frame = ttk.Frame(main_frame, style='Main.TFrame')
+        
+        self.resume_btn = ttk.Button(self.resume_frame, text="▶️ 繼續上次", 
+                                      style='Secondary.TButton', command=self._resume_processing)
+        
+        self.retry_btn = ttk.Button(self.resume_frame, text="🔁 重試失敗", 
+                                     style='Secondary.TButton', command=self._retry_failed)
+        
         # 進度區
         self.progress_frame = ttk.Frame(main_frame, style='Main.TFrame')
         
@@ -483,14 +695,31 @@ class ThumbnailGenerator:
             self.ssh_frame.pack_forget()
     
     def _log(self, message, level='info'):
-        def _append():
-            self.log_text.config(state=tk.NORMAL)
-            timestamp = datetime.now().strftime('%H:%M:%S')
-            self.log_text.insert(tk.END, f"[{timestamp}] ", 'time')
-            self.log_text.insert(tk.END, f"{message}\n", level)
-            self.log_text.see(tk.END)
-            self.log_text.config(state=tk.DISABLED)
-        self.root.after(0, _append)
+        """記錄日誌（任何執行緒皆可呼叫）：寫入 log 檔，並放入緩衝區等待主執行緒顯示"""
+        self.file_log.log(LOG_LEVELS.get(level, logging.INFO), message)
+        self.log_buffer.append((datetime.now().strftime('%H:%M:%S'), message, level))
+    
+    def _drain_events(self):
+        """定時取出累積的日誌與進度，一次寫入元件（避免每行、每個檔案各排一個 Tk 事件）"""
+        try:
+            if self.log_buffer:
+                self.log_text.config(state=tk.NORMAL)
+                while self.log_buffer:
+                    timestamp, message, level = self.log_buffer.popleft()
+                    self.log_text.insert(tk.END, f"[{timestamp}] ", 'time')
+                    self.log_text.insert(tk.END, f"{message}\n", level)
+                # 日誌區只保留最後 LOG_MAX_LINES 行
+                lines = int(self.log_text.index('end-1c').split('.')[0]) - 1
+                if lines > LOG_MAX_LINES:
+                    self.log_text.delete('1.0', f"{lines - LOG_MAX_LINES + 1}.0")
+                self.log_text.see(tk.END)
+                self.log_text.config(state=tk.DISABLED)
+            
+            progress, self.pending_progress = self.pending_progress, None
+            if progress is not None:
+                self._update_progress(*progress)
+        finally:
+            self.root.after(UI_REFRESH_MS, self._drain_events)
     
     def _add_folder(self):
         folder = filedialog.askdirectory(title="選擇包含影片的資料夾")
@@ -498,36 +727,75 @@ class ThumbnailGenerator:
             self.selected_folders.append(folder)
             display_path = folder if len(folder) < 70 else f"...{folder[-67:]}"
             self.folder_listbox.insert(tk.END, f"  📁 {display_path}")
-            self._scan_videos()
+            self._scan_videos([folder])  # 只掃描新增的資料夾
             self._log(f"新增資料夾: {folder}", 'info')
     
     def _remove_folder(self):
         selected = self.folder_listbox.curselection()
         for i in reversed(selected):
             self.folder_listbox.delete(i)
-            del self.selected_folders[i]
-        self._scan_videos()
+            folder = self.selected_folders.pop(i)
+            self.folder_videos.pop(folder, None)
+            self.engine.scanner.forget(folder)
+        self._refresh_video_list()
     
     def _clear_folders(self):
         self.folder_listbox.delete(0, tk.END)
+        for folder in self.selected_folders:
+            self.engine.scanner.forget(folder)
         self.selected_folders.clear()
-        self._scan_videos()
+        self.folder_videos.clear()
+        self._refresh_video_list()
     
-    def _scan_videos(self):
-        self.video_files = []
+    def _scan_videos(self, folders=None):
+        """在背景執行緒增量掃描資料夾（預設為全部），掃描進度即時顯示於統計區"""
+        folders = list(self.selected_folders if folders is None else folders)
+        if not folders:
+            self._refresh_video_list()
+            return
         
-        for folder in self.selected_folders:
-            for root, dirs, files in os.walk(folder):
-                dirs[:] = [d for d in dirs if d != '@eaDir']
-                for file in files:
-                    ext = os.path.splitext(file)[1].lower()
-                    if ext in VIDEO_EXTENSIONS:
-                        self.video_files.append(os.path.join(root, file))
+        self.scan_jobs += 1
+        self._refresh_video_list()
+        thread = threading.Thread(target=self._scan_worker, args=(folders,), daemon=True)
+        self._start_worker(thread)
+    
+    def _scan_worker(self, folders):
+        last_update = 0
+        
+        def on_progress(count):
+            nonlocal last_update
+            now = time.monotonic()
+            if now - last_update >= 0.2:  # 限制 UI 更新頻率
+                last_update = now
+                self.root.after(0, self._show_scan_progress, count)
+        
+        found = self.engine.scan(folders, on_progress)
+        self.root.after(0, self._on_scan_done, found)
+    
+    def _show_scan_progress(self, found_count):
+        if self.scan_jobs:
+            self.count_label.config(text=f"🔍 掃描中... 已找到 {len(self.video_files) + found_count} 個影片檔案")
+    
+    def _on_scan_done(self, found):
+        self.scan_jobs -= 1
+        for folder, videos in found.items():
+            if folder in self.selected_folders:  # 掃描期間可能已被移除
+                self.folder_videos[folder] = videos
+        self._refresh_video_list()
+    
+    def _refresh_video_list(self):
+        """依已掃描的結果重建影片清單並更新統計區"""
+        self.video_files = list(dict.fromkeys(
+            video for folder in self.selected_folders for video in self.folder_videos.get(folder, [])))
         
         count = len(self.video_files)
         folder_count = len(self.selected_folders)
         
-        if folder_count == 0:
+        if self.scan_jobs:
+            self.count_label.config(text=f"🔍 掃描中... {folder_count} 個資料夾 · {count} 個影片檔案")
+            if not self.is_processing:
+                self.control_frame.pack_forget()
+        elif folder_count == 0:
             self.count_label.config(text="📂 請新增資料夾以開始")
             self.control_frame.pack_forget()
         elif count > 0:
@@ -536,41 +804,15 @@ class ThumbnailGenerator:
                 self.control_frame.pack(pady=8)
                 self.start_btn.pack(side=tk.LEFT, padx=5)
                 self.clear_thumbnails_btn.pack(side=tk.LEFT, padx=5)
+                self.clear_dry_run_btn.pack(side=tk.LEFT, padx=5)
+                self.sweep_orphans_btn.pack(side=tk.LEFT, padx=5)
+                self.benchmark_btn.pack(side=tk.LEFT, padx=5)
                 self.pause_btn.pack_forget()
                 self.stop_btn.pack_forget()
         else:
             self.count_label.config(text=f"⚠️ 沒有找到影片檔案")
             self.control_frame.pack_forget()
     
-    def _connect_ssh(self):
-        if not HAS_PARAMIKO:
-            raise Exception("未安裝 paramiko 庫")
-        
-        host = self.ssh_host.get().strip()
-        port = int(self.ssh_port.get().strip() or '22')
-        user = self.ssh_user.get().strip()
-        password = self.ssh_password.get()
-        
-        if not all([host, user, password]):
-            raise Exception("請填寫完整的 SSH 連線資訊")
-        
-        self._log(f"正在連接 SSH: {user}@{host}:{port}", 'info')
-        
-        self.ssh_client = paramiko.SSHClient()
-        self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        self.ssh_client.connect(host, port=port, username=user, password=password, timeout=10)
-        
-        self.sftp_client = self.ssh_client.open_sftp()
-        self._log("SSH 連線成功！", 'success')
-    
-    def _disconnect_ssh(self):
-        if self.sftp_client:
-            self.sftp_client.close()
-            self.sftp_client = None
-        if self.ssh_client:
-            self.ssh_client.close()
-            self.ssh_client = None
-    
     def _test_ssh_connection(self):
         """測試 SSH 連線並列出共享資料夾"""
         if not HAS_PARAMIKO:
@@ -590,11 +832,7 @@ class ThumbnailGenerator:
         try:
             self._log(f"測試連接 SSH: {user}@{host}:{port}", 'info')
             
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(host, port=port, username=user, password=password, timeout=10)
-            
-            sftp = ssh.open_sftp()
+            ssh, sftp = open_ssh_session({'hostname': host, 'port': port, 'username': user, 'password': password})
             
             # 先嘗試列出 SFTP 根目錄（普通用戶會被 chroot 到這裡）
             try:
@@ -631,67 +869,58 @@ class ThumbnailGenerator:
             self._log(f"✗ 連線失敗: {str(e)}", 'error')
             messagebox.showerror("連線失敗", str(e))
     
-    def _local_to_nas_path(self, local_path):
-        """將本機路徑轉換為 NAS SFTP 路徑"""
-        drive = self.drive_letter.get().strip().upper().rstrip(':')
-        share = self.share_folder_name.get().strip()
-        
-        if not drive or not share:
-            raise Exception("請設定磁碟機代號和共享資料夾名稱")
-        
-        # 標準化路徑
-        local_path = os.path.normpath(local_path)
-        
-        # 本機掛載根目錄
-        local_mount = f"{drive}:"
-        
-        # 檢查路徑是否在掛載範圍內
-        if not local_path.upper().startswith(local_mount.upper()):
-            raise Exception(f"路徑不在 {local_mount} 範圍內")
-        
-        # 取得相對路徑（相對於掛載點）
-        relative = local_path[len(local_mount):].lstrip('\\/')
-        
-        # SFTP 路徑格式：直接使用共享資料夾名稱（Synology SFTP 會 chroot 到 /volume1）
-        # 所以路徑是 /ShareName/relative 而不是 /volume1/ShareName/relative
-        if relative:
-            nas_path = f"/{share}/{relative}".replace('\\', '/')
-        else:
-            nas_path = f"/{share}"
-        
-        return nas_path
-    
-    def _sftp_makedirs(self, remote_path):
-        """遞迴建立遠端目錄"""
-        dirs = []
-        while remote_path and remote_path != '/':
-            try:
-                self.sftp_client.stat(remote_path)
-                break  # 目錄存在
-            except IOError:
-                dirs.append(remote_path)
-                remote_path = os.path.dirname(remote_path).replace('\\', '/')
-        
-        for d in reversed(dirs):
-            try:
-                self.sftp_client.mkdir(d)
-            except IOError:
-                pass  # 目錄可能已存在或無權限
+    def _build_config(self):
+        """由介面設定建立處理設定（於主執行緒讀取 tk 變數）"""
+        return {
+            'output_mode': self.output_mode.get(),
+            'ssh_host': self.ssh_host.get(),
+            'ssh_port': self.ssh_port.get(),
+            'ssh_user': self.ssh_user.get(),
+            'ssh_password': self.ssh_password.get(),
+            'drive_letter': self.drive_letter.get(),
+            'share_folder': self.share_folder_name.get(),
+            'volume_number': self.volume_number.get(),
+            'sftp_sessions': self.sftp_sessions.get(),
+            'remote_exec': self.remote_exec.get(),
+            'remote_ffmpeg': self.remote_ffmpeg.get(),
+            'capture_time': self.capture_time.get(),
+            'overwrite': self.overwrite_mode.get(),
+            'smart_frame': self.smart_frame.get(),
+            'contact_sheet': self.contact_sheet.get(),
+            'preview': self.preview.get(),
+            'preview_seconds': self.preview_seconds.get(),
+            'preview_fps': self.preview_fps.get(),
+            'preview_width': self.preview_width.get(),
+            'fast_seek': self.fast_seek.get(),
+            'resize_quality': self.resize_quality.get(),
+            'process_decode': self.process_decode.get(),
+            'decode_timeout': self.decode_timeout.get(),
+            'renditions': self.renditions,
+            'decoder': self.decoder.get(),
+            'decoder_threads': self.decoder_threads.get(),
+            'decoder_by_extension': self.decoder_by_extension,
+            'worker_count': self.worker_count.get(),
+            'transform_workers': self.transform_workers.get(),
+            'output_workers': self.output_workers.get(),
+            'profile_output': '',  # 效能分析只在命令列提供
+        }
     
-    def _start_processing(self):
-        if self.output_mode.get() == 'synology_ssh':
+    def _start_processing(self, video_files=None, folders=None, config=None, resume=False):
+        """開始處理（預設為目前的影片清單與介面設定；繼續／重試時由檢查點提供）"""
+        video_files = self.video_files if video_files is None else video_files
+        folders = self.selected_folders if folders is None else folders
+        config = self._build_config() if config is None else config
+        if config['output_mode'] == 'synology_ssh':
             if not HAS_PARAMIKO:
                 messagebox.showerror("錯誤", "未安裝 paramiko 庫！\n請執行: pip install paramiko")
                 return
-            if not all([self.ssh_host.get(), self.ssh_user.get(), self.ssh_password.get(),
-                       self.drive_letter.get(), self.share_folder_name.get()]):
+            if not all([config['ssh_host'], config['ssh_user'], config['ssh_password'],
+                       config['drive_letter'], config['share_folder']]):
                 messagebox.showerror("錯誤", "請填寫完整的 SSH 連線設定和路徑對應！")
                 return
         
         self.is_processing = True
-        self.is_paused = False
-        self.stop_flag = False
-        self.pause_event.set()
+        self.resume_frame.pack_forget()
         
         # 進度歸零
         self.progress_var.set(0)
@@ -708,32 +937,68 @@ class ThumbnailGenerator:
         
         self.progress_frame.pack(pady=8)
         
-        current_mode = self.output_mode.get()
+        current_mode = config['output_mode']
         
-        self._log(f"開始處理 {len(self.video_files)} 個影片", 'success')
+        self._log(f"開始處理 {len(video_files)} 個影片", 'success')
         self._log(f"輸出模式: {OUTPUT_MODES[current_mode]}", 'info')
         
-        thread = threading.Thread(target=self._process_videos, args=(current_mode,), daemon=True)
-        thread.start()
+        thread = threading.Thread(target=self._process_videos, args=(config, video_files, folders, resume), daemon=True)
+        self._start_worker(thread)
+    
+    def _refresh_resume_buttons(self):
+        """依上次處理的檢查點顯示「繼續上次」與「重試失敗」"""
+        job = self.engine.checkpoint.load()
+        remaining = len(job['remaining']) if job and job['state'] != 'finished' else 0
+        failed = len(job['failed']) if job else 0
+        self.resume_btn.pack_forget()
+        self.retry_btn.pack_forget()
+        if remaining:
+            self.resume_btn.config(text=f"▶️ 繼續上次（剩餘 {remaining}/{job['total']} 個）")
+            self.resume_btn.pack(side=tk.LEFT, padx=5)
+        if failed:
+            self.retry_btn.config(text=f"🔁 重試失敗（{failed} 個）")
+            self.retry_btn.pack(side=tk.LEFT, padx=5)
+        if remaining or failed:
+            self.resume_frame.pack(after=self.count_label, pady=3)
+        else:
+            self.resume_frame.pack_forget()
+    
+    def _resume_processing(self):
+        """從上次停止或中斷處繼續（沿用上次的影片清單與設定，不重新掃描）"""
+        job = self.engine.checkpoint.load()
+        if not job or job['state'] == 'finished' or not job['remaining']:
+            self._refresh_resume_buttons()
+            return
+        config = self._build_config()
+        config.update(job['config'])
+        config['ssh_password'] = self.ssh_password.get()  # 檢查點不儲存密碼
+        self._start_processing(job['remaining'], job['folders'], config, resume=True)
+    
+    def _retry_failed(self):
+        """重新處理上次失敗的影片（使用目前的設定）；上次中途停止時一併處理尚未處理的影片"""
+        job = self.engine.checkpoint.load()
+        if not job or not job['failed']:
+            self._refresh_resume_buttons()
+            return
+        if len(job['retry']) > len(job['failed']):
+            self._log(f"🔁 重試 {len(job['failed'])} 個失敗的影片，並繼續 {len(job['retry']) - len(job['failed'])} 個尚未處理的影片", 'info')
+        self._start_processing(job['retry'], job['folders'])
 
-    def _clear_thumbnails_clicked(self):
+    def _clear_thumbnails_clicked(self, dry_run=False):
         if not self.selected_folders:
             messagebox.showwarning("警告", "請先新增資料夾！")
             return
             
-        if not messagebox.askyesno("確認", "確定要清除選取資料夾中的所有縮圖嗎？\n這將會刪除已產生的縮圖檔案。"):
+        if not dry_run and not messagebox.askyesno("確認", "確定要清除選取資料夾中的所有縮圖嗎？\n這將會刪除已產生的縮圖檔案。"):
             return
-            
-        current_mode = self.output_mode.get()
-        if current_mode == 'synology_ssh':
-            try:
-                self._connect_ssh()
-            except Exception as e:
-                messagebox.showerror("錯誤", f"SSH 連線失敗: {str(e)}")
-                return
         
+        self._enter_clear_state("🔍 開始清除試算..." if dry_run else "🧹 開始清除縮圖...")
+        thread = threading.Thread(target=self._process_clear_thumbnails, args=(self._build_config(), dry_run), daemon=True)
+        self._start_worker(thread)
+    
+    def _enter_clear_state(self, message):
+        """清除類工作開始：停用資料夾操作並顯示進度與停止按鈕"""
         self.is_processing = True
-        self.stop_flag = False
         
         # 進度歸零
         self.progress_var.set(0)
@@ -745,73 +1010,110 @@ class ThumbnailGenerator:
         self.clear_btn.config(state=tk.DISABLED)
         self.start_btn.pack_forget()
         self.clear_thumbnails_btn.pack_forget()
+        self.clear_dry_run_btn.pack_forget()
+        self.sweep_orphans_btn.pack_forget()
+        self.benchmark_btn.pack_forget()
+        self.resume_frame.pack_forget()
         self.stop_btn.pack(side=tk.LEFT, padx=5)
         self.progress_frame.pack(pady=8)
         
+        self.log_buffer.clear()  # 尚未顯示的舊日誌一併捨棄
+        self.log_text.config(state=tk.NORMAL)
         self.log_text.delete(1.0, tk.END)
-        self._log(f"🧹 開始清除縮圖...", 'warning')
-        
-        thread = threading.Thread(target=self._process_clear_thumbnails, args=(current_mode,), daemon=True)
-        thread.start()
-
-    def _process_clear_thumbnails(self, output_mode):
-        total = len(self.video_files)
-        success_count = 0
+        self.log_text.config(state=tk.DISABLED)
+        self._log(message, 'warning')
+    
+    def _sweep_orphans_clicked(self, dry_run=True):
+        """清理孤立縮圖：先試算列出，確認後才刪除"""
+        if not self.selected_folders:
+            messagebox.showwarning("警告", "請先新增資料夾！")
+            return
         
-        for i, video_path in enumerate(self.video_files):
-            if self.stop_flag: break
-            
-            filename = os.path.basename(video_path)
-            video_dir = os.path.dirname(video_path)
-            video_name = os.path.splitext(filename)[0]
-            
-            try:
-                if output_mode == 'synology_ssh':
-                    nas_video_dir = self._local_to_nas_path(video_dir)
-                    eadir_path = f"{nas_video_dir}/@eaDir/{filename}"
-                    
-                    # 刪除影片子資料夾
-                    try:
-                        # 先刪除資料夾內的所有檔案
-                        items = self.sftp_client.listdir(eadir_path)
-                        for item in items:
-                            self.sftp_client.remove(f"{eadir_path}/{item}")
-                        self.sftp_client.rmdir(eadir_path)
-                        success_count += 1
-                        self._log(f"🗑️ 已清除: {filename}", 'info')
-                    except IOError:
-                        pass # 可能不存在 @eaDir 子資料夾
-                else:
-                    # 本機模式
-                    thumbnail_path = os.path.normpath(os.path.join(video_dir, f"{video_name}.jpg"))
-                    if os.path.exists(thumbnail_path):
-                        os.remove(thumbnail_path)
-                        success_count += 1
-                        self._log(f"🗑️ 已清除: {filename}", 'info')
-                
-                # 從歷史記錄移除
-                if video_path in self.processed_videos:
-                    self.processed_videos.discard(video_path)
-            except Exception as e:
-                self._log(f"激 清除失敗 {filename}: {str(e)}", 'error')
-                
-            progress = ((i + 1) / total) * 100
-            self.root.after(0, self._update_progress, progress, i + 1, total)
+        self._enter_clear_state("🔍 尋找孤立縮圖..." if dry_run else "🧽 清除孤立縮圖...")
+        thread = threading.Thread(target=self._process_sweep_orphans,
+                                  args=(self._build_config(), list(self.selected_folders), dry_run), daemon=True)
+        self._start_worker(thread)
+    
+    def _process_sweep_orphans(self, config, folders, dry_run):
+        try:
+            result = self.engine.sweep_orphans(folders, config, dry_run=dry_run)
+        except SSHConnectionError as e:
+            self.root.after(0, self._on_task_failed, f"SSH 連線失敗: {e}")
+            return
+        except Exception as e:
+            self.root.after(0, self._on_task_failed, f"清理孤立縮圖失敗: {e}")
+            return
+        self.root.after(0, self._on_complete_sweep, result, dry_run)
+    
+    def _on_complete_sweep(self, result, dry_run):
+        self.is_processing = False
+        self.pending_progress = None
+        found = f"{result['orphans']} 個孤立縮圖（{result['files']} 個檔案），{result['pruned']} 筆過期的處理記錄"
+        self.progress_label.config(text=f"🔍 找到 {found}" if dry_run else f"✨ 已清除 {found}")
+        self._update_ui_state()
+        self._refresh_video_list()
+        if dry_run and not self.engine.stop_flag and (result['orphans'] or result['pruned']):
+            if messagebox.askyesno("確認", f"找到 {found}。\n確定要刪除嗎？"):
+                self._sweep_orphans_clicked(dry_run=False)
 
-        # 儲存清空後的歷史記錄
-        self._save_history()
-        
-        if output_mode == 'synology_ssh':
-            self._disconnect_ssh()
-            
-        self.root.after(0, lambda: self._on_complete_clear(success_count))
+    def _benchmark_decoders_clicked(self):
+        """解碼測試：以目前影片清單中各副檔名的數部影片測試各解碼後端，結果供自動模式使用"""
+        if not self.video_files:
+            return
+        self._enter_clear_state("🧪 開始解碼測試...")
+        thread = threading.Thread(target=self._process_benchmark_decoders,
+                                  args=(self._build_config(), list(self.video_files)), daemon=True)
+        self._start_worker(thread)
+    
+    def _process_benchmark_decoders(self, config, video_files):
+        try:
+            result = self.engine.benchmark_decoders(video_files, config)
+        except Exception as e:
+            self.root.after(0, self._on_task_failed, f"解碼測試失敗: {e}")
+            return
+        self.root.after(0, self._on_complete_benchmark, result)
+    
+    def _on_complete_benchmark(self, result):
+        self.is_processing = False
+        self.pending_progress = None
+        self.progress_label.config(text=f"🧪 解碼測試完成（{len(result)} 種格式）")
+        self._update_ui_state()
+        self._refresh_video_list()
+    
+    def _process_clear_thumbnails(self, config, dry_run=False):
+        try:
+            result = self.engine.clear(self.video_files, config, dry_run=dry_run)
+        except SSHConnectionError as e:
+            self.root.after(0, self._on_task_failed, f"SSH 連線失敗: {e}")
+            return
+        except Exception as e:
+            self.root.after(0, self._on_task_failed, f"清除縮圖失敗: {e}")
+            return
+        self.root.after(0, self._on_complete_clear, result, dry_run)
+    
+    def _on_task_failed(self, message):
+        """背景工作發生例外：記錄並顯示錯誤，恢復介面狀態"""
+        self.is_processing = False
+        self.pending_progress = None
+        self._log(message, 'error')
+        self.progress_label.config(text=f"❌ {message}")
+        if not self.closing:  # 關閉視窗中不再跳出對話框
+            messagebox.showerror("錯誤", message)
+        self._update_ui_state()
+        self._refresh_video_list()
 
-    def _on_complete_clear(self, count):
+    def _on_complete_clear(self, result, dry_run=False):
         self.is_processing = False
-        self.progress_label.config(text=f"✨ 清除完成！共移除 {count} 個項目的縮圖")
-        self._log(f"✨ 清除完成！共移除 {count} 個項目的縮圖", 'success')
+        self.pending_progress = None  # 完成訊息不被尚未顯示的進度覆蓋
+        size = f"{result['files']} 個檔案，{result['bytes'] / 1e6:.1f} MB"
+        if dry_run:
+            message = f"🔍 試算完成！可清除 {result['cleared']} 個項目的縮圖（{size}）"
+        else:
+            message = f"✨ 清除完成！共移除 {result['cleared']} 個項目的縮圖（{size}）"
+        self.progress_label.config(text=message)
+        self._log(message, 'success')
         self._update_ui_state()
-        self._scan_folders()
+        self._refresh_video_list()
 
     def _update_ui_state(self):
         self.add_folder_btn.config(state=tk.NORMAL)
@@ -819,211 +1121,62 @@ class ThumbnailGenerator:
         self.clear_btn.config(state=tk.NORMAL)
         self.stop_btn.pack_forget()
         self.pause_btn.pack_forget()
+        self._refresh_resume_buttons()
 
     
     def _toggle_pause(self):
-        if self.is_paused:
-            self.is_paused = False
-            self.pause_event.set()
+        if self.engine.is_paused:
+            self.engine.resume()
             self.pause_btn.config(text="⏸️ 暫停")
             self._log("繼續處理...", 'success')
         else:
-            self.is_paused = True
-            self.pause_event.clear()
+            self.engine.pause()
             self.pause_btn.config(text="▶️ 繼續")
             self._log("已暫停", 'warning')
     
     def _stop_processing(self):
-        self.stop_flag = True
-        self.pause_event.set()
+        self.engine.stop()
         self._log("正在停止...", 'warning')
     
-    def _process_videos(self, output_mode):
-        total = len(self.video_files)
-        success_count = 0
-        fail_count = 0
-        skip_count = 0
-        
-        if output_mode == 'synology_ssh':
-            try:
-                self._connect_ssh()
-            except Exception as e:
-                self._log(f"SSH 連線失敗: {str(e)}", 'error')
-                self.root.after(0, self._on_complete, 0, 0, 0, total)
-                return
-        
-        for i, video_path in enumerate(self.video_files):
-            if self.stop_flag:
-                self._log(f"已停止，處理了 {i}/{total} 個", 'warning')
-                break
-            
-            self.pause_event.wait()
-            
-            if self.stop_flag:
-                break
-            
-            filename = os.path.basename(video_path)
-            overwrite = self.overwrite_mode.get()
-            
-            try:
-                # 第一個檔案時顯示設定資訊
-                if i == 0:
-                    if output_mode == 'synology_ssh':
-                        self._log(f"📍 路徑對應: {self.drive_letter.get()}: → /{self.share_folder_name.get()}/", 'info')
-                    if overwrite:
-                        self._log("🔄 覆蓋模式：開啟", 'warning')
-                
-                # 檢查縮圖是否已存在（非覆蓋模式下）
-                should_skip = False
-                if not overwrite:
-                    if video_path in self.processed_videos:
-                        if self._thumbnail_exists(video_path, output_mode):
-                            should_skip = True
-                            skip_count += 1
-                            self._log(f"⏭️ {filename} (已處理)", 'info')
-                        else:
-                            # 縮圖不存在了，從歷史記錄移除
-                            self.processed_videos.discard(video_path)
-                    elif self._thumbnail_exists(video_path, output_mode):
-                        should_skip = True
-                        skip_count += 1
-                        self._log(f"⏭️ {filename} (已存在)", 'info')
-                        self.processed_videos.add(video_path)
-                
-                if not should_skip:
-                    # 生成縮圖
-                    self._generate_thumbnail(video_path, output_mode)
-                    success_count += 1
-                    self._log(f"✓ {filename}", 'success')
-                    # 加入歷史記錄
-                    self.processed_videos.add(video_path)
-                    
-            except Exception as e:
-                fail_count += 1
-                self._log(f"✗ {filename}: {str(e)}", 'error')
-            
-            # 進度更新放在 try-except 外面，確保無論如何都會執行
-            progress = ((i + 1) / total) * 100
-            self.root.after(0, self._update_progress, progress, i + 1, total)
-        
-        if output_mode == 'synology_ssh':
-            self._disconnect_ssh()
-            self._log("SSH 連線已關閉", 'info')
-        
-        # 儲存處理記錄
-        self._save_history()
-        self._log(f"已儲存處理記錄（共 {len(self.processed_videos)} 筆）", 'info')
-        
-        # 儲存設定
-        self._save_settings()
-        
-        self.root.after(0, self._on_complete, success_count, fail_count, skip_count, total)
+    def _process_videos(self, config, video_files, folders, resume=False):
+        try:
+            counts = self.engine.process(video_files, folders, config, resume=resume)
+            self._export_stats()
+        except SSHConnectionError:
+            counts = {'success': 0, 'fail': 0, 'skip': 0, 'total': len(video_files)}
+        except Exception as e:
+            self._log(f"處理中斷: {e}", 'error')
+            counts = {'success': 0, 'fail': 0, 'skip': 0, 'total': len(video_files)}
+        self.root.after(0, self._on_complete, counts['success'], counts['fail'], counts['skip'], counts['total'])
     
-    def _thumbnail_exists(self, video_path, output_mode):
-        video_dir = os.path.dirname(video_path)
-        video_filename = os.path.basename(video_path)
-        video_name = os.path.splitext(video_filename)[0]
-        
-        if output_mode == 'synology_ssh':
-            if not self.sftp_client:
-                return False
-            try:
-                nas_video_dir = self._local_to_nas_path(video_dir)
-                thumbnail_path = f"{nas_video_dir}/@eaDir/{video_filename}/SYNOVIDEO_VIDEO_SCREENSHOT.jpg"
-                self.sftp_client.stat(thumbnail_path)
-                return True
-            except:
-                return False
-        else:
-            thumbnail_path = os.path.normpath(os.path.join(video_dir, f"{video_name}.jpg"))
-            return os.path.exists(thumbnail_path)
+    def _export_stats(self):
+        """匯出本次處理的階段耗時統計（JSON 彙總 + CSV 逐檔明細）"""
+        try:
+            for ext in ('json', 'csv'):
+                self.engine.export_stats(os.path.join(self.base_dir, f'run_stats.{ext}'))
+            self._log("📊 已匯出統計：run_stats.json / run_stats.csv", 'info')
+        except Exception as e:
+            self._log(f"匯出統計失敗: {e}", 'warning')
     
-    def _generate_thumbnail(self, video_path, output_mode):
-        cap = cv2.VideoCapture(video_path)
-        
-        if not cap.isOpened():
-            raise Exception("無法開啟影片")
-        
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        duration = total_frames / fps if fps > 0 else 0
-        
-        # 使用設定的截取秒數（空值 = 中間幀）
-        time_str = self.capture_time.get().strip()
-        if time_str:
-            try:
-                target_sec = float(time_str)
-                target_time = target_sec if duration >= target_sec else duration / 2
-            except ValueError:
-                target_time = duration / 2  # 無效值時用中間幀
-        else:
-            target_time = duration / 2  # 空值時用中間幀
-        
-        target_frame = int(target_time * fps)
-        
-        cap.set(cv2.CAP_PROP_POS_FRAMES, target_frame)
-        ret, frame = cap.read()
-        cap.release()
-        
-        if not ret:
-            raise Exception("無法讀取幀")
-        
-        height, width = frame.shape[:2]
-        new_width = 800
-        new_height = int(height * (new_width / width))
-        resized = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LANCZOS4)
-        
-        success, encoded = cv2.imencode('.jpg', resized, [cv2.IMWRITE_JPEG_QUALITY, 90])
-        if not success:
-            raise Exception("圖片編碼失敗")
-        
-        video_dir = os.path.dirname(video_path)
-        video_filename = os.path.basename(video_path)
-        video_name = os.path.splitext(video_filename)[0]
-        
-        if output_mode == 'synology_ssh':
-            nas_video_dir = self._local_to_nas_path(video_dir)
-            eadir_path = f"{nas_video_dir}/@eaDir/{video_filename}"
-            thumbnail_path = f"{eadir_path}/SYNOVIDEO_VIDEO_SCREENSHOT.jpg"
-            
-            # 建立目錄
-            self._sftp_makedirs(eadir_path)
-            
-            # 上傳縮圖 (僅保留 Video Station 版本)
-            try:
-                # 嘗試先刪除避免權限衝突
-                try:
-                    self.sftp_client.remove(thumbnail_path)
-                except:
-                    pass
-                    
-                with self.sftp_client.file(thumbnail_path, 'wb') as f:
-                    f.write(encoded.tobytes())
-                    f.flush()
-                
-                # 驗證寫入
-                stat = self.sftp_client.stat(thumbnail_path)
-                if stat.st_size == 0:
-                    raise Exception("檔案大小為 0")
-            except Exception as e:
-                raise Exception(f"SFTP 寫入失敗 [{thumbnail_path}]: {str(e)}")
-        else:
-            thumbnail_path = os.path.normpath(os.path.join(video_dir, f"{video_name}.jpg"))
-            with open(thumbnail_path, 'wb') as f:
-                f.write(encoded.tobytes())
-
+    def _on_engine_progress(self, done, total):
+        """處理核心的進度回呼（於背景執行緒呼叫，只保留最新一筆，由 _drain_events 顯示）"""
+        self.pending_progress = (done, total)
     
-    def _update_progress(self, progress, current, total):
+    def _update_progress(self, current, total):
+        progress = (current / total) * 100 if total else 100
         self.progress_var.set(progress)
         self.progress_bar['value'] = progress  # 直接設置元件值更穩定
-        status = "⏸️ 已暫停" if self.is_paused else "⏳ 處理中"
+        status = "⏸️ 已暫停" if self.engine.is_paused else "⏳ 處理中"
         self.progress_label.config(text=f"{status}... {current}/{total} ({progress:.0f}%)")
-        self.root.update_idletasks()  # 強制 UI 刷新
     
     def _on_complete(self, success_count, fail_count, skip_count, total):
         self.is_processing = False
+        self.pending_progress = None  # 完成訊息不被尚未顯示的進度覆蓋
+        
+        # 儲存設定
+        self._save_settings()
         
-        if self.stop_flag:
+        if self.engine.stop_flag:
             self.progress_label.config(text=f"⏹️ 已停止 - 成功 {success_count}，跳過 {skip_count}，失敗 {fail_count}")
         else:
             self.progress_label.config(text=f"✅ 完成！成功 {success_count}，跳過 {skip_count}，失敗 {fail_count}")
@@ -1040,11 +1193,13 @@ class ThumbnailGenerator:
         self.pause_btn.pack_forget()
         self.stop_btn.pack_forget()
         self.start_btn.pack(side=tk.LEFT, padx=5)
+        self._refresh_resume_buttons()
         
         self.progress_var.set(0)
 
 
 def main():
+    multiprocessing.freeze_support()  # 打包成 exe 時，解碼子程序由此進入
     root = tk.Tk()
     
     try: